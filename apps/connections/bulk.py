@@ -0,0 +1,244 @@
+"""
+Bulk creation of connections.
+
+Items are checked field by field in Python, then against a few set-based
+lookups (the owned graphs and connection types referenced, and the graph
+memberships of the referenced nodes) instead of NodeConnectionSerializer's
+per-item queries. Valid items are inserted with
+``INSERT ... ON CONFLICT DO NOTHING RETURNING`` against the
+(graph, source_node, target_node, connection_type) unique key, so only the
+rows this request actually inserted come back, even when a concurrent request
+commits the same key meanwhile. Items whose key already exists, in the
+database or earlier in the request, are reported as duplicates. Invalid items
+are reported and skipped; they do not stop the others.
+"""
+from collections import defaultdict
+
+from django.db import connections, transaction
+from django.db.models.constants import OnConflict
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
+
+from apps.graphs.models import CanvasChange, Graph, GraphNode
+from apps.nodes.models import Node
+from .models import ConnectionType, NodeConnection
+from .signals import adjust_connection_counters
+
+MAX_BULK_CONNECTIONS = 100000
+# Request bodies are read past DATA_UPLOAD_MAX_MEMORY_SIZE, up to this size
+MAX_BODY_SIZE = 64 * 1024 * 1024
+# Ids per IN (...) lookup, below SQLite's default limit of 999 parameters
+LOOKUP_BATCH_SIZE = 900
+
+REFERENCE_FIELDS = ('graph', 'source_node', 'target_node', 'connection_type')
+LABEL_MAX_LENGTH = NodeConnection._meta.get_field('label').max_length
+
+
+def _in_batches(values, size=LOOKUP_BATCH_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def read_body(request):
+    """
+    The parsed JSON body of a bulk request. Read from the request stream, as
+    request.data would refuse bodies above DATA_UPLOAD_MAX_MEMORY_SIZE
+    (2.5 MB by default), which 100k connections exceed.
+    """
+    if not request.content_type.startswith('application/json'):
+        return request.data
+    if int(request.META.get('CONTENT_LENGTH') or 0) > MAX_BODY_SIZE:
+        raise ValidationError({'detail': f'The request body may be at most {MAX_BODY_SIZE} bytes.'})
+    if request.stream is None:
+        return None
+    return JSONParser().parse(request.stream)
+
+
+def _get_items(data):
+    """Extracts the list of connections to create, rejecting malformed or oversized requests."""
+    if not isinstance(data, dict) or not isinstance(data.get('create'), list):
+        raise ValidationError({'create': 'Expected a list of connections.'})
+    items = data['create']
+    if not items:
+        raise ValidationError({'create': 'No connections given.'})
+    if len(items) > MAX_BULK_CONNECTIONS:
+        raise ValidationError({'create': f'At most {MAX_BULK_CONNECTIONS} connections per request.'})
+    return items
+
+
+def _parse_item(item):
+    """Field-level validation of one item; returns (values, None) or (None, errors)."""
+    if not isinstance(item, dict):
+        return None, {'non_field_errors': ['Expected an object.']}
+    values, errors = {}, {}
+    for name in REFERENCE_FIELDS:
+        value = item.get(name)
+        if value is None:
+            errors[name] = ['This field is required.']
+        elif not isinstance(value, int) or isinstance(value, bool):
+            errors[name] = ['A valid integer is required.']
+        else:
+            values[name] = value
+    label = item.get('label', '')
+    if not isinstance(label, str):
+        errors['label'] = ['Not a valid string.']
+    elif len(label) > LABEL_MAX_LENGTH:
+        errors['label'] = [f'Ensure this field has no more than {LABEL_MAX_LENGTH} characters.']
+    else:
+        values['label'] = label
+    if not errors and values['source_node'] == values['target_node']:
+        errors['non_field_errors'] = ['A node cannot connect to itself.']
+    return (None, errors) if errors else (values, None)
+
+
+def _load_references(user, items):
+    """
+    Returns ({graph id: project id}, {connection type id: project id},
+    {(graph id, node id)} memberships) for the owned rows the items reference.
+    """
+    graph_ids = {values['graph'] for values, _ in items if values}
+    type_ids = {values['connection_type'] for values, _ in items if values}
+
+    graphs = {}
+    for batch in _in_batches(graph_ids):
+        graphs.update(Graph.objects.filter(project__owner=user, id__in=batch).values_list('id', 'project_id'))
+    connection_types = {}
+    for batch in _in_batches(type_ids):
+        connection_types.update(
+            ConnectionType.objects.filter(project__owner=user, id__in=batch).values_list('id', 'project_id')
+        )
+
+    # A graph only holds nodes of its own project, so membership also settles the project check
+    node_ids = defaultdict(set)
+    for values, _ in items:
+        if values and values['graph'] in graphs:
+            node_ids[values['graph']].update((values['source_node'], values['target_node']))
+    memberships = set()
+    for graph_id, ids in node_ids.items():
+        for batch in _in_batches(ids):
+            memberships.update(
+                GraphNode.objects.filter(graph_id=graph_id, node_id__in=batch).values_list('graph_id', 'node_id')
+            )
+    return graphs, connection_types, memberships
+
+
+def _node_projects(user, node_ids):
+    """{node id: project id} of owned nodes, to explain rejected nodes."""
+    projects = {}
+    for batch in _in_batches(node_ids):
+        projects.update(Node.objects.filter(project__owner=user, id__in=batch).values_list('id', 'project_id'))
+    return projects
+
+
+def _reference_errors(values, graphs, connection_types, memberships, node_projects):
+    """The errors of a field-valid item against the loaded references (empty if none)."""
+    project_id = graphs.get(values['graph'])
+    if project_id is None:
+        return {'graph': ['Graph not found.']}
+    errors = {}
+    type_project_id = connection_types.get(values['connection_type'])
+    if type_project_id is None:
+        errors['connection_type'] = ['Connection type not found.']
+    elif type_project_id != project_id:
+        errors['connection_type'] = ['Connection type must belong to the same project as the graph.']
+    for name, role in (('source_node', 'Source'), ('target_node', 'Target')):
+        node_id = values[name]
+        if (values['graph'], node_id) in memberships:
+            continue
+        if node_id not in node_projects:
+            errors[name] = ['Node not found.']
+        elif node_projects[node_id] != project_id:
+            errors[name] = ['Cannot connect nodes from a different project than the graph.']
+        else:
+            errors[name] = [f'{role} node is not present in this graph.']
+    return errors
+
+
+def create_connections(user, data):
+    """
+    Validates and creates a bulk request of connections for ``user``.
+
+    Returns one result per item, in request order: ``created`` (with the new
+    id), ``duplicate`` or ``error`` (with the errors).
+    """
+    items = [_parse_item(item) for item in _get_items(data)]
+    graphs, connection_types, memberships = _load_references(user, items)
+
+    # Only nodes outside their graph are looked up, to say why they were rejected
+    missing_nodes = {
+        values[name]
+        for values, _ in items if values
+        for name in ('source_node', 'target_node')
+        if values['graph'] in graphs and (values['graph'], values[name]) not in memberships
+    }
+    node_projects = _node_projects(user, missing_nodes)
+
+    results = [None] * len(items)
+    keys = {}
+    for index, (values, errors) in enumerate(items):
+        if values is not None:
+            errors = _reference_errors(values, graphs, connection_types, memberships, node_projects)
+        if errors:
+            results[index] = {'status': 'error', 'errors': errors}
+            continue
+        key = tuple(values[name] for name in REFERENCE_FIELDS)
+        if key in keys:
+            results[index] = {'status': 'duplicate'}
+        else:
+            keys[key] = (index, values['label'])
+
+    created = _insert(keys)
+    for key, (index, _) in keys.items():
+        results[index] = {'status': 'created', 'id': created[key]} if key in created else {'status': 'duplicate'}
+    return results
+
+
+def _insert(keys):
+    """Inserts {(graph, source, target, type): (index, label)}, skipping existing keys; returns {key: new id}."""
+    if not keys:
+        return {}
+    connection = connections[NodeConnection.objects.db]
+    ops = connection.ops
+    quote = ops.quote_name
+    fields = [NodeConnection._meta.get_field(name) for name in (*REFERENCE_FIELDS, 'label', 'created_at')]
+    now = fields[-1].get_db_prep_save(timezone.now(), connection)
+    rows = [(*key, label, now) for key, (_, label) in keys.items()]
+
+    # INSERT OR IGNORE (SQLite), INSERT ... ON CONFLICT DO NOTHING (PostgreSQL), INSERT IGNORE (MySQL)
+    insert = (
+        f"{ops.insert_statement(on_conflict=OnConflict.IGNORE)} {quote(NodeConnection._meta.db_table)} "
+        f"({', '.join(quote(field.column) for field in fields)}) VALUES "
+    )
+    suffix = ops.on_conflict_suffix_sql(fields, OnConflict.IGNORE, None, None)
+    placeholder = f"({', '.join(['%s'] * len(fields))})"
+    returning = ', '.join(quote(column) for column in ('id', *(field.column for field in fields[:4])))
+
+    created = {}
+    with transaction.atomic(using=NodeConnection.objects.db):
+        with connection.cursor() as cursor:
+            if connection.features.can_return_rows_from_bulk_insert:
+                # Skipped rows return nothing: what comes back was inserted by this statement
+                batch_size = max(ops.bulk_batch_size(fields, rows), 1)
+                for start in range(0, len(rows), batch_size):
+                    batch = rows[start:start + batch_size]
+                    cursor.execute(
+                        f"{insert}{', '.join([placeholder] * len(batch))} {suffix} RETURNING {returning}",
+                        [value for row in batch for value in row],
+                    )
+                    created.update((tuple(row[1:]), row[0]) for row in cursor.fetchall())
+            else:
+                for row in rows:
+                    cursor.execute(f'{insert}{placeholder} {suffix}', row)
+                    if cursor.rowcount:
+                        created[row[:4]] = cursor.lastrowid
+
+        # Raw inserts send no signals: adjust the counters and log the changes here
+        by_graph = defaultdict(list)
+        for key, pk in created.items():
+            by_graph[key[0]].append(pk)
+        for graph_id, ids in by_graph.items():
+            adjust_connection_counters(graph_id, len(ids))
+            CanvasChange.record(graph_id, CanvasChange.KIND_CONNECTION, ids)
+    return created
@@ -0,0 +1,74 @@
+import random
+import time
+import tracemalloc
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from apps.connections.models import ConnectionType, NodeConnection
+from apps.connections.serializers import READ_FIELDS, NodeConnectionSerializer
+from apps.graphs.models import Graph, GraphNode
+from apps.nodes.models import Node
+from apps.projects.models import Project
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures queries, time and peak memory of serializing one page of connections of a large graph, '
+        'with the former graph__graph_nodes prefetch and with the lean read queryset. '
+        'The benchmark data is created in a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nodes', type=int, default=100000)
+        parser.add_argument('--connections', type=int, default=20000)
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            page = self.create_graph(options)
+            variants = [
+                ('prefetch', NodeConnection.objects.select_related(
+                    'graph', 'source_node', 'target_node', 'connection_type'
+                ).prefetch_related('graph__graph_nodes')),
+                ('lean', NodeConnection.objects.select_related('source_node', 'target_node').only(*READ_FIELDS)),
+            ]
+            self.stdout.write(f"{'variant':>9} {'queries':>8} {'ms':>9} {'peak MB':>8}")
+            for name, queryset in variants:
+                queries, elapsed, peak = self.measure(queryset.filter(pk__in=page).order_by('-created_at'))
+                self.stdout.write(f"{name:>9} {queries:>8} {elapsed * 1000:>9.1f} {peak / 1e6:>8.1f}")
+            transaction.set_rollback(True)
+
+    def create_graph(self, options):
+        """Creates the benchmark graph; returns the ids of one page of its connections."""
+        rng = random.Random(options['seed'])
+        owner = get_user_model().objects.create_user(username=f'benchmark-{time.time_ns()}', password=None)
+        project = Project.objects.create(name='Connection read benchmark', owner=owner)
+        graph = Graph.objects.create(project=project, name='Benchmark')
+        connection_type = ConnectionType.objects.create(project=project, name='Link')
+
+        nodes = Node.objects.bulk_create(
+            [Node(project=project, title=f'Node {i}') for i in range(options['nodes'])], batch_size=5000
+        )
+        GraphNode.objects.bulk_create([GraphNode(graph=graph, node=node) for node in nodes], batch_size=5000)
+        pairs = {tuple(rng.sample(range(len(nodes)), 2)) for _ in range(options['connections'])}
+        NodeConnection.objects.bulk_create([
+            NodeConnection(graph=graph, source_node=nodes[s], target_node=nodes[t], connection_type=connection_type)
+            for s, t in pairs
+        ], batch_size=5000)
+        return list(graph.connections.values_list('pk', flat=True)[:options['page_size']])
+
+    def measure(self, queryset):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            NodeConnectionSerializer(queryset.all(), many=True).data
+            elapsed = time.perf_counter() - start
+        # Separate run: tracing allocations slows everything down
+        tracemalloc.start()
+        NodeConnectionSerializer(queryset.all(), many=True).data
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return len(queries), elapsed, peak
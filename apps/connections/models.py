@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.exceptions import ValidationError
 
 from apps.nodes.models import Node
@@ -53,6 +53,27 @@ class NodeConnection(models.Model):
     def __str__(self):
         return f"{self.source_node.title} -> {self.target_node.title} ({self.connection_type.name})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the persisted endpoints so a rewired connection is told apart from a relabeled one,
+        # and the graph so the counters follow a connection moved to another one
+        instance.remember_endpoints()
+        instance._loaded_graph_id = instance.__dict__.get('graph_id')
+        return instance
+
+    def remember_endpoints(self):
+        self._loaded_endpoints = (self.__dict__.get('source_node_id'), self.__dict__.get('target_node_id'))
+
+    def endpoints_changed(self):
+        """Whether source or target differ from what was loaded (always true for instances not loaded)."""
+        return getattr(self, '_loaded_endpoints', None) != (self.source_node_id, self.target_node_id)
+
+    def save(self, *args, **kwargs):
+        # post_save receivers adjust the counters: commit them together with the row
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     def clean(self):
         """Prevent invalid connections."""
         if self.source_node == self.target_node:
@@ -67,10 +88,10 @@ class NodeConnection(models.Model):
 
         # Optional: require nodes to be present in the graph
         # (This matches a UI where you must 'add' nodes to a graph before connecting them.)
-        # Optimized: use a single query to check both nodes instead of two separate queries
+        # One indexed lookup of just the two memberships, never the graph's whole node list
         nodes_in_graph = set(
             self.graph.graph_nodes.filter(
-                node__in=[self.source_node, self.target_node]
+                node_id__in=[self.source_node_id, self.target_node_id]
             ).values_list('node_id', flat=True)
         )
 
@@ -2,6 +2,12 @@ from rest_framework import serializers
 
 from .models import NodeConnection
 
+# The columns NodeConnectionSerializer renders, for .only() on read paths (with select_related of both nodes)
+READ_FIELDS = [
+    'graph', 'source_node', 'target_node', 'connection_type', 'label', 'created_at',
+    'source_node__title', 'target_node__title',
+]
+
 
 class NodeConnectionSerializer(serializers.ModelSerializer):
     """Serializer for NodeConnection (graph-scoped)."""
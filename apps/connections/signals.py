@@ -0,0 +1,37 @@
+"""Logs connection changes on the canvas of their graph and keeps connection counters in step."""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.graphs.models import CanvasChange, Graph
+from apps.projects.counters import deleted_with, moved_from
+from apps.projects.models import Project
+from .models import NodeConnection
+
+
+def adjust_connection_counters(graph_id, delta):
+    Graph.objects.filter(pk=graph_id).adjust_counters(connection_count=delta)
+    Project.objects.filter(graphs=graph_id).adjust_counters(connection_count=delta)
+
+
+@receiver(post_save, sender=NodeConnection)
+def log_connection_save(sender, instance, created, update_fields=None, **kwargs):
+    previous_graph_id = moved_from(instance, 'graph', update_fields)
+    if created:
+        adjust_connection_counters(instance.graph_id, 1)
+    elif previous_graph_id is not None:
+        adjust_connection_counters(previous_graph_id, -1)
+        adjust_connection_counters(instance.graph_id, 1)
+        CanvasChange.record(previous_graph_id, CanvasChange.KIND_CONNECTION, [instance.pk], deleted=True)
+    elif instance.endpoints_changed():
+        Graph.objects.filter(pk=instance.graph_id).bump_topology()
+    instance.remember_endpoints()
+    CanvasChange.record(instance.graph_id, CanvasChange.KIND_CONNECTION, [instance.pk])
+
+
+@receiver(post_delete, sender=NodeConnection)
+def log_connection_delete(sender, instance, origin=None, **kwargs):
+    # Counters and change log of a deleted graph are settled by its own receivers (apps/graphs/signals.py)
+    if deleted_with(origin, Graph, Project):
+        return
+    adjust_connection_counters(instance.graph_id, -1)
+    CanvasChange.record(instance.graph_id, CanvasChange.KIND_CONNECTION, [instance.pk], deleted=True)
@@ -127,6 +127,19 @@ class NodeConnectionModelTest(TestCase):
         with self.assertRaises(ValidationError):
             connection.clean()
 
+    def test_connection_changes_bump_graph_version(self):
+        """Test that creating and deleting a connection bumps the graph version"""
+        version = Graph.objects.get(pk=self.graph.pk).version
+        connection = NodeConnection.objects.create(
+            graph=self.graph,
+            source_node=self.node1,
+            target_node=self.node2,
+            connection_type=self.connection_type
+        )
+        self.assertEqual(Graph.objects.get(pk=self.graph.pk).version, version + 1)
+        connection.delete()
+        self.assertEqual(Graph.objects.get(pk=self.graph.pk).version, version + 2)
+
 
 class ConnectionTypeAPITest(APITestCase):
     """Tests for the API of connection types"""
@@ -286,3 +299,93 @@ class NodeConnectionAPITest(APITestCase):
         response = self.client.delete(url)
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertEqual(NodeConnection.objects.count(), 0)
+
+    def test_read_path_does_not_load_graph_nodes(self):
+        """Test that listing and retrieving connections never reads the graph's nodes"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        self.client.force_authenticate(user=self.user)
+        for url in (reverse('nodeconnection-list'), reverse('nodeconnection-detail', kwargs={'pk': self.connection.pk})):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertFalse([query for query in queries if 'graphs_graphnode' in query['sql']])
+            self.assertFalse([query for query in queries if '"content"' in query['sql']])
+
+        response = self.client.get(url)
+        self.assertEqual(response.data['source_node_title'], 'Node 1')
+        self.assertEqual(response.data['target_node_title'], 'Node 2')
+
+    def test_update_connection_checks_graph_membership(self):
+        """Test that moving a connection to a node outside the graph is rejected"""
+        outsider = Node.objects.create(project=self.project, title='Outsider')
+        self.client.force_authenticate(user=self.user)
+        url = reverse('nodeconnection-detail', kwargs={'pk': self.connection.pk})
+        response = self.client.patch(url, {'target_node': outsider.id})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        GraphNode.objects.create(graph=self.graph, node=outsider)
+        response = self.client.patch(url, {'target_node': outsider.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['target_node_title'], 'Outsider')
+
+    def test_bulk_create_connections(self):
+        """Test for creating many connections at once, skipping duplicates and invalid items"""
+        node3 = Node.objects.create(project=self.project, title='Node 3')
+        outsider = Node.objects.create(project=self.project, title='Outsider')
+        GraphNode.objects.create(graph=self.graph, node=node3)
+        other_project = Project.objects.create(name='Other Project', owner=self.user)
+        foreign_node = Node.objects.create(project=other_project, title='Foreign')
+        foreign_type = ConnectionType.objects.create(project=other_project, name='Foreign')
+        self.graph.refresh_from_db()
+        version = self.graph.version
+
+        def edge(source, target, **extra):
+            return {
+                'graph': self.graph.id, 'source_node': source.id, 'target_node': target.id,
+                'connection_type': self.connection_type.id, **extra,
+            }
+
+        self.client.force_authenticate(user=self.user)
+        url = reverse('nodeconnection-bulk')
+        response = self.client.post(url, {'create': [
+            edge(self.node1, node3, label='new'),
+            edge(self.node1, self.node2),
+            edge(self.node1, node3),
+            edge(node3, self.node1),
+            edge(self.node1, outsider),
+            edge(self.node1, foreign_node),
+            edge(self.node1, node3, connection_type=foreign_type.id),
+            edge(self.node1, self.node1),
+            {'graph': self.graph.id},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['created'], response.data['duplicates'], response.data['rejected']), (2, 2, 5))
+        results = response.data['create']
+        self.assertEqual([result['status'] for result in results], [
+            'created', 'duplicate', 'duplicate', 'created', 'error', 'error', 'error', 'error', 'error',
+        ])
+        created = NodeConnection.objects.get(pk=results[0]['id'])
+        self.assertEqual((created.source_node, created.target_node, created.label), (self.node1, node3, 'new'))
+        self.assertEqual(results[4]['errors'], {'target_node': ['Target node is not present in this graph.']})
+        self.assertEqual(
+            results[5]['errors'], {'target_node': ['Cannot connect nodes from a different project than the graph.']}
+        )
+        self.assertIn('connection_type', results[6]['errors'])
+        self.assertIn('non_field_errors', results[7]['errors'])
+        self.assertEqual(set(results[8]['errors']), {'source_node', 'target_node', 'connection_type'})
+
+        # Raw inserts send no signals: counters and the canvas log are kept in step by hand
+        self.graph.refresh_from_db()
+        self.project.refresh_from_db()
+        self.assertEqual(self.graph.connection_count, 3)
+        self.assertEqual(self.project.connection_count, 3)
+        self.assertGreater(self.graph.version, version)
+
+        response = self.client.post(url, {'create': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        other_user = User.objects.create_user(username='otheruser', email='other@example.com', password='testpass123')
+        self.client.force_authenticate(user=other_user)
+        response = self.client.post(url, {'create': [edge(self.node1, node3, label='again')]}, format='json')
+        self.assertEqual(response.data['create'][0]['errors'], {'graph': ['Graph not found.']})
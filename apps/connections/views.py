@@ -1,10 +1,14 @@
+from collections import Counter
+
 from rest_framework import viewsets, filters, status
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db.models.deletion import ProtectedError
 
+from .bulk import create_connections, read_body
 from .models import NodeConnection, ConnectionType
-from .serializers import NodeConnectionSerializer
+from .serializers import READ_FIELDS, NodeConnectionSerializer
 from .connection_types_serializers import ConnectionTypeSerializer
 
 
@@ -48,9 +52,28 @@ class NodeConnectionViewSet(viewsets.ModelViewSet):
         user = getattr(self.request, 'user', None)
         if not user or not user.is_authenticated:
             return NodeConnection.objects.none()
-        return (
-            NodeConnection.objects
-            .filter(graph__project__owner=user)
-            .select_related('graph', 'source_node', 'target_node', 'connection_type')
-            .prefetch_related('graph__graph_nodes')
-        )
+        connections = NodeConnection.objects.filter(graph__project__owner=user)
+        if self.action in ('list', 'retrieve'):
+            # Only the columns NodeConnectionSerializer renders
+            return connections.select_related('source_node', 'target_node').only(*READ_FIELDS)
+        # Writes validate against the related rows; see NodeConnection.clean()
+        return connections.select_related('graph', 'source_node', 'target_node', 'connection_type')
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Creates many connections at once.
+
+        Body: {"create": [{graph, source_node, target_node, connection_type, label?}, ...]}
+        Returns one result per item, in request order (created with its id,
+        duplicate, or error with the reasons), and the count of each. Invalid
+        and duplicate items are skipped; the others are still created.
+        """
+        results = create_connections(request.user, read_body(request))
+        counts = Counter(result['status'] for result in results)
+        return Response({
+            'created': counts['created'],
+            'duplicates': counts['duplicate'],
+            'rejected': counts['error'],
+            'create': results,
+        })
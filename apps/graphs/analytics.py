@@ -0,0 +1,170 @@
+"""
+Graph analytics over an in-memory CSR adjacency of a graph's connections.
+
+``get_adjacency(graph)`` builds (or reuses) a ``GraphAdjacency`` for the
+graph's current topology: the canvas nodes as rows, and every connection stored
+in both directions so traversals can be undirected or follow edge direction.
+Adjacencies are cached under the graph's topology_version, so membership and
+connection changes make the next request rebuild it, while moves, colors and
+titles do not.
+
+All traversals are level-synchronous BFS with the frontier expanded by NumPy
+array operations; connected components use vectorized min-label propagation
+with pointer jumping.
+"""
+import numpy as np
+from django.core.cache import cache
+
+CACHE_TIMEOUT = 60 * 60
+
+
+class GraphAdjacency:
+    """CSR adjacency: the neighbors of row i are indices[indptr[i]:indptr[i + 1]]."""
+
+    def __init__(self, node_ids, edges):
+        """
+        ``node_ids``: ids of the nodes on the canvas.
+        ``edges``: (connection id, source node id, target node id, connection type id) rows.
+        """
+        self.node_ids = np.unique(np.asarray(node_ids, dtype=np.int64))
+        n = len(self.node_ids)
+
+        edges = np.asarray(edges, dtype=np.int64).reshape(-1, 4)
+        source = np.searchsorted(self.node_ids, edges[:, 1])
+        target = np.searchsorted(self.node_ids, edges[:, 2])
+        # Drop connections whose nodes are not on the canvas
+        valid = (
+            (source < n) & (target < n)
+            & (self.node_ids[np.minimum(source, n - 1)] == edges[:, 1])
+            & (self.node_ids[np.minimum(target, n - 1)] == edges[:, 2])
+        ) if n else np.zeros(len(edges), dtype=bool)
+        edges, source, target = edges[valid], source[valid], target[valid]
+
+        # Each connection appears twice: once from its source (forward) and once from its target
+        rows = np.concatenate([source, target])
+        order = np.argsort(rows, kind='stable')
+        self.indices = np.concatenate([target, source])[order]
+        self.edge_ids = np.concatenate([edges[:, 0], edges[:, 0]])[order]
+        self.edge_types = np.concatenate([edges[:, 3], edges[:, 3]])[order]
+        self.forward = np.concatenate([np.ones(len(edges), bool), np.zeros(len(edges), bool)])[order]
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n), out=self.indptr[1:])
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def row_of(self, node_id):
+        """Row index of a node id, or None if the node is not on the canvas."""
+        row = int(np.searchsorted(self.node_ids, node_id))
+        if row < len(self.node_ids) and self.node_ids[row] == node_id:
+            return row
+        return None
+
+    def entry_mask(self, connection_types=None, directed=False):
+        """Boolean mask over adjacency entries allowed for a traversal (None = all)."""
+        mask = None
+        if connection_types:
+            mask = np.isin(self.edge_types, list(connection_types))
+        if directed:
+            mask = self.forward if mask is None else mask & self.forward
+        return mask
+
+    def _expand(self, frontier, mask):
+        """Returns (neighbor rows, source rows, entry positions) for every entry leaving the frontier."""
+        starts = self.indptr[frontier]
+        counts = self.indptr[frontier + 1] - starts
+        total = int(counts.sum())
+        if total == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+        # Positions starts[i] .. starts[i] + counts[i] - 1 for every frontier row, flattened
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        entries = np.repeat(starts, counts) + offsets
+        sources = np.repeat(frontier, counts)
+        if mask is not None:
+            keep = mask[entries]
+            entries, sources = entries[keep], sources[keep]
+        return self.indices[entries], sources, entries
+
+    def bfs(self, source_row, max_depth=None, mask=None, target_row=None):
+        """
+        Breadth-first search from source_row.
+
+        Returns (distance, parent_entry) arrays: distance is -1 for unreached
+        rows; parent_entry is the adjacency entry used to reach each row.
+        Stops early once target_row is reached.
+        """
+        n = len(self)
+        distance = np.full(n, -1, dtype=np.int64)
+        parent_entry = np.full(n, -1, dtype=np.int64)
+        distance[source_row] = 0
+        frontier = np.array([source_row], dtype=np.int64)
+        depth = 0
+        while len(frontier) and (max_depth is None or depth < max_depth):
+            if target_row is not None and distance[target_row] >= 0:
+                break
+            neighbors, _, entries = self._expand(frontier, mask)
+            new = distance[neighbors] < 0
+            neighbors, entries = neighbors[new], entries[new]
+            # Keep the first entry reaching each new row
+            neighbors, first = np.unique(neighbors, return_index=True)
+            depth += 1
+            distance[neighbors] = depth
+            parent_entry[neighbors] = entries[first]
+            frontier = neighbors
+        return distance, parent_entry
+
+    def entry_source(self, entry):
+        """Row the given adjacency entry leaves from."""
+        return int(np.searchsorted(self.indptr, entry, side='right') - 1)
+
+    def shortest_path(self, source_row, target_row, mask=None):
+        """Returns (node ids, connection ids) along a shortest path, or None if unreachable."""
+        distance, parent_entry = self.bfs(source_row, mask=mask, target_row=target_row)
+        if distance[target_row] < 0:
+            return None
+        rows, connections = [target_row], []
+        while rows[-1] != source_row:
+            entry = parent_entry[rows[-1]]
+            connections.append(int(self.edge_ids[entry]))
+            rows.append(self.entry_source(entry))
+        rows.reverse()
+        connections.reverse()
+        return [int(self.node_ids[row]) for row in rows], connections
+
+    def components(self, mask=None):
+        """Returns a component label per row (the smallest row index in the component)."""
+        n = len(self)
+        labels = np.arange(n)
+        rows = np.repeat(np.arange(n), np.diff(self.indptr))
+        cols = self.indices
+        if mask is not None:
+            rows, cols = rows[mask], cols[mask]
+        while True:
+            previous = labels.copy()
+            np.minimum.at(labels, rows, labels[cols])
+            np.minimum.at(labels, cols, labels[rows])
+            # Pointer jumping: follow labels to their own label until stable
+            while True:
+                jumped = labels[labels]
+                if np.array_equal(jumped, labels):
+                    break
+                labels = jumped
+            if np.array_equal(labels, previous):
+                return labels
+
+
+def build_adjacency(graph):
+    node_ids = graph.graph_nodes.values_list('node_id', flat=True)
+    edges = graph.connections.values_list('id', 'source_node_id', 'target_node_id', 'connection_type_id')
+    return GraphAdjacency(list(node_ids), list(edges))
+
+
+def get_adjacency(graph):
+    """Returns the adjacency for the graph's current topology, building it on a cache miss."""
+    key = f'graph-adjacency:{graph.pk}:{graph.topology_version}'
+    adjacency = cache.get(key)
+    if adjacency is None:
+        adjacency = build_adjacency(graph)
+        cache.set(key, adjacency, CACHE_TIMEOUT)
+    return adjacency
@@ -1,7 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class GraphsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.graphs'
 
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .spatial import install_spatial_triggers
+
+        post_migrate.connect(install_spatial_triggers, sender=self)
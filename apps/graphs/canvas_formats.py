@@ -0,0 +1,159 @@
+"""
+Compact representations of the canvas payload.
+
+Both are opt-in on ``GET /api/graphs/{id}/canvas/`` through content
+negotiation (``Accept`` header or ``?format=``):
+
+- ``columnar`` (application/vnd.forgelink.canvas+json): parallel arrays, one
+  per field, with titles, colors, node types and labels dictionary-encoded.
+  Connections point at node rows by index instead of repeating node titles.
+- ``packed`` (application/vnd.forgelink.canvas+octet-stream): the same columns
+  as little-endian typed arrays, ready for Float32Array/Uint32Array views.
+
+Packed layout::
+
+    b"FLC1" | uint32 header length | UTF-8 JSON header | padding to 8 bytes | arrays
+
+The JSON header holds the graph, the dictionaries and an ``arrays`` list of
+``[name, dtype, length]`` in the order the arrays follow; every array starts on
+an 8-byte boundary.
+"""
+import json
+import struct
+import sys
+from array import array
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+PACKED_MAGIC = b'FLC1'
+
+# dtype name -> array typecode
+DTYPES = {
+    'float32': 'f',
+    'float64': 'd',
+    'int32': 'i',
+    'uint32': 'I',
+}
+
+
+def _dictionary_encode(values):
+    """Returns (distinct values in first-seen order, per-row codes)."""
+    index = {}
+    codes = [index.setdefault(value, len(index)) for value in values]
+    return list(index), codes
+
+
+def build_columnar_canvas(graph_nodes, connections):
+    """
+    Builds the columnar canvas from GraphNode and NodeConnection querysets,
+    straight from value queries (no model instances, no serializers).
+    """
+    rows = list(
+        graph_nodes.order_by('id').values_list(
+            'id', 'node_id', 'position_x', 'position_y', 'color', 'node__title', 'node__node_type'
+        )
+    )
+    ids, node_ids, xs, ys, colors, titles, node_types = (
+        (list(column) for column in zip(*rows)) if rows else ([],) * 7
+    )
+    titles, title_codes = _dictionary_encode(titles)
+    colors, color_codes = _dictionary_encode(colors)
+    node_types, type_codes = _dictionary_encode(node_types)
+
+    row_by_node = {node_id: row for row, node_id in enumerate(node_ids)}
+    edges = list(
+        connections.order_by('id').values_list(
+            'id', 'source_node_id', 'target_node_id', 'connection_type_id', 'label'
+        )
+    )
+    edge_ids, sources, targets, connection_types, labels = (
+        (list(column) for column in zip(*edges)) if edges else ([],) * 5
+    )
+    labels, label_codes = _dictionary_encode(labels)
+
+    return {
+        'titles': titles,
+        'colors': colors,
+        'node_types': node_types,
+        'labels': labels,
+        'nodes': {
+            'id': ids,
+            'node': node_ids,
+            'x': xs,
+            'y': ys,
+            'title': title_codes,
+            'color': color_codes,
+            'node_type': type_codes,
+        },
+        'connections': {
+            'id': edge_ids,
+            # Row index into the node columns (-1 if the node is not on the canvas)
+            'source': [row_by_node.get(node_id, -1) for node_id in sources],
+            'target': [row_by_node.get(node_id, -1) for node_id in targets],
+            'connection_type': connection_types,
+            'label': label_codes,
+        },
+    }
+
+
+def _id_dtype(values):
+    return 'uint32' if not values or max(values) < 2 ** 32 else 'float64'
+
+
+def pack_canvas(data):
+    """Encodes a columnar canvas (as built above, plus 'graph') into the packed binary layout."""
+    nodes = data['nodes']
+    connections = data['connections']
+    columns = [
+        ('nodes.id', _id_dtype(nodes['id']), nodes['id']),
+        ('nodes.node', _id_dtype(nodes['node']), nodes['node']),
+        ('nodes.x', 'float32', nodes['x']),
+        ('nodes.y', 'float32', nodes['y']),
+        ('nodes.title', 'uint32', nodes['title']),
+        ('nodes.color', 'uint32', nodes['color']),
+        ('nodes.node_type', 'uint32', nodes['node_type']),
+        ('connections.id', _id_dtype(connections['id']), connections['id']),
+        ('connections.source', 'int32', connections['source']),
+        ('connections.target', 'int32', connections['target']),
+        ('connections.connection_type', _id_dtype(connections['connection_type']), connections['connection_type']),
+        ('connections.label', 'uint32', connections['label']),
+    ]
+
+    header = {key: value for key, value in data.items() if key not in ('nodes', 'connections')}
+    header['arrays'] = [[name, dtype, len(values)] for name, dtype, values in columns]
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+
+    chunks = [PACKED_MAGIC, struct.pack('<I', len(header_bytes)), header_bytes]
+    offset = len(PACKED_MAGIC) + 4 + len(header_bytes)
+    for name, dtype, values in columns:
+        padding = -offset % 8
+        chunks.append(b'\0' * padding)
+        packed = array(DTYPES[dtype], values)
+        if sys.byteorder == 'big':
+            packed.byteswap()
+        chunk = packed.tobytes()
+        chunks.append(chunk)
+        offset += padding + len(chunk)
+    return b''.join(chunks)
+
+
+class ColumnarCanvasRenderer(JSONRenderer):
+    media_type = 'application/vnd.forgelink.canvas+json'
+    format = 'columnar'
+
+
+class PackedCanvasRenderer(BaseRenderer):
+    media_type = 'application/vnd.forgelink.canvas+octet-stream'
+    format = 'packed'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        response = (renderer_context or {}).get('response')
+        if response is not None and response.exception:
+            # Errors are still sent as JSON
+            response['Content-Type'] = 'application/json'
+            return json.dumps(data).encode('utf-8')
+        return pack_canvas(data)
@@ -0,0 +1,155 @@
+"""
+The default JSON canvas payload, built by the database.
+
+``GET /api/graphs/{id}/canvas/`` normally instantiates every GraphNode and
+NodeConnection and runs them through their serializers, which dominates the
+response time of large graphs. ``build_canvas_json()`` instead has the
+database render each row with ``json_object()`` and aggregate the rows into
+one array (``json_group_array`` on SQLite, ``json_agg`` on PostgreSQL); the
+resulting text goes into the response as is.
+
+The rows carry exactly the fields of GraphNodeSerializer and
+NodeConnectionSerializer, with datetimes formatted like DRF's DateTimeField
+(ISO 8601 in UTC with a ``Z`` suffix, microseconds only when non-zero). The
+parity test in tests.py keeps the two in step. Other databases, and a
+non-UTC ``TIME_ZONE`` (DRF would render local times), fall back to the
+serializers.
+"""
+import json
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F, Func, TextField
+from django.db.models.functions import JSONObject
+from rest_framework.response import Response
+
+# Name of the per-row JSON column in the inner query
+ROW_COLUMN = 'canvas_row'
+
+# Per database vendor: how to render a UTC datetime column like DRF, and how to
+# aggregate the row objects into one JSON array (text). Vendors not listed here
+# use the serializers (supports_canvas_json).
+ISO_DATETIME_TEMPLATES = {
+    # Stored as "YYYY-MM-DD HH:MM:SS[.ffffff]" in UTC
+    'sqlite': "REPLACE(%(expressions)s, ' ', 'T') || 'Z'",
+    'postgresql': (
+        "TO_CHAR(%(expressions)s AT TIME ZONE 'UTC', 'YYYY-MM-DD\"T\"HH24:MI:SS') "
+        "|| CASE WHEN DATE_TRUNC('second', %(expressions)s) = %(expressions)s THEN '' "
+        "ELSE TO_CHAR(%(expressions)s AT TIME ZONE 'UTC', '.US') END || 'Z'"
+    ),
+}
+AGGREGATES = {
+    # json() re-marks the text as JSON, which the subquery boundary forgets
+    'sqlite': f"COALESCE(json_group_array(json({ROW_COLUMN})), '[]')",
+    # An ordered subquery feeds json_agg in order
+    'postgresql': f"COALESCE(json_agg({ROW_COLUMN}), '[]'::json)::text",
+}
+
+
+class ISODateTime(Func):
+    """
+    A datetime column as DRF renders it: 2024-01-31T12:00:00.123456Z (UTC).
+    Only compiled when ``supports_canvas_json()`` holds.
+    """
+
+    output_field = TextField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        extra_context['template'] = ISO_DATETIME_TEMPLATES[connection.vendor]
+        return super().as_sql(compiler, connection, **extra_context)
+
+
+class JSONFloat(Func):
+    """A float column that survives JSON rendering exactly (like Python's float repr, up to formatting)."""
+
+    template = '%(expressions)s'
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # SQLite's JSON functions print REALs with 15 significant digits, which does not round-trip
+        return super().as_sql(compiler, connection, template="json(printf('%%%%!.17g', %(expressions)s))")
+
+
+GRAPH_NODE_FIELDS = {
+    'id': F('id'),
+    'graph': F('graph_id'),
+    'node': F('node_id'),
+    'position_x': JSONFloat('position_x'),
+    'position_y': JSONFloat('position_y'),
+    'color': F('color'),
+    'created_at': ISODateTime('created_at'),
+    'updated_at': ISODateTime('updated_at'),
+    'node_title': F('node__title'),
+    'node_type': F('node__node_type'),
+}
+
+CONNECTION_FIELDS = {
+    'id': F('id'),
+    'graph': F('graph_id'),
+    'source_node': F('source_node_id'),
+    'target_node': F('target_node_id'),
+    'connection_type': F('connection_type_id'),
+    'label': F('label'),
+    'created_at': ISODateTime('created_at'),
+    'source_node_title': F('source_node__title'),
+    'target_node_title': F('target_node__title'),
+}
+
+
+def supports_canvas_json(using='default'):
+    """Whether the canvas can be built by the database behind ``using`` (see the module docstring)."""
+    vendor = connections[using].vendor
+    return vendor in ISO_DATETIME_TEMPLATES and vendor in AGGREGATES and settings.TIME_ZONE == 'UTC'
+
+
+def json_array(queryset, fields):
+    """Runs ``queryset`` as one JSON array (text) of objects with ``fields``, in the queryset's order."""
+    rows = queryset.annotate(**{ROW_COLUMN: JSONObject(**fields)}).values_list(ROW_COLUMN)
+    sql, params = rows.query.sql_with_params()
+    connection = connections[queryset.db]
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT {AGGREGATES[connection.vendor]} FROM ({sql}) AS canvas_rows', params)
+        return cursor.fetchone()[0]
+
+
+def build_canvas_json(graph_json, graph_nodes, node_connections, extra=None):
+    """
+    The canvas response body (bytes), given the rendered graph and the GraphNode
+    and NodeConnection querysets the serializer path would have serialized.
+    ``extra`` maps further top-level keys to rendered JSON (bytes).
+    """
+    nodes = json_array(graph_nodes, GRAPH_NODE_FIELDS)
+    edges = json_array(node_connections, CONNECTION_FIELDS)
+    parts = [
+        b'{"graph":', graph_json,
+        b',"nodes":', nodes.encode('utf-8'),
+        b',"connections":', edges.encode('utf-8'),
+    ]
+    for key, value in (extra or {}).items():
+        parts += [b',', json.dumps(key).encode('utf-8'), b':', value]
+    parts.append(b'}')
+    return b''.join(parts)
+
+
+class PrerenderedJSONResponse(Response):
+    """
+    A Response whose JSON body is already rendered: it is sent as is, and
+    ``data`` is only parsed back from it if something asks for it.
+    """
+
+    def __init__(self, content, **kwargs):
+        self.content_bytes = content
+        super().__init__(**kwargs)
+
+    @property
+    def data(self):
+        return json.loads(self.content_bytes)
+
+    @data.setter
+    def data(self, value):
+        # Response.__init__ assigns data=None; the body is the source of truth
+        pass
+
+    @property
+    def rendered_content(self):
+        self['Content-Type'] = 'application/json'
+        return self.content_bytes
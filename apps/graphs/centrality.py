@@ -0,0 +1,151 @@
+"""
+Centrality scores per GraphNode, stored in ``GraphNodeCentrality``.
+
+Scores are computed over the graph's CSR adjacency (analytics.py):
+
+- degree: number of connections touching the node (either direction)
+- pagerank: PageRank along connection direction, by power iteration over the
+  edge list (dangling nodes spread their rank uniformly)
+- betweenness: Brandes' algorithm from a random sample of source nodes,
+  scaled up to estimate the full value and normalized to [0, 1]; exact when
+  the graph has at most ``BETWEENNESS_SAMPLES`` nodes. Direction is ignored.
+
+``Graph.centrality_version`` records the topology version the stored scores
+were computed at. Scores are stale once it lags behind
+``Graph.topology_version``, which only moves when memberships or connections
+change (moves, colors and renames leave the scores alone). Web requests never
+recompute: bumping the topology version is what marks a graph stale, and reads
+serve the stored scores, flagged as stale. ``python manage.py compute_centrality``
+refreshes the stale graphs, once or as a worker (``--watch``). Several sweepers
+may run: each stores a graph's scores only if no other one stored them since
+it started (``refresh_centrality``).
+"""
+import numpy as np
+from django.db import transaction
+from django.db.models import F
+
+from .analytics import build_adjacency
+from .models import Graph, GraphNode, GraphNodeCentrality
+
+PAGERANK_DAMPING = 0.85
+PAGERANK_TOLERANCE = 1e-8
+PAGERANK_MAX_ITERATIONS = 100
+BETWEENNESS_SAMPLES = 64
+
+
+def degree_centrality(adjacency):
+    return np.diff(adjacency.indptr)
+
+
+def pagerank(adjacency, damping=PAGERANK_DAMPING):
+    n = len(adjacency)
+    if n == 0:
+        return np.zeros(0)
+    rows = np.repeat(np.arange(n), np.diff(adjacency.indptr))
+    source, target = rows[adjacency.forward], adjacency.indices[adjacency.forward]
+    out_degree = np.bincount(source, minlength=n).astype(np.float64)
+    dangling = out_degree == 0
+    # Each edge carries damping * rank[source] / out_degree[source]
+    edge_share = damping / out_degree[source]
+
+    rank = np.full(n, 1.0 / n)
+    for _ in range(PAGERANK_MAX_ITERATIONS):
+        spread = ((1 - damping) + damping * rank[dangling].sum()) / n
+        updated = np.bincount(target, weights=rank[source] * edge_share, minlength=n) + spread
+        converged = np.abs(updated - rank).sum() < PAGERANK_TOLERANCE
+        rank = updated
+        if converged:
+            break
+    return rank
+
+
+def betweenness_centrality(adjacency, samples=BETWEENNESS_SAMPLES, seed=0):
+    n = len(adjacency)
+    scores = np.zeros(n)
+    if n < 3:
+        return scores
+    rng = np.random.default_rng(seed)
+    sources = np.arange(n) if n <= samples else rng.choice(n, size=samples, replace=False)
+
+    for source in sources:
+        distance = np.full(n, -1, dtype=np.int64)
+        paths = np.zeros(n)
+        distance[source], paths[source] = 0, 1.0
+        frontier = np.array([source])
+        dag_levels = []
+        depth = 0
+        # Forward: BFS recording the shortest-path DAG edges level by level, counting paths
+        while len(frontier):
+            neighbors, parents, _ = adjacency._expand(frontier, None)
+            new = np.unique(neighbors[distance[neighbors] < 0])
+            distance[new] = depth + 1
+            on_dag = distance[neighbors] == depth + 1
+            parents, children = parents[on_dag], neighbors[on_dag]
+            np.add.at(paths, children, paths[parents])
+            dag_levels.append((parents, children))
+            frontier = new
+            depth += 1
+        # Backward: accumulate dependencies from the deepest level up
+        dependency = np.zeros(n)
+        for parents, children in reversed(dag_levels):
+            np.add.at(dependency, parents, paths[parents] / paths[children] * (1 + dependency[children]))
+        dependency[source] = 0
+        scores += dependency
+
+    # Scale the sample up to all sources; each undirected pair was counted from both ends
+    scores *= n / len(sources) / 2
+    return scores / ((n - 1) * (n - 2) / 2)
+
+
+def compute_centrality(adjacency):
+    """Returns (degree, pagerank, betweenness) arrays, one entry per adjacency row."""
+    return degree_centrality(adjacency), pagerank(adjacency), betweenness_centrality(adjacency)
+
+
+def refresh_centrality(graph):
+    """
+    Recomputes and stores the centrality of every node of ``graph`` at its current
+    topology version. Returns False, storing nothing, if another refresh stored
+    the graph's scores while this one was computing.
+    """
+    versions = Graph.objects.filter(pk=graph.pk).values_list('topology_version', 'centrality_version').first()
+    if versions is None:
+        return False
+    version, stored_version = versions
+    adjacency = build_adjacency(graph)
+    degree, rank, betweenness = compute_centrality(adjacency)
+    graph_node_ids = dict(GraphNode.objects.filter(graph_id=graph.pk).values_list('node_id', 'id'))
+
+    rows = [
+        GraphNodeCentrality(
+            graph_node_id=graph_node_ids[node_id],
+            degree=int(degree[row]),
+            pagerank=float(rank[row]),
+            betweenness=float(betweenness[row]),
+        )
+        for row, node_id in enumerate(adjacency.node_ids.tolist())
+        if node_id in graph_node_ids
+    ]
+    with transaction.atomic():
+        # Claim the graph first: the UPDATE locks its row until the scores are stored,
+        # and finds nothing to update if another refresh got there in the meantime.
+        # Plain UPDATE: no save(), so no version bump. If the topology changed while
+        # computing, the stored version stays behind and the next refresh recomputes.
+        claimed = Graph.objects.filter(pk=graph.pk, centrality_version=stored_version).update(
+            centrality_version=version
+        )
+        if not claimed:
+            return False
+        GraphNodeCentrality.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['graph_node'],
+            update_fields=['degree', 'pagerank', 'betweenness'],
+            batch_size=500,
+        )
+    return True
+
+
+def stale_graphs(graphs):
+    """The graphs of the queryset whose stored centrality is older than their topology."""
+    return graphs.exclude(centrality_version=F('topology_version'))
@@ -0,0 +1,128 @@
+"""
+Level-of-detail canvas: graph nodes clustered into grid cells.
+
+``build_clusters(graph, zoom)`` lays a quadtree grid of 2**zoom x 2**zoom square
+cells over the bounding square of the graph's node positions, so a cell at
+zoom z splits into four cells at zoom z + 1. Per non-empty cell it returns the
+node count, the centroid and the most frequent ``node_type``; per pair of
+cells the number of connections between them (in either direction), the
+``MAX_EDGES`` heaviest pairs only. Connections inside a cell are not reported.
+
+Cells and weights are aggregated by the database (GROUP BY over the cell
+indices); the result only depends on the graph version and the zoom level, and
+is cached under both.
+"""
+from django.core.cache import cache
+from django.db.models import Count, F, FilteredRelation, Func, IntegerField, Max, Min, Q, Sum, Value
+from django.db.models.functions import Least
+
+from apps.connections.models import NodeConnection
+
+CACHE_TIMEOUT = 60 * 60
+MAX_ZOOM = 12
+# Heaviest cluster pairs returned; the others are only counted
+MAX_EDGES = 2000
+
+
+class CellIndex(Func):
+    """floor() of a non-negative expression, as an integer."""
+
+    output_field = IntegerField()
+    template = 'CAST(FLOOR(%(expressions)s) AS INTEGER)'
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # CAST truncates, which is floor() for non-negative values, without a Python FLOOR()
+        return super().as_sql(compiler, connection, template='CAST(%(expressions)s AS INTEGER)')
+
+
+def parse_zoom(value):
+    """Parses a zoom level (0 to MAX_ZOOM); raises ValueError."""
+    zoom = int(value)
+    if not 0 <= zoom <= MAX_ZOOM:
+        raise ValueError(value)
+    return zoom
+
+
+def _cell(field, origin, size, cells):
+    return Least(CellIndex((F(field) - Value(origin)) / Value(size)), Value(cells - 1))
+
+
+def compute_clusters(graph, zoom):
+    """The clusters and inter-cluster edges of the graph at a zoom level; see the module docstring."""
+    graph_nodes = graph.graph_nodes.all()
+    bounds = graph_nodes.aggregate(
+        x0=Min('position_x'), y0=Min('position_y'), x1=Max('position_x'), y1=Max('position_y')
+    )
+    if bounds['x0'] is None:
+        return {'zoom': zoom, 'bounds': None, 'cell_size': None, 'clusters': [], 'edges': [], 'omitted_edges': 0}
+
+    x0, y0 = bounds['x0'], bounds['y0']
+    cells = 2 ** zoom
+    size = max(bounds['x1'] - x0, bounds['y1'] - y0) / cells or 1.0
+
+    # One row per (cell, node type): counts and position sums add up per cell
+    clusters = {}
+    rows = (
+        graph_nodes.annotate(cell_x=_cell('position_x', x0, size, cells), cell_y=_cell('position_y', y0, size, cells))
+        .values('cell_x', 'cell_y', 'node__node_type')
+        .annotate(count=Count('id'), sum_x=Sum('position_x'), sum_y=Sum('position_y'))
+        .order_by()
+    )
+    for row in rows:
+        cell_id = row['cell_y'] * cells + row['cell_x']
+        cluster = clusters.setdefault(cell_id, {
+            'id': cell_id, 'cell': [row['cell_x'], row['cell_y']], 'count': 0, 'x': 0.0, 'y': 0.0, 'types': {},
+        })
+        cluster['count'] += row['count']
+        cluster['x'] += row['sum_x']
+        cluster['y'] += row['sum_y']
+        cluster['types'][row['node__node_type']] = row['count']
+    for cluster in clusters.values():
+        cluster['x'] /= cluster['count']
+        cluster['y'] /= cluster['count']
+        types = cluster.pop('types')
+        cluster['node_type'] = min(types, key=lambda node_type: (-types[node_type], node_type))
+
+    # The endpoints' positions come from their graph nodes in the same graph
+    connections = NodeConnection.objects.filter(graph=graph).annotate(
+        source_layout=FilteredRelation('source_node__graph_nodes', condition=Q(source_node__graph_nodes__graph=F('graph'))),
+        target_layout=FilteredRelation('target_node__graph_nodes', condition=Q(target_node__graph_nodes__graph=F('graph'))),
+    )
+    rows = (
+        connections.annotate(
+            source_cell=_cell('source_layout__position_y', y0, size, cells) * cells
+            + _cell('source_layout__position_x', x0, size, cells),
+            target_cell=_cell('target_layout__position_y', y0, size, cells) * cells
+            + _cell('target_layout__position_x', x0, size, cells),
+        )
+        .filter(source_cell__isnull=False, target_cell__isnull=False)
+        .exclude(source_cell=F('target_cell'))
+        .values('source_cell', 'target_cell')
+        .annotate(weight=Count('id'))
+        .order_by()
+    )
+    edges = {}
+    for row in rows:
+        key = tuple(sorted((row['source_cell'], row['target_cell'])))
+        edges[key] = edges.get(key, 0) + row['weight']
+
+    kept = sorted(edges.items(), key=lambda item: (-item[1], item[0]))[:MAX_EDGES]
+
+    return {
+        'zoom': zoom,
+        'bounds': [x0, y0, bounds['x1'], bounds['y1']],
+        'cell_size': size,
+        'clusters': sorted(clusters.values(), key=lambda cluster: cluster['id']),
+        'edges': [{'source': source, 'target': target, 'weight': weight} for (source, target), weight in sorted(kept)],
+        'omitted_edges': len(edges) - len(kept),
+    }
+
+
+def build_clusters(graph, zoom):
+    """Returns the clusters for the graph's current version, computing them on a cache miss."""
+    key = f'graph-clusters:{graph.pk}:{graph.version}:{zoom}'
+    clusters = cache.get(key)
+    if clusters is None:
+        clusters = compute_clusters(graph, zoom)
+        cache.set(key, clusters, CACHE_TIMEOUT)
+    return clusters
@@ -0,0 +1,156 @@
+"""
+Hierarchy-aware canvas: collapsed parent nodes drawn as single super-nodes.
+
+The client names the nodes to collapse (``?collapse=<node id>,...`` on the
+canvas). Every graph node inside a collapsed node, at any depth, is folded into
+its outermost collapsed ancestor. Connections touching a folded node are rolled
+up per (source, target, connection type) with a count. Connections inside a
+single super-node become its ``internal_connections``.
+
+The grouping is computed in SQL from the materialized ``Node.path``, and the
+database aggregates on it (GROUP BY / COUNT / AVG). A node is inside a
+collapsed node exactly when its path starts with the collapsed node's
+descendant path. Rather than one LIKE per collapsed node and row, the
+descendant paths are grouped by length: one CASE branch per length compares
+that prefix of the path against the IN-list of paths of that length, and
+reads the group id back from the prefix's last component.
+"""
+from collections import defaultdict
+
+from django.db.models import Avg, BigIntegerField, Case, Count, F, Q, When
+from django.db.models.functions import Cast, Coalesce, Substr
+from django.db.models.lookups import In
+
+from apps.nodes.models import Node
+
+MAX_COLLAPSED = 500
+
+
+def parse_collapse(value):
+    """Parses "1,2,3" into a list of node ids; raises ValueError."""
+    ids = [int(part) for part in value.split(',') if part.strip()]
+    if not ids or len(ids) > MAX_COLLAPSED or min(ids) < 1:
+        raise ValueError(value)
+    return ids
+
+
+class CollapsedCanvas:
+    """The collapsed view of one graph; see the module docstring."""
+
+    def __init__(self, graph, node_ids):
+        nodes = list(
+            Node.objects.filter(project_id=graph.project_id, pk__in=node_ids)
+            .order_by('depth', 'id')
+            .values('id', 'path', 'title', 'node_type')
+        )
+        missing = set(node_ids) - {node['id'] for node in nodes}
+        if missing:
+            raise ValueError(sorted(missing))
+        # A collapsed node inside another one is folded into the outer one
+        ids = {node['id'] for node in nodes}
+        self.collapsed = [
+            node for node in nodes
+            if not any(int(part) in ids for part in node['path'].split(Node.PATH_SEPARATOR) if part)
+        ]
+        self.graph = graph
+
+        # Descendant paths by (length, digits of the collapsed id that ends them)
+        self.prefixes = defaultdict(list)
+        for node in self.collapsed:
+            prefix = f"{node['path']}{node['id']}{Node.PATH_SEPARATOR}"
+            self.prefixes[len(prefix), len(str(node['id']))].append(prefix)
+
+    def group_of(self, node_lookup):
+        """
+        SQL expression: the id of the collapsed node that is, or contains, the
+        node at ``node_lookup`` (e.g. 'node', 'source_node'); NULL if none.
+        """
+        path = F(f'{node_lookup}__path')
+        whens = [When(Q(**{f'{node_lookup}_id__in': [node['id'] for node in self.collapsed]}), then=F(f'{node_lookup}_id'))]
+        for (length, digits), prefixes in sorted(self.prefixes.items()):
+            whens.append(When(
+                In(Substr(path, 1, length), prefixes),
+                then=Cast(Substr(path, length - digits, digits), BigIntegerField()),
+            ))
+        return Case(*whens, default=None, output_field=BigIntegerField())
+
+    def visible_graph_nodes(self, graph_nodes):
+        """The graph nodes that stay on the canvas as themselves."""
+        return graph_nodes.alias(group=self.group_of('node')).filter(group__isnull=True)
+
+    def direct_connections(self, connections):
+        """The connections between two visible graph nodes."""
+        return connections.alias(
+            source_group=self.group_of('source_node'), target_group=self.group_of('target_node')
+        ).filter(source_group__isnull=True, target_group__isnull=True)
+
+    def super_nodes(self):
+        """
+        One entry per collapsed node with graph nodes inside it. Placed on its
+        own graph node if it has one, else at the centroid of its members.
+        """
+        graph_nodes = self.graph.graph_nodes.all()
+        groups = {
+            row['group']: row
+            for row in graph_nodes.annotate(group=self.group_of('node'))
+            .filter(group__isnull=False)
+            .values('group')
+            .annotate(member_count=Count('id'), position_x=Avg('position_x'), position_y=Avg('position_y'))
+            .order_by()
+        }
+        own_positions = {
+            node_id: (x, y)
+            for node_id, x, y in graph_nodes.filter(node_id__in=groups).values_list('node_id', 'position_x', 'position_y')
+        }
+        internal = dict(
+            self.graph.connections.annotate(
+                source_group=self.group_of('source_node'), target_group=self.group_of('target_node')
+            )
+            .filter(source_group__isnull=False, source_group=F('target_group'))
+            .values_list('source_group')
+            .annotate(count=Count('id'))
+            .order_by()
+        )
+
+        super_nodes = []
+        for node in self.collapsed:
+            group = groups.get(node['id'])
+            if group is None:
+                continue
+            x, y = own_positions.get(node['id'], (group['position_x'], group['position_y']))
+            super_nodes.append({
+                'node': node['id'],
+                'title': node['title'],
+                'node_type': node['node_type'],
+                'member_count': group['member_count'],
+                'internal_connections': internal.get(node['id'], 0),
+                'position_x': x,
+                'position_y': y,
+            })
+        return super_nodes
+
+    def aggregated_connections(self):
+        """Connections touching a super-node, counted per (source, target, connection type)."""
+        rows = (
+            self.graph.connections.alias(
+                source_group=self.group_of('source_node'), target_group=self.group_of('target_node')
+            )
+            .filter(Q(source_group__isnull=False) | Q(target_group__isnull=False))
+            .annotate(
+                source=Coalesce('source_group', 'source_node_id', output_field=BigIntegerField()),
+                target=Coalesce('target_group', 'target_node_id', output_field=BigIntegerField()),
+            )
+            .exclude(source=F('target'))
+            .values('source', 'target', 'connection_type')
+            .annotate(count=Count('id'))
+            .order_by('source', 'target', 'connection_type_id')
+        )
+        return [
+            {
+                'source_node': row['source'],
+                'target_node': row['target'],
+                'connection_type': row['connection_type'],
+                'count': row['count'],
+            }
+            for row in rows
+        ]
@@ -0,0 +1,35 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from apps.graphs.layout import force_directed_layout
+
+
+class Command(BaseCommand):
+    help = 'Measures force-directed layout iterations per second on random graphs of growing size.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[100, 1000, 5000, 20000, 50000],
+            help='Node counts to benchmark',
+        )
+        parser.add_argument('--edges-per-node', type=float, default=2.0)
+        parser.add_argument('--iterations', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        iterations = options['iterations']
+
+        self.stdout.write(f"{'nodes':>8} {'edges':>9} {'it/s':>9} {'s/it':>8}")
+        for n in options['sizes']:
+            m = int(n * options['edges_per_node'])
+            edges = rng.integers(0, n, size=(m, 2))
+            positions = np.zeros((n, 2))
+
+            start = time.perf_counter()
+            force_directed_layout(positions, edges, iterations=iterations, seed=options['seed'])
+            elapsed = time.perf_counter() - start
+
+            self.stdout.write(f"{n:>8} {m:>9} {iterations / elapsed:>9.2f} {elapsed / iterations:>8.3f}")
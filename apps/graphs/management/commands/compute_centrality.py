@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from apps.graphs.centrality import refresh_centrality, stale_graphs
+from apps.graphs.models import Graph
+
+
+class Command(BaseCommand):
+    help = 'Recomputes centrality scores for graphs whose topology changed since they were stored.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--graph', type=int, nargs='+', help='Only these graph ids')
+        parser.add_argument('--force', action='store_true', help='Recompute even if the scores are current')
+        parser.add_argument(
+            '--watch', type=float, metavar='SECONDS',
+            help='Keep running as a worker, looking for stale graphs every SECONDS',
+        )
+
+    def handle(self, *args, **options):
+        if options['watch'] is None:
+            self.refresh(options)
+            return
+        while True:
+            self.refresh(options)
+            options['force'] = False
+            # Like a request, each sweep gets a fresh connection if the old one went away
+            close_old_connections()
+            time.sleep(options['watch'])
+
+    def refresh(self, options):
+        graphs = Graph.objects.only('id').order_by('id')
+        if options['graph']:
+            graphs = graphs.filter(pk__in=options['graph'])
+        if not options['force']:
+            graphs = stale_graphs(graphs)
+
+        refreshed = 0
+        for graph in graphs:
+            start = time.perf_counter()
+            if not refresh_centrality(graph):
+                self.stdout.write(f'graph {graph.pk}: refreshed by another worker')
+                continue
+            refreshed += 1
+            self.stdout.write(f'graph {graph.pk}: {time.perf_counter() - start:.2f}s')
+        self.stdout.write(self.style.SUCCESS(f'Refreshed {refreshed} graph(s).'))
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('graphs', '0003_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='graph',
+            name='version',
+            field=models.PositiveBigIntegerField(default=1, editable=False),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-17 17:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('graphs', '0004_graph_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CanvasChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('node', 'Graph node'), ('connection', 'Connection')], max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('version', models.PositiveBigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('graph', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='canvas_changes', to='graphs.graph')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['graph', 'version'], name='canvas_change_graph_version')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='canvaschange',
+            constraint=models.UniqueConstraint(fields=('graph', 'kind', 'object_id'), name='uniq_canvas_change_per_object'),
+        ),
+    ]
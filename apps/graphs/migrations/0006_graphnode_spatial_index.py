@@ -0,0 +1,47 @@
+# Generated by Django 4.2.30 on 2026-10-17 17:50
+
+from django.db import migrations
+
+
+def create_spatial_index(apps, schema_editor):
+    """R*Tree on SQLite (kept in sync by triggers, see graphs.spatial), GiST index on PostgreSQL."""
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA compile_options")
+            if 'ENABLE_RTREE' not in {row[0] for row in cursor.fetchall()}:
+                return
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE graphs_graphnode_rtree USING rtree("
+            "id, min_x, max_x, min_y, max_y, +graph_id)"
+        )
+        schema_editor.execute(
+            "INSERT INTO graphs_graphnode_rtree(id, min_x, max_x, min_y, max_y, graph_id) "
+            "SELECT id, position_x, position_x, position_y, position_y, graph_id FROM graphs_graphnode"
+        )
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE INDEX graphs_graphnode_position_gist ON graphs_graphnode "
+            "USING gist (point(position_x, position_y))"
+        )
+
+
+def drop_spatial_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        for trigger in ('graphs_graphnode_rtree_ai', 'graphs_graphnode_rtree_ad', 'graphs_graphnode_rtree_au'):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        schema_editor.execute("DROP TABLE IF EXISTS graphs_graphnode_rtree")
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS graphs_graphnode_position_gist")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('graphs', '0005_canvas_change'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_spatial_index, drop_spatial_index),
+    ]
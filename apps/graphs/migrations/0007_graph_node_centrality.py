@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-17 17:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('graphs', '0006_graphnode_spatial_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GraphNodeCentrality',
+            fields=[
+                ('graph_node', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='centrality', serialize=False, to='graphs.graphnode')),
+                ('degree', models.PositiveIntegerField(default=0)),
+                ('pagerank', models.FloatField(default=0)),
+                ('betweenness', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='graph',
+            name='centrality_version',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-17 17:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('graphs', '0007_graph_node_centrality'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='graph',
+            name='connection_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='graph',
+            name='node_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-17 19:16
+
+from django.db import migrations, models
+
+
+def mark_centrality_stale(apps, schema_editor):
+    """Stored scores were keyed on Graph.version: recompute them against the new topology version."""
+    Graph = apps.get_model('graphs', 'Graph')
+    Graph.objects.update(centrality_version=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('graphs', '0008_graph_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='graph',
+            name='topology_version',
+            field=models.PositiveBigIntegerField(default=1, editable=False),
+        ),
+        migrations.RunPython(mark_centrality_stale, migrations.RunPython.noop),
+    ]
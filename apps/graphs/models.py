@@ -1,19 +1,69 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.exceptions import ValidationError
+from django.dispatch import Signal
 
-from apps.projects.models import Project
+from apps.projects.models import Project, counter_update
 from apps.nodes.models import Node
 
+# Sent once a recorded canvas change is committed, with graph_id, version, kind,
+# object_ids and deleted (see CanvasChange.record and realtime.py)
+canvas_changed = Signal()
+
+
+class GraphQuerySet(models.QuerySet):
+    """QuerySet helpers for Graph."""
+
+    def bump_version(self):
+        """Increments the canvas version of every graph in the queryset in one UPDATE."""
+        return self.update(version=models.F('version') + 1)
+
+    def bump_topology(self):
+        """Increments the topology version of every graph in the queryset in one UPDATE."""
+        return self.update(topology_version=models.F('topology_version') + 1)
+
+    def adjust_counters(self, **deltas):
+        """
+        Adds deltas to counter columns in one UPDATE, e.g. adjust_counters(node_count=-1).
+        Both counters only change with the graph's topology, which is bumped in the same UPDATE.
+        """
+        fields = {field: counter_update(field, delta) for field, delta in deltas.items()}
+        fields['topology_version'] = models.F('topology_version') + 1
+        return self.update(**fields)
+
 
 class Graph(models.Model):
-    """A named graph/canvas within a project."""
+    """
+    A named graph/canvas within a project.
+
+    ``version`` increases on every change that alters the canvas payload (graph
+    fields, memberships/layout, connections, titles/types of member nodes). It
+    is only ever written through ``GraphQuerySet.bump_version()`` or
+    ``CanvasChange.record()``; see signals.py. ``node_count`` (graph nodes) and
+    ``connection_count`` are denormalized counters written the same way through
+    ``GraphQuerySet.adjust_counters()``.
+
+    ``topology_version`` only increases when the graph's structure changes
+    (memberships and connections, not positions, colors or titles): through
+    ``adjust_counters()``, or ``bump_topology()`` for connections rewired in place.
+    """
+
+    # Columns save() never writes back (see above)
+    DERIVED_FIELDS = ('version', 'topology_version', 'centrality_version', 'node_count', 'connection_count')
 
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='graphs')
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True)
+    version = models.PositiveBigIntegerField(default=1, editable=False)
+    topology_version = models.PositiveBigIntegerField(default=1, editable=False)
+    # Topology version the stored GraphNodeCentrality rows were computed at (see centrality.py)
+    centrality_version = models.PositiveBigIntegerField(default=0, editable=False)
+    node_count = models.PositiveIntegerField(default=0, editable=False)
+    connection_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = GraphQuerySet.as_manager()
+
     class Meta:
         ordering = ['-updated_at']
         constraints = [
@@ -23,6 +73,30 @@ class Graph(models.Model):
     def __str__(self) -> str:
         return f"{self.project.name} / {self.name}"
 
+    def save(self, *args, **kwargs):
+        # Never write back possibly stale in-memory versions over concurrent updates
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.DERIVED_FIELDS
+            ]
+        # post_save receivers bump the version and the project counters: commit them together with the row
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the persisted project so the counters follow a graph moved to another one
+        instance._loaded_project_id = instance.__dict__.get('project_id')
+        return instance
+
+    def get_canvas_etag(self, representation=None):
+        """Strong ETag for the canvas payload of this graph (one per representation)."""
+        if representation:
+            return f'"{self.pk}.{self.version}.{representation}"'
+        return f'"{self.pk}.{self.version}"'
+
 
 class GraphNode(models.Model):
     """Membership + per-graph layout for a node."""
@@ -46,7 +120,100 @@ class GraphNode(models.Model):
     def __str__(self) -> str:
         return f"{self.graph} -> {self.node.title}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the persisted graph so the counters follow a node moved to another one
+        instance._loaded_graph_id = instance.__dict__.get('graph_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        # post_save receivers log the change and adjust the counters: commit them together with the row
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     def clean(self):
         """Domain validations to maintain consistency between projects."""
         if self.graph_id and self.node_id and self.node.project_id != self.graph.project_id:
             raise ValidationError("Node must belong to the same project as the graph")
+
+
+class GraphNodeCentrality(models.Model):
+    """Precomputed centrality scores of a graph node, refreshed by centrality.refresh_centrality()."""
+
+    graph_node = models.OneToOneField(
+        GraphNode, on_delete=models.CASCADE, primary_key=True, related_name='centrality'
+    )
+    degree = models.PositiveIntegerField(default=0)
+    pagerank = models.FloatField(default=0)
+    betweenness = models.FloatField(default=0)
+
+    def __str__(self) -> str:
+        return f"{self.graph_node_id}: degree={self.degree} pagerank={self.pagerank:.4f}"
+
+
+class CanvasChange(models.Model):
+    """
+    Change log behind incremental canvas sync.
+
+    Holds one row per canvas object (GraphNode or NodeConnection) that has ever
+    changed, with the graph version of its latest change and whether that change
+    was a deletion (tombstone). Recording a change upserts the row, so the log
+    stays bounded by the number of objects instead of the number of writes.
+    """
+
+    KIND_NODE = 'node'
+    KIND_CONNECTION = 'connection'
+    KINDS = [
+        (KIND_NODE, 'Graph node'),
+        (KIND_CONNECTION, 'Connection'),
+    ]
+
+    # No DB constraint: GraphNode/NodeConnection deletions cascading from a graph
+    # delete still log here; the rows are removed once the graph is gone (signals.py).
+    graph = models.ForeignKey(
+        Graph, on_delete=models.DO_NOTHING, db_constraint=False, related_name='canvas_changes'
+    )
+    kind = models.CharField(max_length=20, choices=KINDS)
+    object_id = models.BigIntegerField()
+    version = models.PositiveBigIntegerField()
+    deleted = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['graph', 'kind', 'object_id'], name='uniq_canvas_change_per_object')
+        ]
+        indexes = [
+            models.Index(fields=['graph', 'version'], name='canvas_change_graph_version'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.graph_id} {self.kind}:{self.object_id} @ {self.version}"
+
+    @classmethod
+    def record(cls, graph_id, kind, object_ids, deleted=False):
+        """
+        Bumps the graph version and marks the given objects as changed at that version.
+        Returns the new version.
+        """
+        object_ids = list(object_ids)
+        if not object_ids:
+            return None
+        Graph.objects.filter(pk=graph_id).bump_version()
+        version = Graph.objects.filter(pk=graph_id).values_list('version', flat=True).first()
+        if version is None:
+            return None
+        cls.objects.bulk_create(
+            [
+                cls(graph_id=graph_id, kind=kind, object_id=object_id, version=version, deleted=deleted)
+                for object_id in object_ids
+            ],
+            update_conflicts=True,
+            unique_fields=['graph', 'kind', 'object_id'],
+            update_fields=['version', 'deleted'],
+            batch_size=500,
+        )
+        transaction.on_commit(lambda: canvas_changed.send(
+            sender=cls, graph_id=graph_id, version=version, kind=kind, object_ids=object_ids, deleted=deleted
+        ))
+        return version
@@ -0,0 +1,312 @@
+"""
+Real-time canvas collaboration over WebSockets (served by forgelink_backend/asgi.py).
+
+Clients connect to ``/ws/graphs/<id>/?token=<JWT access token>`` and receive:
+
+- ``{"type": "hello", "graph": id, "version": v}`` once connected;
+- ``{"type": "moves", "nodes": [{"id": <graph node id>, "x": ..., "y": ...}, ...]}``:
+  graph nodes being dragged, at most one message per tick;
+- ``{"type": "change", "version": v, "kind": "node" | "connection", "ids": [...], "deleted": bool}``:
+  every committed canvas change (REST edits, layout, saved moves). ``ids`` is
+  null for very large changes; fetch the rows with ``canvas/changes/?since=``;
+- ``{"type": "resync"}``: the client fell behind and messages were dropped;
+  reload the canvas.
+
+While dragging, clients send ``{"type": "move", "id": <graph node id>, "x": ..., "y": ...}``.
+
+Moves are coalesced per graph in each process: within a tick
+(``CANVAS_TICK_SECONDS``) only the latest position of a node is broadcast.
+They are saved through the write-behind position buffer (write_behind.py),
+which is also flushed when the last client of the graph leaves.
+
+Messages are fanned out through a channel layer (``CANVAS_CHANNEL_LAYER``).
+The default InMemoryChannelLayer only reaches clients connected to the same
+process. With several workers, use a shared layer with the same
+subscribe/unsubscribe/publish interface, such as Redis pub/sub.
+"""
+import asyncio
+import json
+import math
+import re
+import threading
+from collections import defaultdict
+from functools import lru_cache
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .models import Graph
+from .write_behind import position_buffer
+
+DEFAULT_CHANNEL_LAYER = 'apps.graphs.realtime.InMemoryChannelLayer'
+DEFAULT_TICK_SECONDS = 0.05
+
+# Larger changes are announced without their ids
+MAX_CHANGE_IDS = 1000
+
+SOCKET_PATH = re.compile(r'^/ws/graphs/(?P<graph_id>\d+)/$')
+
+
+# --- Channel layer ------------------------------------------------------------------
+
+class Subscription:
+    """The messages of one group for one consumer, delivered on the event loop that subscribed."""
+
+    def __init__(self, group, capacity):
+        self.group = group
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=capacity)
+
+    def deliver(self, message):
+        """Queues a message; safe to call from any thread."""
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # The consumer's loop is gone
+            pass
+
+    def _put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Too slow to keep up: drop the backlog and ask the client to reload
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({'type': 'resync'})
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class InMemoryChannelLayer:
+    """
+    Groups of subscriptions held in this process. Messages are plain
+    JSON-compatible dicts, so a networked layer can serialize them.
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.groups = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def subscribe(self, group):
+        """Must be called on the event loop the messages are read on."""
+        subscription = Subscription(group, self.capacity)
+        with self.lock:
+            self.groups[group].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            members = self.groups.get(subscription.group)
+            if members is not None:
+                members.discard(subscription)
+                if not members:
+                    del self.groups[subscription.group]
+
+    def publish(self, group, message):
+        """Sends a message to every subscription of the group; safe to call from any thread."""
+        with self.lock:
+            members = list(self.groups.get(group, ()))
+        for subscription in members:
+            subscription.deliver(message)
+
+
+@lru_cache(maxsize=None)
+def _load_channel_layer(path):
+    return import_string(path)()
+
+
+def get_channel_layer():
+    return _load_channel_layer(getattr(settings, 'CANVAS_CHANNEL_LAYER', DEFAULT_CHANNEL_LAYER))
+
+
+def graph_group(graph_id):
+    return f'graph-{graph_id}'
+
+
+def publish_canvas_change(graph_id, version, kind, object_ids, deleted):
+    """Announces a committed CanvasChange to the graph's clients; see signals.py."""
+    get_channel_layer().publish(graph_group(graph_id), {
+        'type': 'change',
+        'version': version,
+        'kind': kind,
+        'ids': list(object_ids) if len(object_ids) <= MAX_CHANGE_IDS else None,
+        'deleted': deleted,
+    })
+
+
+# --- Moves --------------------------------------------------------------------------
+
+class CanvasRoom:
+    """The clients of one graph in this process, and the moves not yet broadcast to them."""
+
+    def __init__(self, graph_id):
+        self.graph_id = graph_id
+        self.members = 0
+        self.moves = {}
+        self.task = None
+
+    def move(self, graph_node_id, x, y):
+        self.moves[graph_node_id] = (x, y)
+        position_buffer.add(self.graph_id, {graph_node_id: (x, y)})
+
+    def broadcast(self):
+        """Publishes the latest position of every node moved since the last tick."""
+        if not self.moves:
+            return
+        moves, self.moves = self.moves, {}
+        get_channel_layer().publish(graph_group(self.graph_id), {
+            'type': 'moves',
+            'nodes': [{'id': pk, 'x': x, 'y': y} for pk, (x, y) in moves.items()],
+        })
+
+    async def run(self):
+        tick = getattr(settings, 'CANVAS_TICK_SECONDS', DEFAULT_TICK_SECONDS)
+        while True:
+            await asyncio.sleep(tick)
+            self.broadcast()
+
+
+_rooms = {}
+
+
+def join_room(graph_id):
+    room = _rooms.get(graph_id)
+    if room is None:
+        room = _rooms[graph_id] = CanvasRoom(graph_id)
+        room.task = asyncio.create_task(room.run())
+    room.members += 1
+    return room
+
+
+async def leave_room(room):
+    room.members -= 1
+    if room.members:
+        return
+    # Forget the room before awaiting, so a client joining meanwhile starts a fresh one
+    if _rooms.get(room.graph_id) is room:
+        del _rooms[room.graph_id]
+    room.task.cancel()
+    try:
+        await room.task
+    except asyncio.CancelledError:
+        pass
+    room.broadcast()
+    await sync_to_async(position_buffer.flush)(room.graph_id)
+
+
+# --- WebSocket consumer ---------------------------------------------------------------
+
+def authenticate_socket(scope):
+    """The active user of the ``token`` query parameter (a JWT access token), or None."""
+    from rest_framework.exceptions import AuthenticationFailed
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.exceptions import InvalidToken
+
+    token = parse_qs(scope.get('query_string', b'').decode('latin-1')).get('token')
+    if not token:
+        return None
+    authentication = JWTAuthentication()
+    try:
+        return authentication.get_user(authentication.get_validated_token(token[0]))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+def graph_version(graph_id, user):
+    """The canvas version of a graph the user may open, or None (same rule as GraphViewSet)."""
+    return Graph.objects.filter(pk=graph_id, project__owner=user).values_list('version', flat=True).first()
+
+
+def parse_move(data):
+    """(graph node id, x, y) of a move message, or None if it is malformed."""
+    pk, x, y = data.get('id'), data.get('x'), data.get('y')
+    if not isinstance(pk, int) or isinstance(pk, bool):
+        return None
+    for value in (x, y):
+        if not isinstance(value, (int, float)) or isinstance(value, bool) or not math.isfinite(value):
+            return None
+    return pk, float(x), float(y)
+
+
+async def _send_json(send, message):
+    await send({'type': 'websocket.send', 'text': json.dumps(message)})
+
+
+async def _read_client(receive, send, room):
+    while True:
+        message = await receive()
+        if message['type'] == 'websocket.disconnect':
+            return
+        if message['type'] != 'websocket.receive':
+            continue
+        try:
+            data = json.loads(message.get('text') or message.get('bytes') or '')
+        except ValueError:
+            data = None
+        if not isinstance(data, dict) or data.get('type') != 'move':
+            await _send_json(send, {'type': 'error', 'detail': 'Expected {"type": "move", "id": ..., "x": ..., "y": ...}.'})
+            continue
+        move = parse_move(data)
+        if move is None:
+            await _send_json(send, {'type': 'error', 'detail': 'A move needs an integer "id" and numeric "x" and "y".'})
+        else:
+            room.move(*move)
+
+
+async def _forward_group(subscription, send):
+    while True:
+        await _send_json(send, await subscription.get())
+
+
+async def canvas_socket(scope, receive, send, graph_id):
+    """One client of a graph canvas."""
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+
+    user = await sync_to_async(authenticate_socket)(scope)
+    if user is None:
+        await send({'type': 'websocket.close'})
+        return
+
+    layer = get_channel_layer()
+    # Subscribe before reading the version, so no change after it is missed
+    subscription = layer.subscribe(graph_group(graph_id))
+    try:
+        version = await sync_to_async(graph_version)(graph_id, user)
+        if version is None:
+            await send({'type': 'websocket.close'})
+            return
+        await send({'type': 'websocket.accept'})
+        await _send_json(send, {'type': 'hello', 'graph': graph_id, 'version': version})
+
+        room = join_room(graph_id)
+        tasks = [
+            asyncio.create_task(_read_client(receive, send, room)),
+            asyncio.create_task(_forward_group(subscription, send)),
+        ]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await leave_room(room)
+    finally:
+        layer.unsubscribe(subscription)
+
+
+async def websocket_application(scope, receive, send):
+    """Routes WebSocket connections; anything but a canvas path is rejected."""
+    match = SOCKET_PATH.match(scope['path'])
+    if match is None:
+        await receive()
+        await send({'type': 'websocket.close'})
+        return
+    await canvas_socket(scope, receive, send, int(match['graph_id']))
@@ -1,20 +1,31 @@
 from rest_framework import serializers
 
+from .layout import DEFAULT_ITERATIONS, DEFAULT_SPACING, MAX_ITERATIONS
 from .models import Graph, GraphNode
 
 
 class GraphSerializer(serializers.ModelSerializer):
     """Serializer for Graph model."""
 
-    node_count = serializers.SerializerMethodField()
-
     class Meta:
         model = Graph
-        fields = ['id', 'project', 'name', 'description', 'created_at', 'updated_at', 'node_count']
-        read_only_fields = ['created_at', 'updated_at', 'node_count']
+        fields = [
+            'id', 'project', 'name', 'description', 'version', 'created_at', 'updated_at',
+            'node_count', 'connection_count',
+        ]
+        read_only_fields = ['version', 'created_at', 'updated_at', 'node_count', 'connection_count']
+
 
-    def get_node_count(self, obj):
-        return obj.graph_nodes.count()
+class GraphDuplicateSerializer(serializers.Serializer):
+    """Options for duplicating a graph."""
+
+    name = serializers.CharField(max_length=255, required=False)
+
+    def validate_name(self, value):
+        graph = self.context['graph']
+        if Graph.objects.filter(project_id=graph.project_id, name=value).exists():
+            raise serializers.ValidationError('A graph with this name already exists in the project.')
+        return value
 
 
 class GraphNodeSerializer(serializers.ModelSerializer):
@@ -77,3 +88,56 @@ class GraphNodeSerializer(serializers.ModelSerializer):
             raise ValidationError(e.message_dict if hasattr(e, 'message_dict') else e.messages)
 
         return attrs
+
+
+class GraphNodeWithCentralitySerializer(GraphNodeSerializer):
+    """GraphNode plus its precomputed centrality scores (annotated by GraphNodeViewSet)."""
+
+    degree = serializers.IntegerField(read_only=True, allow_null=True)
+    pagerank = serializers.FloatField(read_only=True, allow_null=True)
+    betweenness = serializers.FloatField(read_only=True, allow_null=True)
+    centrality_stale = serializers.BooleanField(read_only=True, default=True)
+
+    class Meta(GraphNodeSerializer.Meta):
+        fields = GraphNodeSerializer.Meta.fields + ['degree', 'pagerank', 'betweenness', 'centrality_stale']
+        read_only_fields = GraphNodeSerializer.Meta.read_only_fields + [
+            'degree', 'pagerank', 'betweenness', 'centrality_stale',
+        ]
+
+
+class GraphLayoutItemSerializer(serializers.Serializer):
+    """One entry of a bulk layout update: new position and/or color of a node in the graph."""
+
+    node = serializers.IntegerField()
+    x = serializers.FloatField(required=False)
+    y = serializers.FloatField(required=False)
+    color = serializers.RegexField(r'^#[0-9A-Fa-f]{6}$', required=False)
+
+
+class AutoLayoutSerializer(serializers.Serializer):
+    """Options for a server-side auto-layout run."""
+
+    ALGORITHMS = ['force', 'hierarchical']
+
+    algorithm = serializers.ChoiceField(choices=ALGORITHMS, default='force')
+    iterations = serializers.IntegerField(min_value=1, max_value=MAX_ITERATIONS, default=DEFAULT_ITERATIONS)
+    spacing = serializers.FloatField(min_value=1, max_value=10000, default=DEFAULT_SPACING)
+
+
+class GraphAnalyticsQuerySerializer(serializers.Serializer):
+    """Query params shared by the graph analytics endpoints."""
+
+    connection_type = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False)
+    directed = serializers.BooleanField(default=False)
+
+
+class ShortestPathQuerySerializer(GraphAnalyticsQuerySerializer):
+    source = serializers.IntegerField()
+    target = serializers.IntegerField()
+
+
+class NeighborhoodQuerySerializer(GraphAnalyticsQuerySerializer):
+    MAX_HOPS = 6
+
+    node = serializers.IntegerField()
+    k = serializers.IntegerField(min_value=1, max_value=MAX_HOPS, default=1)
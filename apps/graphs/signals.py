@@ -0,0 +1,100 @@
+"""Keeps Graph.version and the canvas change log in step with everything rendered on the canvas."""
+from collections import defaultdict
+
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from apps.nodes.models import Node
+from apps.projects.counters import deleted_with, moved_from
+from apps.projects.models import Project
+from .models import CanvasChange, Graph, GraphNode, canvas_changed
+from .realtime import publish_canvas_change
+
+# Node fields that appear in the canvas payload
+CANVAS_NODE_FIELDS = {'title', 'node_type'}
+
+
+def record_node_changes(node_ids):
+    """Logs every GraphNode of the given nodes as changed, one version bump per graph."""
+    graph_node_ids = defaultdict(list)
+    for graph_id, graph_node_id in GraphNode.objects.filter(node_id__in=node_ids).values_list('graph_id', 'id'):
+        graph_node_ids[graph_id].append(graph_node_id)
+    for graph_id, ids in graph_node_ids.items():
+        CanvasChange.record(graph_id, CanvasChange.KIND_NODE, ids)
+
+
+@receiver(post_save, sender=Graph)
+def bump_graph_version_on_save(sender, instance, created, **kwargs):
+    if not created:
+        Graph.objects.filter(pk=instance.pk).bump_version()
+
+
+@receiver(pre_delete, sender=Project)
+def delete_project_canvas_changes(sender, instance, **kwargs):
+    # One statement for every graph of the project (see delete_canvas_changes)
+    CanvasChange.objects.filter(graph__project=instance).delete()
+
+
+@receiver(post_delete, sender=Graph)
+def delete_canvas_changes(sender, instance, origin=None, **kwargs):
+    if not deleted_with(origin, Project):
+        CanvasChange.objects.filter(graph_id=instance.pk).delete()
+
+
+@receiver(post_save, sender=Graph)
+def count_graph_save(sender, instance, created, update_fields=None, **kwargs):
+    previous_project_id = moved_from(instance, 'project', update_fields)
+    if created:
+        Project.objects.filter(pk=instance.project_id).adjust_counters(graph_count=1)
+    elif previous_project_id is not None:
+        # The graph's connections move along with it
+        connection_count = Graph.objects.filter(pk=instance.pk).values_list('connection_count', flat=True).get()
+        Project.objects.filter(pk=previous_project_id).adjust_counters(
+            graph_count=-1, connection_count=-connection_count
+        )
+        Project.objects.filter(pk=instance.project_id).adjust_counters(
+            graph_count=1, connection_count=connection_count
+        )
+
+
+@receiver(pre_delete, sender=Graph)
+def count_graph_delete(sender, instance, origin=None, **kwargs):
+    # The project's counters go with the project
+    if deleted_with(origin, Project):
+        return
+    # Read before the cascade: the graph's connections are not counted down one by one
+    connection_count = Graph.objects.filter(pk=instance.pk).values_list('connection_count', flat=True).first() or 0
+    Project.objects.filter(pk=instance.project_id).adjust_counters(graph_count=-1, connection_count=-connection_count)
+
+
+@receiver(post_save, sender=GraphNode)
+def log_graph_node_save(sender, instance, created, update_fields=None, **kwargs):
+    previous_graph_id = moved_from(instance, 'graph', update_fields)
+    if created:
+        Graph.objects.filter(pk=instance.graph_id).adjust_counters(node_count=1)
+    elif previous_graph_id is not None:
+        Graph.objects.filter(pk=previous_graph_id).adjust_counters(node_count=-1)
+        Graph.objects.filter(pk=instance.graph_id).adjust_counters(node_count=1)
+        CanvasChange.record(previous_graph_id, CanvasChange.KIND_NODE, [instance.pk], deleted=True)
+    CanvasChange.record(instance.graph_id, CanvasChange.KIND_NODE, [instance.pk])
+
+
+@receiver(post_delete, sender=GraphNode)
+def log_graph_node_delete(sender, instance, origin=None, **kwargs):
+    # Counters and change log of a deleted graph go with the graph
+    if deleted_with(origin, Graph, Project):
+        return
+    Graph.objects.filter(pk=instance.graph_id).adjust_counters(node_count=-1)
+    CanvasChange.record(instance.graph_id, CanvasChange.KIND_NODE, [instance.pk], deleted=True)
+
+
+@receiver(post_save, sender=Node)
+def log_node_save(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and not CANVAS_NODE_FIELDS & set(update_fields)):
+        return
+    record_node_changes([instance.pk])
+
+
+@receiver(canvas_changed)
+def broadcast_canvas_change(sender, graph_id, version, kind, object_ids, deleted, **kwargs):
+    publish_canvas_change(graph_id, version, kind, object_ids, deleted)
@@ -0,0 +1,98 @@
+"""
+Spatial index over GraphNode positions, for viewport (bounding-box) queries.
+
+SQLite uses an R*Tree virtual table (``graphs_graphnode_rtree``) mirroring
+``graphs_graphnode`` through triggers; PostgreSQL uses a GiST expression index
+over ``point(position_x, position_y)``. Any other backend (or SQLite built
+without R*Tree) falls back to plain range filters on the position columns.
+"""
+import math
+
+from django.db import connections
+from django.db.models.expressions import RawSQL
+
+RTREE_TABLE = 'graphs_graphnode_rtree'
+
+SQLITE_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS graphs_graphnode_rtree_ai AFTER INSERT ON graphs_graphnode BEGIN
+        INSERT INTO {RTREE_TABLE}(id, min_x, max_x, min_y, max_y, graph_id)
+        VALUES (new.id, new.position_x, new.position_x, new.position_y, new.position_y, new.graph_id);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS graphs_graphnode_rtree_ad AFTER DELETE ON graphs_graphnode BEGIN
+        DELETE FROM {RTREE_TABLE} WHERE id = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS graphs_graphnode_rtree_au
+    AFTER UPDATE OF position_x, position_y, graph_id ON graphs_graphnode BEGIN
+        UPDATE {RTREE_TABLE}
+        SET min_x = new.position_x, max_x = new.position_x,
+            min_y = new.position_y, max_y = new.position_y, graph_id = new.graph_id
+        WHERE id = old.id;
+    END
+    """,
+]
+
+
+def has_rtree_table(connection):
+    return connection.vendor == 'sqlite' and RTREE_TABLE in connection.introspection.table_names()
+
+
+def install_spatial_triggers(using='default', **kwargs):
+    """
+    Creates the SQLite triggers that keep the R*Tree in sync with graphs_graphnode.
+
+    Runs on post_migrate because SQLite drops a table's triggers whenever a
+    later migration rebuilds that table.
+    """
+    connection = connections[using]
+    if not has_rtree_table(connection):
+        return
+    with connection.cursor() as cursor:
+        for statement in SQLITE_TRIGGERS:
+            cursor.execute(statement)
+
+
+def parse_bbox(value):
+    """
+    Parses "x0,y0,x1,y1" into a (x0, y0, x1, y1) tuple of floats.
+    Raises ValueError if malformed or if the box is inverted.
+    """
+    parts = [float(part) for part in value.split(',')]
+    if len(parts) != 4 or not all(math.isfinite(part) for part in parts):
+        raise ValueError('Expected four comma-separated numbers')
+    x0, y0, x1, y1 = parts
+    if x0 > x1 or y0 > y1:
+        raise ValueError('Expected x0 <= x1 and y0 <= y1')
+    return x0, y0, x1, y1
+
+
+def filter_viewport(queryset, bbox):
+    """Restricts a GraphNode queryset to the rows whose position lies inside bbox (inclusive)."""
+    x0, y0, x1, y1 = bbox
+    connection = connections[queryset.db]
+
+    # Self-contained subqueries (no reference to the outer table), so the result
+    # can itself be used as a subquery.
+    if connection.vendor == 'postgresql':
+        # Matches the GiST expression index created in migration 0006
+        queryset = queryset.filter(id__in=RawSQL(
+            "SELECT id FROM graphs_graphnode "
+            "WHERE point(position_x, position_y) <@ box(point(%s, %s), point(%s, %s))",
+            [x0, y0, x1, y1],
+        ))
+    elif has_rtree_table(connection):
+        # The R*Tree stores float32 boxes rounded outwards, so it only pre-selects;
+        # the exact range filter below settles the edges.
+        queryset = queryset.filter(id__in=RawSQL(
+            f"SELECT id FROM {RTREE_TABLE} WHERE min_x <= %s AND max_x >= %s AND min_y <= %s AND max_y >= %s",
+            [x1, x0, y1, y0],
+        ))
+
+    return queryset.filter(
+        position_x__gte=x0, position_x__lte=x1,
+        position_y__gte=y0, position_y__lte=y1,
+    )
@@ -1,13 +1,18 @@
-from django.test import TestCase
+import asyncio
+from io import StringIO
+
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.core.exceptions import ValidationError
 
-from django.db import IntegrityError
+from django.db import IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from django.contrib.auth import get_user_model
 
 from .models import Graph, GraphNode
+from .views import MAX_LAYOUT_ITEMS
 from apps.projects.models import Project
 from apps.nodes.models import Node
 
@@ -259,6 +264,608 @@ class GraphAPITest(APITestCase):
         self.assertIn('connections', response.data)
         self.assertEqual(len(response.data['nodes']), 1)
 
+    def test_canvas_etag_not_modified(self):
+        """Test that the canvas answers a matching If-None-Match with 304"""
+        node = Node.objects.create(project=self.project, title='Test Node')
+        GraphNode.objects.create(graph=self.graph, node=node)
+
+        self.client.force_authenticate(user=self.user)
+        url = reverse('graph-canvas', kwargs={'pk': self.graph.pk})
+        response = self.client.get(url)
+        etag = response['ETag']
+
+        # Only the graph lookup, no node/connection queries
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+        node.title = 'Renamed'
+        node.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_graph_version_bumps_on_canvas_changes(self):
+        """Test that graph writes, memberships and layout updates bump the version"""
+        node = Node.objects.create(project=self.project, title='Test Node')
+        versions = [Graph.objects.get(pk=self.graph.pk).version]
+
+        def assert_bumped():
+            versions.append(Graph.objects.get(pk=self.graph.pk).version)
+            self.assertGreater(versions[-1], versions[-2])
+
+        graph_node = GraphNode.objects.create(graph=self.graph, node=node)
+        assert_bumped()
+
+        self.client.force_authenticate(user=self.user)
+        url = reverse('graph-layout', kwargs={'pk': self.graph.pk})
+        self.client.patch(url, [{'node': node.id, 'x': 5, 'y': 5}], format='json')
+        assert_bumped()
+
+        self.graph.description = 'Changed'
+        self.graph.save()
+        assert_bumped()
+
+        graph_node.delete()
+        assert_bumped()
+
+    def test_canvas_columnar_format(self):
+        """Test for the opt-in columnar and packed canvas representations"""
+        from .canvas_formats import PACKED_MAGIC
+
+        first = Node.objects.create(project=self.project, title='Same', node_type='event')
+        second = Node.objects.create(project=self.project, title='Same', node_type='item')
+        GraphNode.objects.create(graph=self.graph, node=first, position_x=1.5, position_y=2.5)
+        GraphNode.objects.create(graph=self.graph, node=second)
+
+        self.client.force_authenticate(user=self.user)
+        url = reverse('graph-canvas', kwargs={'pk': self.graph.pk})
+        response = self.client.get(url, HTTP_ACCEPT='application/vnd.forgelink.canvas+json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['titles'], ['Same'])
+        self.assertEqual(response.data['nodes']['title'], [0, 0])
+        self.assertEqual(response.data['node_types'], ['event', 'item'])
+        self.assertEqual(response.data['nodes']['x'], [1.5, 0.0])
+        self.assertEqual(response.data['connections']['id'], [])
+
+        json_etag = self.client.get(url)['ETag']
+        self.assertNotEqual(response['ETag'], json_etag)
+
+        response = self.client.get(url, {'format': 'packed'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/vnd.forgelink.canvas+octet-stream')
+        self.assertTrue(response.content.startswith(PACKED_MAGIC))
+
+    def test_canvas_viewport(self):
+        """Test for restricting the canvas to a bounding box"""
+        from apps.connections.models import ConnectionType, NodeConnection
+
+        inside = Node.objects.create(project=self.project, title='Inside')
+        outside = Node.objects.create(project=self.project, title='Outside')
+        far = Node.objects.create(project=self.project, title='Far')
+        inside_layout = GraphNode.objects.create(graph=self.graph, node=inside, position_x=10, position_y=10)
+        GraphNode.objects.create(graph=self.graph, node=outside, position_x=500, position_y=10)
+        far_layout = GraphNode.objects.create(graph=self.graph, node=far, position_x=900, position_y=900)
+        connection_type = ConnectionType.objects.create(project=self.project, name='Near')
+        touching = NodeConnection.objects.create(
+            graph=self.graph, source_node=inside, target_node=outside, connection_type=connection_type
+        )
+        NodeConnection.objects.create(
+            graph=self.graph, source_node=outside, target_node=far, connection_type=connection_type
+        )
+
+        self.client.force_authenticate(user=self.user)
+        url = reverse('graph-canvas', kwargs={'pk': self.graph.pk})
+        response = self.client.get(url, {'bbox': '0,0,100,100'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.data['nodes']], [inside_layout.id])
+        self.assertEqual([item['id'] for item in response.data['connections']], [touching.id])
+
+        # The index follows position updates
+        far_layout.position_x, far_layout.position_y = 50, 50
+        far_layout.save()
+        response = self.client.get(url, {'bbox': '0,0,100,100'})
+        self.assertEqual(len(response.data['nodes']), 2)
+        self.assertEqual(len(response.data['connections']), 2)
+
+        response = self.client.get(url, {'bbox': '100,0,0,100'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_canvas_collapsed(self):
+        """Test for folding the descendants of a node into one super-node with aggregated connections"""
+        from apps.connections.models import ConnectionType, NodeConnection
+
+        region = Node.objects.create(project=self.project, title='Region', node_type='location')
+        city = Node.objects.create(project=self.project, title='City', parent_node=region)
+        district = Node.objects.create(project=self.project, title='District', parent_node=city)
+        outside = Node.objects.create(project=self.project, title='Outside')
+        other = Node.objects.create(project=self.project, title='Other')
+        GraphNode.objects.create(graph=self.graph, node=city, position_x=0, position_y=0)
+        GraphNode.objects.create(graph=self.graph, node=district, position_x=100, position_y=50)
+        outside_layout = GraphNode.objects.create(graph=self.graph, node=outside)
+        other_layout = GraphNode.objects.create(graph=self.graph, node=other)
+        road = ConnectionType.objects.create(project=self.project, name='Road')
+        river = ConnectionType.objects.create(project=self.project, name='River')
+        for source, target, connection_type in [
+            (city, outside, road), (district, outside, road), (district, outside, river),
+            (outside, district, road), (city, district, road),
+        ]:
+            NodeConnection.objects.create(
+                graph=self.graph, source_node=source, target_node=target, connection_type=connection_type
+            )
+        direct = NodeConnection.objects.create(
+            graph=self.graph, source_node=outside, target_node=other, connection_type=road
+        )
+
+        self.client.force_authenticate(user=self.user)
+        url = reverse('graph-canvas', kwargs={'pk': self.graph.pk})
+        for accept in ('application/json', 'text/html'):
+            response = self.client.get(url, {'collapse': f'{region.id},{city.id}'}, HTTP_ACCEPT=accept)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('ETag', response)
+            data = response.data
+            self.assertEqual(sorted(item['id'] for item in data['nodes']), sorted([outside_layout.id, other_layout.id]))
+            self.assertEqual([item['id'] for item in data['connections']], [direct.id])
+            # The region has no graph node of its own: placed at the centroid of its members
+            self.assertEqual(data['collapsed'], [{
+                'node': region.id, 'title': 'Region', 'node_type': 'location', 'member_count': 2,
+                'internal_connections': 1, 'position_x': 50.0, 'position_y': 25.0,
+            }])
+            self.assertEqual(data['aggregated_connections'], [
+                {'source_node': region.id, 'target_node': outside.id, 'connection_type': road.id, 'count': 2},
+                {'source_node': region.id, 'target_node': outside.id, 'connection_type': river.id, 'count': 1},
+                {'source_node': outside.id, 'target_node': region.id, 'connection_type': road.id, 'count': 1},
+            ])
+
+        # Collapsing the city alone keeps it where it is
+        response = self.client.get(url, {'collapse': str(city.id)})
+        self.assertEqual(response.data['collapsed'][0]['position_x'], 0.0)
+        self.assertEqual(response.data['collapsed'][0]['member_count'], 2)
+
+        other_project = Project.objects.create(name='Other Project', owner=self.user)
+        foreign = Node.objects.create(project=other_project, title='Foreign')
+        for value in ('abc', '0', str(foreign.id)):
+            response = self.client.get(url, {'collapse': value})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(url, {'collapse': str(city.id), 'bbox': '0,0,10,10'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_canvas_zoom_clusters(self):
+        """Test for clustering the canvas into grid cells at a zoom level"""
+        from apps.connections.models import ConnectionType, NodeConnection
+
+        positions = [(0, 0, 'character'), (10, 10, 'character'), (20, 0, 'event'), (100, 100, 'location')]
+        nodes = []
+        for x, y, node_type in positions:
+            node = Node.objects.create(project=self.project, title=f'{x},{y}', node_type=node_type)
+            GraphNode.objects.create(graph=self.graph, node=node, position_x=x, position_y=y)
+            nodes.append(node)
+        connection_type = ConnectionType.objects.create(project=self.project, name='Link')
+        for source, target in [(0, 1), (0, 3), (3, 1), (2, 3)]:
+            NodeConnection.objects.create(
+                graph=self.graph, source_node=nodes[source], target_node=nodes[target], connection_type=connection_type
+            )
+
+        self.client.force_authenticate(user=self.user)
+        url = reverse('graph-canvas', kwargs={'pk': self.graph.pk})
+        response = self.client.get(url, {'zoom': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['bounds'], [0, 0, 100, 100])
+        self.assertEqual(response.data['cell_size'], 50)
+        self.assertEqual(response.data['clusters'], [
+            {'id': 0, 'cell': [0, 0], 'count': 3, 'x': 10.0, 'y': 10 / 3, 'node_type': 'character'},
+            {'id': 3, 'cell': [1, 1], 'count': 1, 'x': 100.0, 'y': 100.0, 'node_type': 'location'},
+        ])
+        # Both directions add up; connections inside a cell are left out
+        self.assertEqual(response.data['edges'], [{'source': 0, 'target': 3, 'weight': 3}])
+        self.assertEqual(response.data['omitted_edges'], 0)
+
+        response = self.client.get(url, {'zoom': 0})
+        self.assertEqual(len(response.data['clusters']), 1)
+        self.assertEqual(response.data['edges'], [])
+
+        # Cached per version, with its own ETag
+        etag = self.client.get(url, {'zoom': 1})['ETag']
+        self.assertNotEqual(etag, self.client.get(url)['ETag'])
+        response = self.client.get(url, {'zoom': 1}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        GraphNode.objects.filter(node=nodes[3]).update(position_x=200)
+        layout = GraphNode.objects.get(node=nodes[3])
+        layout.save()
+        response = self.client.get(url, {'zoom': 1})
+        self.assertEqual(response.data['bounds'], [0, 0, 200, 100])
+
+        for params in ({'zoom': 13}, {'zoom': 'x'}, {'zoom': 1, 'bbox': '0,0,10,10'}):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_canvas_changes_endpoint(self):
+        """Test for fetching only what changed on the canvas since a version"""
+        kept = Node.objects.create(project=self.project, title='Kept')
+        moved = Node.objects.create(project=self.project, title='Moved')
+        removed = Node.objects.create(project=self.project, title='Removed')
+        GraphNode.objects.create(graph=self.graph, node=kept)
+        moved_layout = GraphNode.objects.create(graph=self.graph, node=moved)
+        removed_layout = GraphNode.objects.create(graph=self.graph, node=removed)
+
+        self.client.force_authenticate(user=self.user)
+        since = self.client.get(reverse('graph-canvas', kwargs={'pk': self.graph.pk})).data['graph']['version']
+
+        moved_layout.position_x = 50
+        moved_layout.save()
+        removed_layout_id = removed_layout.id
+        removed_layout.delete()
+        added = Node.objects.create(project=self.project, title='Added')
+        added_layout = GraphNode.objects.create(graph=self.graph, node=added)
+
+        url = reverse('graph-canvas-changes', kwargs={'pk': self.graph.pk})
+        response = self.client.get(url, {'since': since})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreater(response.data['version'], since)
+        self.assertEqual(
+            sorted(item['id'] for item in response.data['nodes']),
+            sorted([moved_layout.id, added_layout.id])
+        )
+        self.assertEqual(response.data['removed_nodes'], [removed_layout_id])
+        self.assertEqual(response.data['connections'], [])
+
+        response = self.client.get(url, {'since': response.data['version']})
+        self.assertEqual(response.data['nodes'], [])
+        self.assertEqual(response.data['removed_nodes'], [])
+
+        response = self.client.get(url, {'since': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_canvas_json_matches_serializers(self):
+        """Test that the database-built canvas is identical to the serializer output"""
+        import json
+        from datetime import datetime, timezone as dt_timezone
+        from rest_framework.renderers import JSONRenderer
+        from apps.connections.models import ConnectionType, NodeConnection
+        from apps.connections.serializers import NodeConnectionSerializer
+        from .canvas_json import PrerenderedJSONResponse
+        from .serializers import GraphNodeSerializer, GraphSerializer
+
+        first = Node.objects.create(project=self.project, title='Ünïcode "quoted" \\ title', node_type='event')
+        second = Node.objects.create(project=self.project, title='Second')
+        GraphNode.objects.create(
+            graph=self.graph, node=first, position_x=123.45678901234567, position_y=-2, color='#FF0000'
+        )
+        GraphNode.objects.create(graph=self.graph, node=second, position_x=1e20)
+        # Timestamps without microseconds are rendered without a fraction
+        GraphNode.objects.filter(node=second).update(updated_at=datetime(2024, 1, 31, 12, tzinfo=dt_timezone.utc))
+        connection_type = ConnectionType.objects.create(project=self.project, name='Link')
+        NodeConnection.objects.create(
+            graph=self.graph, source_node=first, target_node=second, connection_type=connection_type, label='knows'
+        )
+        NodeConnection.objects.create(
+            graph=self.graph, source_node=second, target_node=first, connection_type=connection_type
+        )
+        self.graph.refresh_from_db()
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('graph-canvas', kwargs={'pk': self.graph.pk}), HTTP_ACCEPT='application/json')
+        self.assertIsInstance(response, PrerenderedJSONResponse)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        canvas = json.loads(response.content)
+
+        expected = json.loads(JSONRenderer().render({
+            'graph': GraphSerializer(self.graph).data,
+            'nodes': GraphNodeSerializer(self.graph.graph_nodes.all(), many=True).data,
+            'connections': NodeConnectionSerializer(self.graph.connections.all(), many=True).data,
+        }))
+        self.assertEqual(canvas['graph'], expected['graph'])
+        self.assertEqual(
+            sorted(canvas['nodes'], key=lambda item: item['id']), sorted(expected['nodes'], key=lambda item: item['id'])
+        )
+        self.assertEqual(canvas['connections'], expected['connections'])
+
+        # Local times are not rendered by the database: the serializers build the canvas
+        with override_settings(TIME_ZONE='Europe/Madrid'):
+            response = self.client.get(
+                reverse('graph-canvas', kwargs={'pk': self.graph.pk}), HTTP_ACCEPT='application/json'
+            )
+        self.assertNotIsInstance(response, PrerenderedJSONResponse)
+        self.assertEqual(len(response.data['nodes']), 2)
+
+    def test_layout_endpoint(self):
+        """Test for moving many nodes of a graph in one request"""
+        first = Node.objects.create(project=self.project, title='First')
+        second = Node.objects.create(project=self.project, title='Second')
+        GraphNode.objects.create(graph=self.graph, node=first)
+        GraphNode.objects.create(graph=self.graph, node=second, color='#000000')
+
+        self.client.force_authenticate(user=self.user)
+        url = reverse('graph-layout', kwargs={'pk': self.graph.pk})
+        data = [
+            {'node': first.id, 'x': 10.5, 'y': -20},
+            {'node': second.id, 'x': 30, 'y': 40, 'color': '#FF0000'},
+        ]
+        # Membership, bulk_update and the change log: no per-node queries
+        with self.assertNumQueries(9):
+            response = self.client.patch(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['updated'], 2)
+
+        first_layout = GraphNode.objects.get(graph=self.graph, node=first)
+        self.assertEqual((first_layout.position_x, first_layout.position_y), (10.5, -20))
+        self.assertEqual(first_layout.color, '#3B82F6')
+        self.assertEqual(GraphNode.objects.get(graph=self.graph, node=second).color, '#FF0000')
+
+    @override_settings(LAYOUT_WRITE_BEHIND_MS=60000)
+    def test_layout_endpoint_deferred(self):
+        """Test that deferred layout updates are coalesced and written before the canvas is read"""
+        first = Node.objects.create(project=self.project, title='First')
+        second = Node.objects.create(project=self.project, title='Second')
+        first_layout = GraphNode.objects.create(graph=self.graph, node=first)
+        GraphNode.objects.create(graph=self.graph, node=second)
+        self.graph.refresh_from_db()
+        version = self.graph.version
+
+        self.client.force_authenticate(user=self.user)
+        url = reverse('graph-layout', kwargs={'pk': self.graph.pk})
+        for x in (1, 2, 3):
+            with self.assertNumQueries(2):
+                response = self.client.patch(f'{url}?defer=true', [{'node': first.id, 'x': x, 'y': 5}], format='json')
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+            self.assertEqual(response.data['accepted'], 1)
+        first_layout.refresh_from_db()
+        self.assertEqual((first_layout.position_x, first_layout.position_y), (0, 0))
+
+        response = self.client.get(reverse('graph-canvas', kwargs={'pk': self.graph.pk}))
+        positions = {item['node']: (item['position_x'], item['position_y']) for item in response.data['nodes']}
+        self.assertEqual(positions[first.id], (3, 5))
+        # One write for the three updates
+        self.assertEqual(response.data['graph']['version'], version + 1)
+
+        response = self.client.patch(f'{url}?defer=true', [{'node': second.id, 'color': '#FF0000'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(LAYOUT_WRITE_BEHIND_MS=60000)
+    def test_buffered_positions_never_overwrite_later_writes(self):
+        """Test that positions buffered before an auto-layout or a graph node update are written before them, and kept by it"""
+        from .write_behind import position_buffer
+
+        first = Node.objects.create(project=self.project, title='First')
+        second = Node.objects.create(project=self.project, title='Second')
+        first_layout = GraphNode.objects.create(graph=self.graph, node=first)
+        GraphNode.objects.create(graph=self.graph, node=second)
+
+        self.client.force_authenticate(user=self.user)
+        url = reverse('graph-layout', kwargs={'pk': self.graph.pk})
+        self.client.patch(f'{url}?defer=true', [{'node': first.id, 'x': 999, 'y': 999}], format='json')
+        response = self.client.post(reverse('graph-auto-layout', kwargs={'pk': self.graph.pk}), {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        first_layout.refresh_from_db()
+        laid_out = (first_layout.position_x, first_layout.position_y)
+        self.assertNotEqual(laid_out, (999, 999))
+        self.assertEqual(position_buffer.flush(self.graph.pk), 0)
+
+        self.client.patch(f'{url}?defer=true', [{'node': first.id, 'x': 999, 'y': 999}], format='json')
+        detail_url = reverse('graphnode-detail', kwargs={'pk': first_layout.pk})
+        response = self.client.patch(detail_url, {'position_x': 5, 'position_y': 6}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(position_buffer.flush(self.graph.pk), 0)
+        first_layout.refresh_from_db()
+        self.assertEqual((first_layout.position_x, first_layout.position_y), (5, 6))
+
+        self.client.patch(f'{url}?defer=true', [{'node': first.id, 'x': 100, 'y': 200}], format='json')
+        response = self.client.patch(detail_url, {'color': '#ff0000'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['position_x'], response.data['position_y']), (100, 200))
+        first_layout.refresh_from_db()
+        self.assertEqual((first_layout.position_x, first_layout.position_y), (100, 200))
+        self.assertEqual(first_layout.color, '#ff0000')
+
+    def test_flush_waits_for_a_flush_in_progress(self):
+        """Test that flushing a graph waits until a batch already taken by the timer is written"""
+        import threading
+        from .write_behind import PositionBuffer
+
+        buffer = PositionBuffer()
+        # As if the timer thread had taken the graph's batch and were still saving it
+        buffer._flush_graph(self.graph.pk)
+        graph_lock = buffer.graph_locks[self.graph.pk]
+        graph_lock.acquire()
+        flushed = threading.Event()
+        thread = threading.Thread(target=lambda: (buffer.flush(self.graph.pk), flushed.set()))
+        thread.start()
+        try:
+            self.assertFalse(flushed.wait(0.2))
+        finally:
+            graph_lock.release()
+        self.assertTrue(flushed.wait(2))
+        thread.join()
+
+    def test_auto_layout_force(self):
+        """Test that the force-directed auto-layout spreads nodes piled at the origin"""
+        from apps.connections.models import ConnectionType, NodeConnection
+
+        nodes = [Node.objects.create(project=self.project, title=f'Node {i}') for i in range(4)]
+        for node in nodes:
+            GraphNode.objects.create(graph=self.graph, node=node)
+        connection_type = ConnectionType.objects.create(project=self.project, name='Link')
+        NodeConnection.objects.create(
+            graph=self.graph, source_node=nodes[0], target_node=nodes[1], connection_type=connection_type
+        )
+
+        self.client.force_authenticate(user=self.user)
+        url = reverse('graph-auto-layout', kwargs={'pk': self.graph.pk})
+        response = self.client.post(url, {'iterations': 20}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['updated'], 4)
+        self.assertEqual(response.data['iterations'], 20)
+        positions = set(self.graph.graph_nodes.values_list('position_x', 'position_y'))
+        self.assertEqual(len(positions), 4)
+
+    def test_force_layout_iterations_fit_the_work_budget(self):
+        """Test that large graphs get fewer force-layout iterations than requested"""
+        from .layout import MAX_ITERATIONS, max_force_iterations
+
+        self.assertEqual(max_force_iterations(10, 20), MAX_ITERATIONS)
+        self.assertLess(max_force_iterations(5000, 10000), MAX_ITERATIONS)
+        self.assertLessEqual(max_force_iterations(50000, 100000), 5)
+        self.assertEqual(max_force_iterations(10 ** 7, 0), 1)
+
+    def test_auto_layout_hierarchical(self):
+        """Test that the hierarchical auto-layout puts children below their parent"""
+        root = Node.objects.create(project=self.project, title='Root')
+        middle = Node.objects.create(project=self.project, title='Middle', parent_node=root)
+        leaf = Node.objects.create(project=self.project, title='Leaf', parent_node=middle)
+        for node in (root, leaf):
+            GraphNode.objects.create(graph=self.graph, node=node)
+
+        self.client.force_authenticate(user=self.user)
+        url = reverse('graph-auto-layout', kwargs={'pk': self.graph.pk})
+        response = self.client.post(url, {'algorithm': 'hierarchical', 'spacing': 50}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        root_layout = GraphNode.objects.get(graph=self.graph, node=root)
+        leaf_layout = GraphNode.objects.get(graph=self.graph, node=leaf)
+        # Middle is not on the canvas, so the leaf hangs directly from the root
+        self.assertEqual((root_layout.position_x, root_layout.position_y), (0, 0))
+        self.assertEqual((leaf_layout.position_x, leaf_layout.position_y), (0, 50))
+
+        response = self.client.post(url, {'algorithm': 'circular'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_layout_endpoint_rejects_nodes_outside_graph(self):
+        """Test that layout updates fail for nodes that are not in the graph"""
+        node = Node.objects.create(project=self.project, title='Loose')
+        self.client.force_authenticate(user=self.user)
+        url = reverse('graph-layout', kwargs={'pk': self.graph.pk})
+        response = self.client.patch(url, [{'node': node.id, 'x': 1, 'y': 2}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_layout_endpoint_rejects_too_many_items(self):
+        """Test that oversized layout updates are refused before their items are validated"""
+        self.client.force_authenticate(user=self.user)
+        url = reverse('graph-layout', kwargs={'pk': self.graph.pk})
+        response = self.client.patch(url, [{}] * (MAX_LAYOUT_ITEMS + 1), format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('detail', response.data)
+
+    def test_duplicate_graph(self):
+        """Test for duplicating a graph with its layout and connections"""
+        from apps.connections.models import ConnectionType, NodeConnection
+
+        first = Node.objects.create(project=self.project, title='First')
+        second = Node.objects.create(project=self.project, title='Second')
+        GraphNode.objects.create(graph=self.graph, node=first, position_x=10, position_y=20, color='#FF0000')
+        GraphNode.objects.create(graph=self.graph, node=second, position_x=30, position_y=40)
+        connection_type = ConnectionType.objects.create(project=self.project, name='Link')
+        NodeConnection.objects.create(
+            graph=self.graph, source_node=first, target_node=second, connection_type=connection_type, label='knows'
+        )
+
+        self.client.force_authenticate(user=self.user)
+        url = reverse('graph-duplicate', kwargs={'pk': self.graph.pk})
+        response = self.client.post(url, {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['name'], 'Test Graph (copy)')
+        self.assertEqual((response.data['node_count'], response.data['connection_count']), (2, 1))
+
+        copy = Graph.objects.get(pk=response.data['id'])
+        self.assertEqual(
+            set(copy.graph_nodes.values_list('node_id', 'position_x', 'position_y', 'color')),
+            set(self.graph.graph_nodes.values_list('node_id', 'position_x', 'position_y', 'color')),
+        )
+        self.assertEqual(
+            list(copy.connections.values_list('source_node_id', 'target_node_id', 'connection_type_id', 'label')),
+            [(first.id, second.id, connection_type.id, 'knows')],
+        )
+        self.project.refresh_from_db()
+        self.assertEqual((self.project.graph_count, self.project.connection_count), (2, 2))
+
+        # The copy is independent of the original
+        copy.graph_nodes.filter(node=first).update(position_x=99)
+        self.assertEqual(self.graph.graph_nodes.get(node=first).position_x, 10)
+
+        response = self.client.post(url, {}, format='json')
+        self.assertEqual(response.data['name'], 'Test Graph (copy 2)')
+        response = self.client.post(url, {'name': 'Test Graph'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def _analytics_chain(self):
+        """Builds a -> b -> c linked by 'Knows', plus a -> c by 'Hates' and a lone d"""
+        from apps.connections.models import ConnectionType, NodeConnection
+
+        nodes = [Node.objects.create(project=self.project, title=title) for title in 'abcd']
+        for node in nodes:
+            GraphNode.objects.create(graph=self.graph, node=node)
+        knows = ConnectionType.objects.create(project=self.project, name='Knows')
+        hates = ConnectionType.objects.create(project=self.project, name='Hates')
+        a, b, c, d = nodes
+        links = [
+            NodeConnection.objects.create(graph=self.graph, source_node=a, target_node=b, connection_type=knows),
+            NodeConnection.objects.create(graph=self.graph, source_node=b, target_node=c, connection_type=knows),
+            NodeConnection.objects.create(graph=self.graph, source_node=a, target_node=c, connection_type=hates),
+        ]
+        return nodes, links, knows
+
+    def test_analytics_shortest_path(self):
+        """Test for shortest paths, filtered by connection type and direction"""
+        (a, b, c, d), links, knows = self._analytics_chain()
+        self.client.force_authenticate(user=self.user)
+        url = reverse('graph-shortest-path', kwargs={'pk': self.graph.pk})
+
+        response = self.client.get(url, {'source': a.id, 'target': c.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['nodes'], [a.id, c.id])
+        self.assertEqual(response.data['connections'], [links[2].id])
+
+        response = self.client.get(url, {'source': a.id, 'target': c.id, 'connection_type': knows.id})
+        self.assertEqual(response.data['length'], 2)
+        self.assertEqual(response.data['nodes'], [a.id, b.id, c.id])
+        self.assertEqual(response.data['connections'], [links[0].id, links[1].id])
+
+        response = self.client.get(url, {'source': c.id, 'target': a.id, 'directed': 'true'})
+        self.assertFalse(response.data['found'])
+        response = self.client.get(url, {'source': a.id, 'target': d.id})
+        self.assertFalse(response.data['found'])
+
+        loose = Node.objects.create(project=self.project, title='Loose')
+        response = self.client.get(url, {'source': a.id, 'target': loose.id})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_analytics_neighborhood_and_components(self):
+        """Test for k-hop neighborhoods and connected components, refreshed on topology changes"""
+        from apps.connections.models import NodeConnection
+
+        (a, b, c, d), links, knows = self._analytics_chain()
+        self.client.force_authenticate(user=self.user)
+
+        url = reverse('graph-neighborhood', kwargs={'pk': self.graph.pk})
+        response = self.client.get(url, {'node': b.id, 'k': 1, 'directed': 'true'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['nodes'], [{'node': b.id, 'distance': 0}, {'node': c.id, 'distance': 1}])
+        response = self.client.get(url, {'node': b.id, 'k': 2, 'connection_type': knows.id})
+        distances = {item['node']: item['distance'] for item in response.data['nodes']}
+        self.assertEqual(distances, {a.id: 1, b.id: 0, c.id: 1})
+        response = self.client.get(url, {'node': b.id, 'k': 99})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        url = reverse('graph-components', kwargs={'pk': self.graph.pk})
+        response = self.client.get(url)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(response.data['components'][0], {'size': 3, 'nodes': [a.id, b.id, c.id]})
+        self.assertEqual(response.data['components'][1], {'size': 1, 'nodes': [d.id]})
+
+        # Moving a node leaves the topology as it is, so the cached adjacency is reused
+        with CaptureQueriesContext(connection) as cached:
+            self.client.get(url)
+        layout_url = reverse('graph-layout', kwargs={'pk': self.graph.pk})
+        for x in range(3):
+            self.client.patch(layout_url, [{'node': a.id, 'x': x, 'y': 20}], format='json')
+        with CaptureQueriesContext(connection) as after_moves:
+            self.client.get(url)
+        self.assertEqual(len(after_moves), len(cached))
+
+        # A new connection bumps the topology version, so the cached adjacency is not reused
+        NodeConnection.objects.create(graph=self.graph, source_node=c, target_node=d, connection_type=knows)
+        response = self.client.get(url)
+        self.assertEqual(response.data['count'], 1)
+
 
 class GraphNodeAPITest(APITestCase):
     """Tests for the API of nodos en graphs"""
@@ -347,3 +954,191 @@ class GraphNodeAPITest(APITestCase):
         response = self.client.delete(url)
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertEqual(GraphNode.objects.count(), 0)
+
+    def test_graph_node_centrality(self):
+        """Test for stored centrality scores on graph nodes, sortable and flagged stale after topology changes"""
+        from django.core.management import call_command
+        from apps.connections.models import ConnectionType, NodeConnection
+
+        leaves = [Node.objects.create(project=self.project, title=f'Leaf {i}') for i in range(3)]
+        for leaf in leaves:
+            GraphNode.objects.create(graph=self.graph, node=leaf)
+        connection_type = ConnectionType.objects.create(project=self.project, name='Link')
+        for leaf in leaves[:2]:
+            NodeConnection.objects.create(
+                graph=self.graph, source_node=leaf, target_node=self.node, connection_type=connection_type
+            )
+
+        self.client.force_authenticate(user=self.user)
+        url = reverse('graphnode-list')
+        # Reads never compute the scores
+        response = self.client.get(url, {'graph': self.graph.id})
+        self.assertTrue(all(item['centrality_stale'] and item['degree'] is None for item in get_response_data(response)))
+
+        call_command('compute_centrality', stdout=StringIO())
+        response = self.client.get(url, {'graph': self.graph.id, 'ordering': '-pagerank'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = get_response_data(response)
+        hub = data[0]
+        self.assertEqual(hub['node'], self.node.id)
+        self.assertEqual(hub['degree'], 2)
+        self.assertAlmostEqual(hub['betweenness'], 1 / 3)
+        self.assertAlmostEqual(sum(item['pagerank'] for item in data), 1.0)
+        self.assertFalse(any(item['centrality_stale'] for item in data))
+
+        # Moving a node changes the canvas version, not the topology
+        detail_url = reverse('graphnode-detail', kwargs={'pk': self.graph_node.pk})
+        self.client.patch(detail_url, {'position_x': 80}, format='json')
+        self.assertFalse(self.client.get(detail_url).data['centrality_stale'])
+
+        # Linking the last leaf does: the stored scores are served, flagged stale, until refreshed
+        NodeConnection.objects.create(
+            graph=self.graph, source_node=leaves[2], target_node=self.node, connection_type=connection_type
+        )
+        response = self.client.get(detail_url)
+        self.assertTrue(response.data['centrality_stale'])
+        self.assertEqual(response.data['degree'], 2)
+
+        call_command('compute_centrality', stdout=StringIO())
+        response = self.client.get(detail_url)
+        self.assertFalse(response.data['centrality_stale'])
+        self.assertEqual(response.data['degree'], 3)
+        self.assertAlmostEqual(response.data['betweenness'], 1.0)
+        # Current scores are left alone
+        out = StringIO()
+        call_command('compute_centrality', stdout=out)
+        self.assertIn('Refreshed 0 graph(s).', out.getvalue())
+
+        response = self.client.get(reverse('graphnode-detail', kwargs={'pk': 'abc'}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(LAYOUT_WRITE_BEHIND_MS=60000)
+class CanvasRealtimeTest(APITestCase):
+    """Tests for the real-time canvas WebSocket"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.other_user = User.objects.create_user(
+            username='otheruser',
+            email='other@example.com',
+            password='testpass123'
+        )
+        self.project = Project.objects.create(name='Test Project', owner=self.user)
+        self.graph = Graph.objects.create(project=self.project, name='Test Graph')
+        self.graph_nodes = [
+            GraphNode.objects.create(
+                graph=self.graph, node=Node.objects.create(project=self.project, title=f'Node {i}')
+            )
+            for i in range(2)
+        ]
+        self.graph.refresh_from_db()
+
+    def socket(self, user=None):
+        from asgiref.testing import ApplicationCommunicator
+        from rest_framework_simplejwt.tokens import AccessToken
+        from .realtime import websocket_application
+
+        query_string = f'token={AccessToken.for_user(user)}'.encode() if user else b''
+        return ApplicationCommunicator(websocket_application, {
+            'type': 'websocket', 'path': f'/ws/graphs/{self.graph.pk}/', 'query_string': query_string,
+        })
+
+    async def connect(self, socket):
+        await socket.send_input({'type': 'websocket.connect'})
+        return await socket.receive_output(timeout=2)
+
+    async def receive_json(self, socket):
+        import json
+        message = await socket.receive_output(timeout=2)
+        return json.loads(message['text'])
+
+    async def test_socket_requires_graph_access(self):
+        """Test that anonymous users and non-owners are rejected"""
+        for user in (None, self.other_user):
+            socket = self.socket(user)
+            self.assertEqual((await self.connect(socket))['type'], 'websocket.close')
+            await socket.wait()
+
+    async def test_socket_broadcasts_and_saves_moves(self):
+        """Test that moves reach other clients and are saved when the last client leaves"""
+        from asgiref.sync import sync_to_async
+
+        first, second = self.socket(self.user), self.socket(self.user)
+        for socket in (first, second):
+            self.assertEqual((await self.connect(socket))['type'], 'websocket.accept')
+            hello = await self.receive_json(socket)
+            self.assertEqual((hello['type'], hello['version']), ('hello', self.graph.version))
+
+        graph_node = self.graph_nodes[0]
+        for x in (10, 20, 30):
+            await first.send_input({'type': 'websocket.receive', 'text': f'{{"type": "move", "id": {graph_node.pk}, "x": {x}, "y": 5}}'})
+        positions = {}
+        while positions.get(graph_node.pk) != (30, 5):
+            message = await self.receive_json(second)
+            self.assertEqual(message['type'], 'moves')
+            positions.update((node['id'], (node['x'], node['y'])) for node in message['nodes'])
+
+        await first.send_input({'type': 'websocket.receive', 'text': '{"type": "move", "id": "x"}'})
+        message = await self.receive_json(first)
+        while message['type'] == 'moves':
+            # Moves are broadcast to their sender too
+            message = await self.receive_json(first)
+        self.assertEqual(message['type'], 'error')
+
+        for socket in (first, second):
+            await socket.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await socket.wait(timeout=2)
+        await sync_to_async(graph_node.refresh_from_db)()
+        self.assertEqual((graph_node.position_x, graph_node.position_y), (30, 5))
+
+    async def test_room_coalesces_moves(self):
+        """Test that a tick broadcasts only the latest position of each node"""
+        from .realtime import CanvasRoom, get_channel_layer, graph_group
+        from .write_behind import position_buffer
+
+        layer = get_channel_layer()
+        subscription = layer.subscribe(graph_group(self.graph.pk))
+        try:
+            room = CanvasRoom(self.graph.pk)
+            first, second = self.graph_nodes
+            room.move(first.pk, 1, 1)
+            room.move(second.pk, 2, 2)
+            room.move(first.pk, 3, 3)
+            room.broadcast()
+            room.broadcast()
+            message = await asyncio.wait_for(subscription.get(), 1)
+            self.assertEqual(message['nodes'], [{'id': first.pk, 'x': 3, 'y': 3}, {'id': second.pk, 'x': 2, 'y': 2}])
+            self.assertTrue(subscription.queue.empty())
+        finally:
+            layer.unsubscribe(subscription)
+            position_buffer.take()
+
+    async def test_committed_changes_are_published(self):
+        """Test that canvas changes are announced to subscribers once committed"""
+        from asgiref.sync import sync_to_async
+        from .realtime import get_channel_layer, graph_group
+
+        layer = get_channel_layer()
+        subscription = layer.subscribe(graph_group(self.graph.pk))
+        try:
+            graph_node = self.graph_nodes[0]
+
+            def move():
+                with self.captureOnCommitCallbacks(execute=True):
+                    graph_node.position_x = 50
+                    graph_node.save()
+                self.graph.refresh_from_db()
+
+            await sync_to_async(move)()
+            message = await asyncio.wait_for(subscription.get(), 1)
+            self.assertEqual(message, {
+                'type': 'change', 'version': self.graph.version, 'kind': 'node',
+                'ids': [graph_node.pk], 'deleted': False,
+            })
+        finally:
+            layer.unsubscribe(subscription)
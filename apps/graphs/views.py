@@ -1,11 +1,42 @@
-from rest_framework import viewsets, filters
+import numpy as np
+from django.db import transaction
+from django.db.models import BooleanField, ExpressionWrapper, F, Q
+from django.utils import timezone
+from django.utils.http import parse_etags
+from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from django_filters.rest_framework import DjangoFilterBackend
 
 from apps.connections.serializers import NodeConnectionSerializer
-from .models import Graph, GraphNode
-from .serializers import GraphSerializer, GraphNodeSerializer
+from apps.nodes.models import Node
+from apps.projects.export import EXPORT_RENDERERS, GraphExport, export_response
+from .analytics import get_adjacency
+from .clustering import MAX_ZOOM, build_clusters, parse_zoom
+from .duplication import duplicate_graph
+from .hierarchy import MAX_COLLAPSED, CollapsedCanvas, parse_collapse
+from .layout import force_directed_layout, hierarchical_layout, max_force_iterations
+from .canvas_json import PrerenderedJSONResponse, build_canvas_json, supports_canvas_json
+from .canvas_formats import ColumnarCanvasRenderer, PackedCanvasRenderer, build_columnar_canvas
+from .models import CanvasChange, Graph, GraphNode
+from .spatial import filter_viewport, parse_bbox
+from .write_behind import position_buffer
+from .serializers import (
+    GraphSerializer, GraphNodeSerializer, GraphNodeWithCentralitySerializer,
+    GraphLayoutItemSerializer, AutoLayoutSerializer, GraphDuplicateSerializer,
+    GraphAnalyticsQuerySerializer, ShortestPathQuerySerializer, NeighborhoodQuerySerializer,
+)
+
+MAX_LAYOUT_ITEMS = 10000
+
+# Canvas representations other than the default JSON (keyed by renderer format)
+COMPACT_CANVAS_FORMATS = {ColumnarCanvasRenderer.format, PackedCanvasRenderer.format}
+
+# Layout payload key -> GraphNode field
+LAYOUT_FIELDS = {'x': 'position_x', 'y': 'position_y', 'color': 'color'}
 
 
 class GraphViewSet(viewsets.ModelViewSet):
@@ -22,32 +53,458 @@ class GraphViewSet(viewsets.ModelViewSet):
             return Graph.objects.none()
         return Graph.objects.filter(project__owner=user)
 
-    @action(detail=True, methods=['get'])
+    def get_canvas_graph(self):
+        """The graph, after writing its buffered deferred positions (see write_behind.py)."""
+        graph = self.get_object()
+        if position_buffer.flush(graph.pk):
+            graph.refresh_from_db()
+        return graph
+
+    @action(
+        detail=True,
+        methods=['get'],
+        renderer_classes=api_settings.DEFAULT_RENDERER_CLASSES + [ColumnarCanvasRenderer, PackedCanvasRenderer],
+    )
     def canvas(self, request, pk=None):
-        """Returns nodes (with layout) and connections for the graph in a single response."""
+        """
+        Returns nodes (with layout) and connections for the graph in a single response.
+
+        Compact representations are negotiated via Accept or ?format= (see
+        canvas_formats.py): ``columnar`` JSON arrays or ``packed`` binary.
+
+        ``?bbox=x0,y0,x1,y1`` restricts the nodes to that viewport (answered
+        from the spatial index, see spatial.py) and the connections to those
+        touching a visible node.
+
+        ``?collapse=<node id>,...`` draws each named node, with every graph node
+        inside it, as one super-node (see hierarchy.py): ``nodes`` and
+        ``connections`` keep only what lies outside the collapsed nodes, and the
+        response adds ``collapsed`` (the super-nodes) and
+        ``aggregated_connections`` (connections touching them, counted per
+        source, target and connection type). JSON only; not combinable with bbox.
+
+        ``?zoom=<0..12>`` returns, instead of nodes and connections, the nodes
+        clustered into a 2^zoom x 2^zoom grid with the connection counts between
+        clusters (see clustering.py), cached per graph version. JSON only; not
+        combinable with bbox or collapse.
+
+        The response carries an ETag derived from the graph version; a matching
+        If-None-Match is answered with 304 without reading nodes or connections.
+        Collapsed canvases have no ETag: moving nodes in the hierarchy does not
+        change the graph version.
+        """
+        graph = self.get_canvas_graph()
+
+        bbox = request.query_params.get('bbox')
+        if bbox is not None:
+            try:
+                bbox = parse_bbox(bbox)
+            except ValueError:
+                raise ValidationError({'bbox': 'Expected x0,y0,x1,y1 with x0 <= x1 and y0 <= y1.'})
+
+        representation = request.accepted_renderer.format
+        compact = representation in COMPACT_CANVAS_FORMATS
+
+        hierarchy = None
+        collapse = request.query_params.get('collapse')
+        if collapse is not None:
+            if bbox is not None or compact:
+                raise ValidationError({'collapse': 'Cannot be combined with bbox or a compact format.'})
+            try:
+                hierarchy = CollapsedCanvas(graph, parse_collapse(collapse))
+            except ValueError:
+                raise ValidationError({'collapse': f'Expected up to {MAX_COLLAPSED} ids of nodes of this project.'})
+
+        zoom = request.query_params.get('zoom')
+        if zoom is not None:
+            if bbox is not None or compact or hierarchy is not None:
+                raise ValidationError({'zoom': 'Cannot be combined with bbox, collapse or a compact format.'})
+            try:
+                zoom = parse_zoom(zoom)
+            except ValueError:
+                raise ValidationError({'zoom': f'Expected an integer from 0 to {MAX_ZOOM}.'})
+
+        if hierarchy is None:
+            if compact:
+                variant = representation
+            elif zoom is not None:
+                variant = f'zoom{zoom}'
+            else:
+                variant = None
+            etag = graph.get_canvas_etag(variant)
+            headers = {'ETag': etag, 'Cache-Control': 'private, no-cache', 'Vary': 'Accept'}
+            if_none_match = request.headers.get('If-None-Match')
+            if if_none_match:
+                etags = parse_etags(if_none_match)
+                if '*' in etags or etag in etags:
+                    return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        else:
+            headers = {'Cache-Control': 'private, no-cache', 'Vary': 'Accept'}
+
+        if zoom is not None:
+            return Response({'graph': GraphSerializer(graph).data, **build_clusters(graph, zoom)}, headers=headers)
+
+        graph_nodes = graph.graph_nodes.all()
+        connections = graph.connections.all()
+        extra = {}
+        if hierarchy is not None:
+            graph_nodes = hierarchy.visible_graph_nodes(graph_nodes)
+            connections = hierarchy.direct_connections(connections)
+            extra = {
+                'collapsed': hierarchy.super_nodes(),
+                'aggregated_connections': hierarchy.aggregated_connections(),
+            }
+        if bbox is not None:
+            graph_nodes = filter_viewport(graph_nodes, bbox)
+            visible_node_ids = graph_nodes.values('node_id')
+            connections = connections.filter(
+                Q(source_node_id__in=visible_node_ids) | Q(target_node_id__in=visible_node_ids)
+            )
+
+        if compact:
+            data = build_columnar_canvas(graph_nodes, connections)
+            data['graph'] = GraphSerializer(graph).data
+            return Response(data, headers=headers)
+
+        if representation == JSONRenderer.format and supports_canvas_json(graph_nodes.db):
+            # Rows rendered and aggregated by the database (see canvas_json.py)
+            renderer = JSONRenderer()
+            body = build_canvas_json(
+                renderer.render(GraphSerializer(graph).data), graph_nodes, connections,
+                extra={key: renderer.render(value) for key, value in extra.items()},
+            )
+            return PrerenderedJSONResponse(body, headers=headers)
+
+        graph_nodes = graph_nodes.select_related('node')
+        connections = connections.select_related('source_node', 'target_node', 'connection_type')
+
+        return Response({
+            'graph': GraphSerializer(graph).data,
+            'nodes': GraphNodeSerializer(graph_nodes, many=True).data,
+            'connections': NodeConnectionSerializer(connections, many=True).data,
+            **extra,
+        }, headers=headers)
+
+    @action(detail=True, methods=['get'], renderer_classes=EXPORT_RENDERERS)
+    def export(self, request, pk=None):
+        """
+        Streams the graph: its nodes with their layout, connection types and connections.
+
+        Format via ?format= or Accept: jsonl (default), graphml or gexf. See apps/projects/export.py.
+        """
+        graph = self.get_object()
+        return export_response(GraphExport(graph), request.accepted_renderer)
+
+    @action(detail=True, methods=['post'])
+    def duplicate(self, request, pk=None):
+        """
+        Copies the graph with its node layout and connections.
+
+        Body (optional): {"name": "..."}; defaults to "<name> (copy)".
+        Rows are copied with INSERT ... SELECT in one transaction (see duplication.py).
+        """
         graph = self.get_object()
+        serializer = GraphDuplicateSerializer(data=request.data, context={'graph': graph})
+        serializer.is_valid(raise_exception=True)
+        # Copy the latest positions, buffered ones included
+        position_buffer.flush(graph.pk)
+        copy = duplicate_graph(graph, serializer.validated_data.get('name'))
+        return Response(GraphSerializer(copy).data, status=status.HTTP_201_CREATED)
 
-        graph_nodes = graph.graph_nodes.select_related('node').all()
+    @action(detail=True, methods=['get'], url_path='canvas/changes')
+    def canvas_changes(self, request, pk=None):
+        """
+        Returns what changed on the canvas since a version the client already has.
+
+        Query params:
+        - since: a graph version previously read from the canvas (graph.version)
+
+        Response: the graph, its current version, the graph nodes and connections
+        added or updated since then, and the ids of those removed (tombstones).
+        """
+        graph = self.get_canvas_graph()
+
+        try:
+            since = int(request.query_params.get('since', ''))
+        except ValueError:
+            since = 0
+        if since < 1 or since > graph.version:
+            raise ValidationError({'since': f'Must be a graph version between 1 and {graph.version}.'})
+
+        changes = graph.canvas_changes.filter(version__gt=since)
+
+        def changed_ids(kind):
+            return changes.filter(kind=kind, deleted=False).values('object_id')
+
+        def removed_ids(kind):
+            return list(changes.filter(kind=kind, deleted=True).values_list('object_id', flat=True))
+
+        graph_nodes = graph.graph_nodes.select_related('node').filter(
+            pk__in=changed_ids(CanvasChange.KIND_NODE)
+        )
         connections = graph.connections.select_related(
             'source_node', 'target_node', 'connection_type'
-        ).all()
+        ).filter(pk__in=changed_ids(CanvasChange.KIND_CONNECTION))
 
         return Response({
             'graph': GraphSerializer(graph).data,
+            'version': graph.version,
+            'since': since,
             'nodes': GraphNodeSerializer(graph_nodes, many=True).data,
             'connections': NodeConnectionSerializer(connections, many=True).data,
+            'removed_nodes': removed_ids(CanvasChange.KIND_NODE),
+            'removed_connections': removed_ids(CanvasChange.KIND_CONNECTION),
+        })
+
+    @action(detail=True, methods=['patch'])
+    def layout(self, request, pk=None):
+        """
+        Moves/recolors many nodes of the graph at once.
+
+        Body: [{"node": <node id>, "x": ..., "y": ..., "color": "#RRGGBB"}, ...]
+        (x, y and color are each optional). Membership is checked with one
+        query and positions are written with bulk_update.
+
+        With ``?defer=true`` (positions only: every item needs x and y, no
+        color) the positions go to the write-behind buffer and the response is
+        ``202 Accepted`` before they are written; see write_behind.py for when
+        they are flushed and what that guarantees.
+        """
+        graph = self.get_object()
+        defer = request.query_params.get('defer', '').lower() in ('1', 'true')
+
+        # Checked before validation, which would otherwise run over the whole body
+        if isinstance(request.data, list) and len(request.data) > MAX_LAYOUT_ITEMS:
+            raise ValidationError({'detail': f'At most {MAX_LAYOUT_ITEMS} nodes per request.'})
+        serializer = GraphLayoutItemSerializer(data=request.data, many=True, allow_empty=False)
+        serializer.is_valid(raise_exception=True)
+        items = {item['node']: item for item in serializer.validated_data}
+        if defer and any('color' in item or 'x' not in item or 'y' not in item for item in items.values()):
+            raise ValidationError({'detail': 'Deferred updates take positions only: "x" and "y" for every node.'})
+
+        graph_nodes = list(graph.graph_nodes.filter(node_id__in=items).only('id', 'node_id', 'graph_id'))
+        missing = set(items) - {graph_node.node_id for graph_node in graph_nodes}
+        if missing:
+            raise ValidationError({'node': [f'Nodes not in this graph: {sorted(missing)}']})
+
+        if defer:
+            position_buffer.add(graph.pk, {
+                graph_node.pk: (items[graph_node.node_id]['x'], items[graph_node.node_id]['y'])
+                for graph_node in graph_nodes
+            })
+            return Response({'accepted': len(graph_nodes)}, status=status.HTTP_202_ACCEPTED)
+
+        # Buffered positions are older than these: write them first so they cannot overwrite them later
+        position_buffer.flush(graph.pk)
+
+        # bulk_update writes the same columns for every row, so group by the fields each item sets
+        now = timezone.now()
+        groups = {}
+        for graph_node in graph_nodes:
+            item = items[graph_node.node_id]
+            fields = tuple(field for key, field in LAYOUT_FIELDS.items() if key in item)
+            for key, field in LAYOUT_FIELDS.items():
+                if key in item:
+                    setattr(graph_node, field, item[key])
+            graph_node.updated_at = now
+            groups.setdefault(fields, []).append(graph_node)
+
+        with transaction.atomic():
+            for fields, group in groups.items():
+                GraphNode.objects.bulk_update(group, list(fields) + ['updated_at'], batch_size=500)
+            # bulk_update sends no signals
+            CanvasChange.record(graph.pk, CanvasChange.KIND_NODE, [graph_node.pk for graph_node in graph_nodes])
+
+        return Response({'updated': len(graph_nodes)})
+
+    @action(detail=True, methods=['post'], url_path='layout/auto')
+    def auto_layout(self, request, pk=None):
+        """
+        Computes positions for every node of the graph and saves them.
+
+        Body (all optional): {"algorithm": "force" | "hierarchical", "iterations": 50, "spacing": 100}
+        ``force`` lays nodes out along the graph's connections; ``hierarchical``
+        draws the parent_node tree (nodes whose parent is not in the graph
+        hang from their nearest ancestor that is). ``iterations`` is capped by
+        graph size (max_force_iterations); the response reports the count run.
+        See layout.py.
+        """
+        graph = self.get_object()
+        serializer = AutoLayoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        options = serializer.validated_data
+        # Written before the layout is computed from them, and so never over it
+        position_buffer.flush(graph.pk)
+
+        rows = list(graph.graph_nodes.order_by('id').values_list(
+            'id', 'node_id', 'position_x', 'position_y', 'node__path'
+        ))
+        row_by_node = {node_id: row for row, (_, node_id, _, _, _) in enumerate(rows)}
+
+        if options['algorithm'] == 'hierarchical':
+            parents = []
+            for _, _, _, _, path in rows:
+                ancestors = [int(part) for part in path.split(Node.PATH_SEPARATOR) if part]
+                parents.append(next(
+                    (row_by_node[ancestor] for ancestor in reversed(ancestors) if ancestor in row_by_node), -1
+                ))
+            positions = hierarchical_layout(parents, spacing=options['spacing'])
+        else:
+            edges = [
+                (row_by_node[source], row_by_node[target])
+                for source, target in graph.connections.values_list('source_node_id', 'target_node_id')
+                if source in row_by_node and target in row_by_node
+            ]
+            # Large graphs get fewer iterations, so the request stays bounded
+            iterations = min(options['iterations'], max_force_iterations(len(rows), len(edges)))
+            positions = force_directed_layout(
+                [(x, y) for _, _, x, y, _ in rows],
+                edges,
+                iterations=iterations,
+                spacing=options['spacing'],
+            )
+
+        now = timezone.now()
+        graph_nodes = [
+            GraphNode(pk=graph_node_id, position_x=float(x), position_y=float(y), updated_at=now)
+            for (graph_node_id, *_), (x, y) in zip(rows, positions)
+        ]
+        with transaction.atomic():
+            GraphNode.objects.bulk_update(graph_nodes, ['position_x', 'position_y', 'updated_at'], batch_size=500)
+            # bulk_update sends no signals
+            CanvasChange.record(graph.pk, CanvasChange.KIND_NODE, [graph_node.pk for graph_node in graph_nodes])
+
+        response = {'algorithm': options['algorithm'], 'updated': len(graph_nodes)}
+        if options['algorithm'] == 'force':
+            response['iterations'] = iterations
+        return Response(response)
+
+    def _analytics_params(self, request, serializer_class):
+        serializer = serializer_class(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data
+
+    def _adjacency_row(self, adjacency, node_id, field):
+        row = adjacency.row_of(node_id)
+        if row is None:
+            raise ValidationError({field: ['Node is not in this graph.']})
+        return row
+
+    @action(detail=True, methods=['get'], url_path='analytics/shortest-path')
+    def shortest_path(self, request, pk=None):
+        """
+        Returns a shortest path (fewest connections) between two nodes of the graph.
+
+        Query params:
+        - source, target: node ids (required, must be on the canvas)
+        - connection_type: only follow connections of these types (repeatable)
+        - directed: follow connections from source to target only (default false)
+
+        Response: {"found": bool, "length": hops, "nodes": [node ids], "connections": [connection ids]}
+        """
+        graph = self.get_object()
+        params = self._analytics_params(request, ShortestPathQuerySerializer)
+        adjacency = get_adjacency(graph)
+        source = self._adjacency_row(adjacency, params['source'], 'source')
+        target = self._adjacency_row(adjacency, params['target'], 'target')
+
+        mask = adjacency.entry_mask(params.get('connection_type'), params['directed'])
+        path = adjacency.shortest_path(source, target, mask=mask)
+        if path is None:
+            return Response({'found': False, 'length': None, 'nodes': [], 'connections': []})
+        nodes, connections = path
+        return Response({'found': True, 'length': len(connections), 'nodes': nodes, 'connections': connections})
+
+    @action(detail=True, methods=['get'], url_path='analytics/neighborhood')
+    def neighborhood(self, request, pk=None):
+        """
+        Returns the nodes within k connections of a node.
+
+        Query params:
+        - node: node id (required, must be on the canvas)
+        - k: number of hops, 1-6 (default 1)
+        - connection_type, directed: as for shortest-path
+
+        Response: {"node": id, "k": k, "nodes": [{"node": id, "distance": hops}, ...]}
+        ordered by distance; the node itself is included at distance 0.
+        """
+        graph = self.get_object()
+        params = self._analytics_params(request, NeighborhoodQuerySerializer)
+        adjacency = get_adjacency(graph)
+        row = self._adjacency_row(adjacency, params['node'], 'node')
+
+        mask = adjacency.entry_mask(params.get('connection_type'), params['directed'])
+        distance, _ = adjacency.bfs(row, max_depth=params['k'], mask=mask)
+        reached = np.flatnonzero(distance >= 0)
+        reached = reached[np.argsort(distance[reached], kind='stable')]
+        return Response({
+            'node': params['node'],
+            'k': params['k'],
+            'nodes': [
+                {'node': int(node_id), 'distance': int(hops)}
+                for node_id, hops in zip(adjacency.node_ids[reached], distance[reached])
+            ],
+        })
+
+    @action(detail=True, methods=['get'], url_path='analytics/components')
+    def components(self, request, pk=None):
+        """
+        Returns the connected components of the graph, largest first.
+
+        Query params:
+        - connection_type: only count connections of these types (repeatable)
+
+        Connection direction is ignored. Response:
+        {"count": n, "components": [{"size": s, "nodes": [node ids]}, ...]}
+        """
+        graph = self.get_object()
+        params = self._analytics_params(request, GraphAnalyticsQuerySerializer)
+        adjacency = get_adjacency(graph)
+
+        labels = adjacency.components(mask=adjacency.entry_mask(params.get('connection_type')))
+        order = np.argsort(labels, kind='stable')
+        groups = np.split(adjacency.node_ids[order], np.flatnonzero(np.diff(labels[order])) + 1)
+        groups = sorted((group for group in groups if len(group)), key=len, reverse=True)
+        return Response({
+            'count': len(groups),
+            'components': [{'size': len(group), 'nodes': group.tolist()} for group in groups],
         })
 
 
 class GraphNodeViewSet(viewsets.ModelViewSet):
-    serializer_class = GraphNodeSerializer
+    """
+    Graph nodes, with their centrality scores (degree, pagerank, betweenness).
+
+    Scores are read as stored. ``centrality_stale`` tells whether the graph's
+    topology changed since they were computed; they are refreshed by the
+    compute_centrality command, not by these reads (see centrality.py).
+    """
+
+    serializer_class = GraphNodeWithCentralitySerializer
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['graph', 'node']
-    ordering_fields = ['created_at', 'updated_at']
+    ordering_fields = ['created_at', 'updated_at', 'degree', 'pagerank', 'betweenness']
     ordering = ['-updated_at']
 
     def get_queryset(self):
         user = getattr(self.request, 'user', None)
         if not user or not user.is_authenticated:
             return GraphNode.objects.none()
-        return GraphNode.objects.select_related('graph', 'node').filter(graph__project__owner=user)
+        return GraphNode.objects.select_related('graph', 'node').filter(graph__project__owner=user).annotate(
+            degree=F('centrality__degree'),
+            pagerank=F('centrality__pagerank'),
+            betweenness=F('centrality__betweenness'),
+            centrality_stale=ExpressionWrapper(
+                ~Q(graph__centrality_version=F('graph__topology_version')), output_field=BooleanField()
+            ),
+        )
+
+    def get_object(self):
+        graph_node = super().get_object()
+        if self.action in ('update', 'partial_update'):
+            # Buffered positions are older than this update: write them first, and
+            # reload them so saving the other fields does not put the old ones back
+            # (see write_behind.py)
+            if position_buffer.flush(graph_node.graph_id):
+                graph_node.refresh_from_db(fields=['position_x', 'position_y'])
+        return graph_node
@@ -0,0 +1,144 @@
+"""
+Write-behind buffer for graph node positions.
+
+High-frequency position updates (``PATCH layout/?defer=true`` and WebSocket
+moves, see realtime.py) are not written one by one. They are kept in a
+per-process buffer, where the latest position of each graph node wins, and
+written in one bulk UPDATE per graph:
+
+- at most ``LAYOUT_WRITE_BEHIND_MS`` after the first buffered update;
+- as soon as ``LAYOUT_WRITE_BEHIND_MAX`` graph nodes are pending;
+- before a canvas of that graph is read in this process, which gives
+  read-your-writes for clients served by the same process;
+- before any other write of positions to that graph in this process (layout,
+  auto-layout, graph node updates) and before it is duplicated, so an older
+  buffered position never lands on top of a newer one;
+- when the last WebSocket client of a graph leaves, and at interpreter exit.
+
+Flushes of one graph are serialized: ``flush()`` waits for a batch the timer
+thread already took but has not finished writing.
+
+Durability: an acknowledged deferred update is NOT yet durable. It is lost if
+the process dies before the next flush, and a flush that fails is logged and
+dropped instead of retried. Clients of other processes see it (and the graph
+version bumps) only once it is flushed. Use the plain layout update for
+changes that must be durable when acknowledged, such as the final position of
+a drag.
+
+All of these ordering guarantees hold within one process only. A write
+served by another process may still be overwritten by positions buffered
+here, which are flushed later.
+"""
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.utils import timezone
+
+from .models import CanvasChange, GraphNode
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_MS = 200
+DEFAULT_MAX_PENDING = 10000
+
+
+def save_positions(graph_id, positions):
+    """Writes {graph node id: (x, y)} for the graph's nodes in one transaction; returns the count."""
+    ids = list(GraphNode.objects.filter(graph_id=graph_id, pk__in=list(positions)).values_list('pk', flat=True))
+    if not ids:
+        return 0
+    now = timezone.now()
+    graph_nodes = [
+        GraphNode(pk=pk, position_x=positions[pk][0], position_y=positions[pk][1], updated_at=now)
+        for pk in ids
+    ]
+    with transaction.atomic():
+        GraphNode.objects.bulk_update(graph_nodes, ['position_x', 'position_y', 'updated_at'], batch_size=500)
+        # bulk_update sends no signals
+        CanvasChange.record(graph_id, CanvasChange.KIND_NODE, ids)
+    return len(ids)
+
+
+class PositionBuffer:
+    """Pending positions per graph, flushed by a timer thread; safe to use from any thread."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.size = 0
+        self.timer = None
+        # Held across take and save of a graph's batch (see flush)
+        self.graph_locks = {}
+
+    def add(self, graph_id, positions):
+        """Buffers {graph node id: (x, y)} for a graph; returns immediately."""
+        with self.lock:
+            graph_positions = self.pending.setdefault(graph_id, {})
+            before = len(graph_positions)
+            graph_positions.update(positions)
+            self.size += len(graph_positions) - before
+            if self.size >= getattr(settings, 'LAYOUT_WRITE_BEHIND_MAX', DEFAULT_MAX_PENDING):
+                self._schedule(0)
+            elif self.timer is None:
+                self._schedule(getattr(settings, 'LAYOUT_WRITE_BEHIND_MS', DEFAULT_FLUSH_MS) / 1000)
+
+    def _schedule(self, delay):
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer = threading.Timer(delay, self._flush_in_background)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def take(self, graph_id=None):
+        """Removes and returns the pending positions ({graph id: positions}) of one graph or all."""
+        with self.lock:
+            if graph_id is None:
+                taken, self.pending = self.pending, {}
+            else:
+                taken = {graph_id: self.pending.pop(graph_id)} if graph_id in self.pending else {}
+            self.size -= sum(len(positions) for positions in taken.values())
+            if not self.pending and self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        return taken
+
+    def flush(self, graph_id=None):
+        """
+        Writes the pending positions of one graph (or all) now; returns the number
+        of rows written. Also waits for a flush of the graph already in progress,
+        so once it returns no older buffered position can still be written.
+        """
+        if graph_id is not None:
+            return self._flush_graph(graph_id)
+        with self.lock:
+            graph_ids = list(self.pending)
+        return sum(self._flush_graph(pk) for pk in graph_ids)
+
+    def _flush_graph(self, graph_id):
+        with self.lock:
+            graph_lock = self.graph_locks.setdefault(graph_id, threading.Lock())
+        with graph_lock:
+            positions = self.take(graph_id).get(graph_id)
+            return save_positions(graph_id, positions) if positions else 0
+
+    def _flush_in_background(self):
+        with self.lock:
+            if self.timer is threading.current_thread():
+                self.timer = None
+            graph_ids = list(self.pending)
+        try:
+            for graph_id in graph_ids:
+                try:
+                    self._flush_graph(graph_id)
+                except DatabaseError:
+                    logger.exception('Could not flush buffered positions of graph %s', graph_id)
+        finally:
+            # The timer thread is not a request thread: nothing else closes its connection
+            connections.close_all()
+
+
+position_buffer = PositionBuffer()
+atexit.register(position_buffer.flush)
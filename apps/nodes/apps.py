@@ -1,7 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class NodesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.nodes'
 
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .search import install_search_triggers
+
+        post_migrate.connect(install_search_triggers, sender=self)
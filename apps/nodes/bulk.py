@@ -0,0 +1,250 @@
+"""
+Bulk create/update/delete of nodes.
+
+Every item is validated in one pass against a single batched lookup of the
+projects and nodes the request references, then all writes run in one
+transaction with bulk_create/bulk_update. If any item is invalid nothing is
+written and the per-item results say why.
+"""
+from collections import Counter
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from apps.projects.models import Project
+from .models import Node
+from .serializers import NodeBulkCreateSerializer, NodeBulkUpdateSerializer
+
+MAX_BULK_OPERATIONS = 20000
+BATCH_SIZE = 500
+
+UPDATABLE_FIELDS = ['title', 'node_type', 'content']
+
+
+def _in_batches(values, size=BATCH_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _get_operations(data):
+    """Extracts the three operation lists, rejecting malformed or oversized requests."""
+    if not isinstance(data, dict):
+        raise ValidationError({'detail': 'Expected an object with create, update and/or delete lists.'})
+
+    operations = {}
+    for key in ('create', 'update', 'delete'):
+        items = data.get(key, [])
+        if not isinstance(items, list):
+            raise ValidationError({key: 'Expected a list.'})
+        operations[key] = items
+
+    total = sum(len(items) for items in operations.values())
+    if total == 0:
+        raise ValidationError({'detail': 'No operations given.'})
+    if total > MAX_BULK_OPERATIONS:
+        raise ValidationError({'detail': f'At most {MAX_BULK_OPERATIONS} operations per request.'})
+    return operations['create'], operations['update'], operations['delete']
+
+
+def _validate_fields(serializer_class, items):
+    """Runs field-level validation; returns (validated_data or None, errors or None) per item."""
+    validated = []
+    for item in items:
+        serializer = serializer_class(data=item)
+        if serializer.is_valid():
+            validated.append((serializer.validated_data, None))
+        else:
+            validated.append((None, serializer.errors))
+    return validated
+
+
+def _parse_delete_ids(items):
+    parsed = []
+    for item in items:
+        if isinstance(item, int) and not isinstance(item, bool):
+            parsed.append((item, None))
+        else:
+            parsed.append((None, {'id': ['A valid integer is required.']}))
+    return parsed
+
+
+def _load_references(user, creates, updates, deletes):
+    """Fetches every owned project and node referenced by the request, in batches."""
+    project_ids = {attrs['project'] for attrs, _ in creates if attrs}
+    node_ids = {pk for pk, _ in deletes if pk is not None}
+    for attrs, _ in creates + updates:
+        if attrs and attrs.get('parent_node') is not None:
+            node_ids.add(attrs['parent_node'])
+    node_ids.update(attrs['id'] for attrs, _ in updates if attrs)
+
+    projects = set()
+    for batch in _in_batches(project_ids):
+        projects.update(Project.objects.filter(owner=user, id__in=batch).values_list('id', flat=True))
+
+    nodes = {}
+    for batch in _in_batches(node_ids):
+        nodes.update(
+            (node.id, node)
+            for node in Node.objects.filter(project__owner=user, id__in=batch).only(
+                'id', 'project_id', 'parent_node_id', 'path', 'depth'
+            )
+        )
+    return projects, nodes
+
+
+def apply_bulk_operations(user, data):
+    """
+    Validates and applies a bulk request for ``user``.
+
+    Returns ``(results, applied)`` where results mirrors the request shape with
+    one entry per item, and applied is False when nothing was written.
+    """
+    raw_creates, raw_updates, raw_deletes = _get_operations(data)
+    creates = _validate_fields(NodeBulkCreateSerializer, raw_creates)
+    updates = _validate_fields(NodeBulkUpdateSerializer, raw_updates)
+    deletes = _parse_delete_ids(raw_deletes)
+
+    projects, nodes = _load_references(user, creates, updates, deletes)
+    delete_ids = {pk for pk, errors in deletes if errors is None}
+
+    def check_parent(parent_id, project_id, node_id=None):
+        if parent_id is None:
+            return None
+        parent = nodes.get(parent_id)
+        if parent is None:
+            return 'Parent node not found.'
+        if parent.project_id != project_id:
+            return 'Parent node must belong to the same project.'
+        if parent_id in delete_ids:
+            return 'Parent node is being deleted in this request.'
+        if node_id is not None and (parent_id == node_id or node_id in parent.get_ancestor_ids()):
+            return 'Cyclic parent relationship is not allowed.'
+        return None
+
+    create_errors = []
+    for attrs, errors in creates:
+        if errors is None:
+            errors = {}
+            if attrs['project'] not in projects:
+                errors['project'] = ['Project not found.']
+            else:
+                parent_error = check_parent(attrs.get('parent_node'), attrs['project'])
+                if parent_error:
+                    errors['parent_node'] = [parent_error]
+        create_errors.append(errors or None)
+
+    update_errors = []
+    seen_update_ids = set()
+    for attrs, errors in updates:
+        if errors is None:
+            errors = {}
+            node = nodes.get(attrs['id'])
+            if node is None:
+                errors['id'] = ['Node not found.']
+            elif attrs['id'] in seen_update_ids:
+                errors['id'] = ['Node is updated more than once in this request.']
+            elif attrs['id'] in delete_ids:
+                errors['id'] = ['Node is also being deleted in this request.']
+            elif 'parent_node' in attrs:
+                parent_error = check_parent(attrs['parent_node'], node.project_id, node.id)
+                if parent_error:
+                    errors['parent_node'] = [parent_error]
+            seen_update_ids.add(attrs['id'])
+        update_errors.append(errors or None)
+
+    delete_errors = []
+    for pk, errors in deletes:
+        if errors is None and pk not in nodes:
+            errors = {'id': ['Node not found.']}
+        delete_errors.append(errors)
+
+    if any(create_errors) or any(update_errors) or any(delete_errors):
+        return {
+            'create': [_failed(errors) for errors in create_errors],
+            'update': [_failed(errors) for errors in update_errors],
+            'delete': [_failed(errors) for errors in delete_errors],
+        }, False
+
+    try:
+        with transaction.atomic():
+            created = _create_nodes([attrs for attrs, _ in creates], nodes)
+            _update_nodes([attrs for attrs, _ in updates], nodes)
+            for batch in _in_batches(delete_ids):
+                Node.objects.filter(id__in=batch).delete()
+    except DjangoValidationError as e:
+        # A reparent became invalid because of another reparent in the same request
+        raise ValidationError({'detail': e.messages})
+
+    return {
+        'create': [{'status': 'created', 'id': node.id} for node in created],
+        'update': [{'status': 'updated', 'id': attrs['id']} for attrs, _ in updates],
+        'delete': [{'status': 'deleted', 'id': pk} for pk, _ in deletes],
+    }, True
+
+
+def _failed(errors):
+    if errors:
+        return {'status': 'error', 'errors': errors}
+    return {'status': 'not_applied'}
+
+
+def _create_nodes(items, nodes):
+    new_nodes = []
+    for attrs in items:
+        node = Node(
+            project_id=attrs['project'],
+            parent_node_id=attrs.get('parent_node'),
+            title=attrs['title'],
+            node_type=attrs.get('node_type', 'note'),
+            content=attrs.get('content', ''),
+        )
+        # bulk_create bypasses save(), so fill the ancestor index here
+        if node.parent_node_id is not None:
+            parent = nodes[node.parent_node_id]
+            node.path, node.depth = Node.child_path(parent.id, parent.path, parent.depth)
+        new_nodes.append(node)
+    created = Node.objects.bulk_create(new_nodes, batch_size=BATCH_SIZE)
+
+    # bulk_create sends no signals: bump the project counters here
+    for project_id, count in Counter(node.project_id for node in created).items():
+        Project.objects.filter(pk=project_id).adjust_counters(node_count=count)
+    return created
+
+
+def _update_nodes(items, nodes):
+    now = timezone.now()
+
+    # bulk_update writes the same columns for every row, so group items by the fields they set
+    groups = {}
+    for attrs in items:
+        fields = tuple(field for field in UPDATABLE_FIELDS if field in attrs)
+        node = nodes[attrs['id']]
+        for field in fields:
+            setattr(node, field, attrs[field])
+        node.updated_at = now
+        groups.setdefault(fields, []).append(node)
+
+    for fields, group in groups.items():
+        Node.objects.bulk_update(group, list(fields) + ['updated_at'], batch_size=BATCH_SIZE)
+
+    # bulk_update sends no signals: log renamed/retyped nodes on the canvases showing them
+    from apps.graphs.signals import CANVAS_NODE_FIELDS, record_node_changes
+
+    changed_ids = [attrs['id'] for attrs in items if CANVAS_NODE_FIELDS & set(attrs)]
+    for batch in _in_batches(changed_ids):
+        record_node_changes(batch)
+
+    # Reparents go through save() so the whole moved subtree gets its path rewritten
+    for attrs in items:
+        node = nodes[attrs['id']]
+        if 'parent_node' in attrs and attrs['parent_node'] != node.parent_node_id:
+            parent = None
+            if attrs['parent_node'] is not None:
+                parent = Node.objects.only('id', 'project_id', 'path', 'depth').get(pk=attrs['parent_node'])
+            # An earlier reparent in this loop may have moved this node's ancestors
+            node.refresh_from_db(fields=['path', 'depth'])
+            node.parent_node = parent
+            node.save(update_fields=['parent_node', 'updated_at'])
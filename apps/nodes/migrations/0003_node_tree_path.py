@@ -0,0 +1,51 @@
+# Generated by Django 4.2.30 on 2026-10-17 16:04
+
+from django.db import migrations, models
+
+
+def populate_tree_paths(apps, schema_editor):
+    """Backfill path/depth breadth-first, one hierarchy level at a time."""
+    Node = apps.get_model('nodes', 'Node')
+    batch_size = 500
+
+    level = {
+        pk: ''
+        for pk in Node.objects.filter(parent_node__isnull=True).values_list('id', flat=True)
+    }
+    depth = 0
+    while level:
+        depth += 1
+        parent_ids = list(level)
+        next_level = {}
+        for start in range(0, len(parent_ids), batch_size):
+            chunk = parent_ids[start:start + batch_size]
+            children = Node.objects.filter(parent_node_id__in=chunk).only('id', 'parent_node_id')
+            updated = []
+            for child in children:
+                child.path = f"{level[child.parent_node_id]}{child.parent_node_id}/"
+                child.depth = depth
+                next_level[child.id] = child.path
+                updated.append(child)
+            Node.objects.bulk_update(updated, ['path', 'depth'], batch_size=batch_size)
+        level = next_level
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nodes', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='node',
+            name='depth',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='node',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=1024),
+        ),
+        migrations.RunPython(populate_tree_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-17 16:40
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """FTS5 table on SQLite (kept in sync by triggers, see nodes.search), GIN index on PostgreSQL."""
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA compile_options")
+            if 'ENABLE_FTS5' not in {row[0] for row in cursor.fetchall()}:
+                return
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE nodes_node_fts USING fts5("
+            "title, content, content='nodes_node', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute("INSERT INTO nodes_node_fts(nodes_node_fts) VALUES ('rebuild')")
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE INDEX nodes_node_search_idx ON nodes_node USING GIN ("
+            "to_tsvector('english'::regconfig, coalesce(title, '') || ' ' || coalesce(content, '')))"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        for trigger in ('nodes_node_fts_ai', 'nodes_node_fts_ad', 'nodes_node_fts_au'):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        schema_editor.execute("DROP TABLE IF EXISTS nodes_node_fts")
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS nodes_node_search_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nodes', '0003_node_tree_path'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
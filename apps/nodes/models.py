@@ -1,14 +1,47 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Concat, Substr
 from django.core.exceptions import ValidationError
 
 from apps.projects.models import Project
 
 
+class NodeQuerySet(models.QuerySet):
+    """QuerySet helpers for Node."""
+
+    def with_list_stats(self):
+        """
+        Annotates child_count and prefetches graph memberships so NodeSerializer
+        can render a whole page without per-row queries.
+        """
+        from apps.graphs.models import GraphNode
+
+        # Correlated subquery rather than Count(): no GROUP BY over every column,
+        # and no double counting when callers filter across graph_nodes.
+        child_count = (
+            Node.objects.filter(parent_node=OuterRef('pk'))
+            .order_by()
+            .values('parent_node')
+            .annotate(count=models.Count('pk'))
+            .values('count')
+        )
+        return self.annotate(
+            child_count=Coalesce(Subquery(child_count), 0)
+        ).prefetch_related(
+            models.Prefetch('graph_nodes', queryset=GraphNode.objects.only('id', 'node_id', 'graph_id'))
+        )
+
+
 class Node(models.Model):
     """
     Represents an entity in a project (character, location, event, etc.).
 
     Graph membership and per-graph layout are handled by graphs.GraphNode.
+
+    The hierarchy is indexed with a materialized path: ``path`` holds the ids of
+    every ancestor from the root down to the parent (``"3/17/42/"``, empty for
+    roots) and ``depth`` its length. Both are maintained by ``save()``, so depth,
+    ancestors, descendants and cycle checks never walk ``parent_node``.
     """
 
     NODE_TYPES = [
@@ -20,6 +53,8 @@ class Node(models.Model):
         ('note', 'Note'),
     ]
 
+    PATH_SEPARATOR = '/'
+
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='nodes')
 
     # Hierarchy: a node can be inside another node (within the same project)
@@ -31,6 +66,10 @@ class Node(models.Model):
         related_name='child_nodes'
     )
 
+    # Ancestor index (see class docstring)
+    path = models.CharField(max_length=1024, blank=True, default='', editable=False, db_index=True)
+    depth = models.PositiveIntegerField(default=0, editable=False)
+
     title = models.CharField(max_length=255)
     node_type = models.CharField(max_length=50, choices=NODE_TYPES, default='note')
     content = models.TextField(blank=True)
@@ -38,12 +77,35 @@ class Node(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = NodeQuerySet.as_manager()
+
     class Meta:
         ordering = ['-updated_at']
 
     def __str__(self):
         return f"{self.title} ({self.node_type})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the persisted parent so save() only touches the index on reparent,
+        # and the project so the counters follow a node moved to another one
+        instance._loaded_parent_id = instance.__dict__.get('parent_node_id')
+        instance._loaded_project_id = instance.__dict__.get('project_id')
+        return instance
+
+    @classmethod
+    def child_path(cls, parent_id, parent_path='', parent_depth=0):
+        """Returns the (path, depth) pair for a direct child of the given parent."""
+        if parent_id is None:
+            return '', 0
+        return f"{parent_path}{parent_id}{cls.PATH_SEPARATOR}", parent_depth + 1
+
+    @property
+    def descendant_path(self):
+        """Path prefix shared by every descendant of this node."""
+        return f"{self.path}{self.pk}{self.PATH_SEPARATOR}"
+
     def clean(self):
         # Prevent invalid parent relationships
         if self.parent_node is not None:
@@ -52,25 +114,70 @@ class Node(models.Model):
             if self.parent_node.project_id != self.project_id:
                 raise ValidationError("Parent node must belong to the same project")
 
-            # Prevent cycles
-            ancestor = self.parent_node
-            seen_ids = {self.id} if self.id else set()
-            while ancestor is not None:
-                if ancestor.id in seen_ids:
-                    raise models.ValidationError("Cyclic parent relationship is not allowed")
-                seen_ids.add(ancestor.id)
-                ancestor = ancestor.parent_node
+            # Prevent cycles: the new parent must not live inside this node's subtree
+            if self.id and self.id in self.parent_node.get_ancestor_ids():
+                raise ValidationError("Cyclic parent relationship is not allowed")
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        parent_changed = (
+            self._state.adding
+            or getattr(self, '_loaded_parent_id', None) != self.parent_node_id
+        )
+        if update_fields is not None and 'parent_node' not in update_fields:
+            parent_changed = False
+
+        if not parent_changed:
+            # post_save receivers adjust the counters: commit them together with the row
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+            return
+
+        old_path, old_depth = self.path, self.depth
+        if self.parent_node_id is None:
+            self.path, self.depth = self.child_path(None)
+        else:
+            parent = self.parent_node
+            if self.pk is not None and (parent.pk == self.pk or self.pk in parent.get_ancestor_ids()):
+                raise ValidationError("Cyclic parent relationship is not allowed")
+            self.path, self.depth = self.child_path(parent.pk, parent.path, parent.depth)
+
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'path', 'depth'}
+
+        with transaction.atomic():
+            is_move = not self._state.adding
+            super().save(*args, **kwargs)
+            if is_move and (self.path != old_path):
+                self._move_descendants(
+                    f"{old_path}{self.pk}{self.PATH_SEPARATOR}", self.descendant_path, self.depth - old_depth
+                )
+        self._loaded_parent_id = self.parent_node_id
+
+    @classmethod
+    def _move_descendants(cls, old_prefix, new_prefix, depth_delta):
+        """Rewrites the path prefix of a whole subtree in a single UPDATE."""
+        cls.objects.filter(path__startswith=old_prefix).update(
+            path=Concat(
+                Value(new_prefix),
+                Substr('path', len(old_prefix) + 1),
+                output_field=models.CharField(),
+            ),
+            depth=F('depth') + depth_delta,
+        )
 
     def get_depth(self):
         """Returns the depth level in the hierarchy (0 = root)."""
-        depth = 0
-        ancestor = self.parent_node
-        seen_ids = {self.id} if self.id else set()
-        while ancestor is not None:
-            if ancestor.id in seen_ids:
-                # Defensive: avoid infinite loops if bad data exists
-                break
-            seen_ids.add(ancestor.id)
-            depth += 1
-            ancestor = ancestor.parent_node
-        return depth
+        return self.depth
+
+    def get_ancestor_ids(self):
+        """Ids of all ancestors, from the root down to the direct parent."""
+        return [int(part) for part in self.path.split(self.PATH_SEPARATOR) if part]
+
+    def get_ancestors(self):
+        """Ancestors ordered from the root down to the direct parent."""
+        return Node.objects.filter(pk__in=self.get_ancestor_ids()).order_by('depth')
+
+    def get_descendants(self):
+        """All nodes below this one, at any depth."""
+        return Node.objects.filter(path__startswith=self.descendant_path)
@@ -0,0 +1,155 @@
+"""
+Full-text search over Node title and content.
+
+SQLite uses an FTS5 virtual table (``nodes_node_fts``) that mirrors
+``nodes_node`` through triggers; PostgreSQL uses a GIN expression index over
+``to_tsvector(title || content)``. Any other backend (or SQLite built without
+FTS5) falls back to ``icontains``.
+
+Queries are split into word terms that are ANDed together, and every term is
+a prefix match so results update while the user is still typing.
+
+Snippets are cut by the database around sentinel characters, then
+HTML-escaped before the sentinels become ``<mark>`` tags (``render_snippet``):
+node content is user input and must not reach the client as markup.
+"""
+import html
+import re
+
+from django.db import connections
+from django.db.models import FloatField, Q, Value
+from rest_framework import filters
+
+FTS_TABLE = 'nodes_node_fts'
+
+# Private-use characters around matches in the raw snippet, replaced after escaping
+SNIPPET_START = '\ue000'
+SNIPPET_END = '\ue001'
+
+PG_CONFIG = "'english'::regconfig"
+# Must match the expression of the GIN index created in migration 0004
+PG_DOCUMENT = (
+    f"to_tsvector({PG_CONFIG}, coalesce(nodes_node.title, '') || ' ' || coalesce(nodes_node.content, ''))"
+)
+
+SQLITE_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS nodes_node_fts_ai AFTER INSERT ON nodes_node BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS nodes_node_fts_ad AFTER DELETE ON nodes_node BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS nodes_node_fts_au AFTER UPDATE OF title, content ON nodes_node BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO {FTS_TABLE}(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END
+    """,
+]
+
+
+def get_search_terms(query):
+    """Splits a raw user query into word terms (punctuation and operators are dropped)."""
+    return re.findall(r'\w+', query or '')
+
+
+def render_snippet(snippet):
+    """A raw database snippet as safe HTML: escaped, with matches wrapped in <mark>."""
+    escaped = html.escape(snippet or '')
+    return escaped.replace(SNIPPET_START, '<mark>').replace(SNIPPET_END, '</mark>')
+
+
+def has_fts_table(connection):
+    return connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names()
+
+
+def install_search_triggers(using='default', **kwargs):
+    """
+    Creates the SQLite triggers that keep the FTS table in sync with nodes_node.
+
+    Runs on post_migrate rather than inside a migration because SQLite drops a
+    table's triggers whenever a later migration rebuilds that table.
+    """
+    connection = connections[using]
+    if not has_fts_table(connection):
+        return
+    with connection.cursor() as cursor:
+        for statement in SQLITE_TRIGGERS:
+            cursor.execute(statement)
+
+
+def search_nodes(queryset, query, ranked=True):
+    """
+    Filters a Node queryset down to the nodes matching ``query``.
+
+    With ``ranked`` the result is annotated with ``search_rank`` (higher is
+    better) and ``search_snippet`` (raw content excerpt with matches between
+    SNIPPET_START and SNIPPET_END, see render_snippet) and ordered best match first.
+    """
+    terms = get_search_terms(query)
+    if not terms:
+        return queryset.none()
+
+    connection = connections[queryset.db]
+
+    if connection.vendor == 'postgresql':
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        match = f"to_tsquery({PG_CONFIG}, %s)"
+        queryset = queryset.extra(where=[f"{PG_DOCUMENT} @@ {match}"], params=[tsquery])
+        if not ranked:
+            return queryset
+        return queryset.extra(
+            select={
+                'search_rank': f"ts_rank({PG_DOCUMENT}, {match})",
+                'search_snippet': (
+                    f"ts_headline({PG_CONFIG}, coalesce(nullif(nodes_node.content, ''), nodes_node.title), {match}, "
+                    f"'StartSel={SNIPPET_START}, StopSel={SNIPPET_END}, MaxFragments=1, MaxWords=24, MinWords=8')"
+                ),
+            },
+            select_params=[tsquery, tsquery],
+        ).order_by('-search_rank', '-updated_at')
+
+    if has_fts_table(connection):
+        fts_query = ' '.join(f'"{term}"*' for term in terms)
+        queryset = queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f"{FTS_TABLE}.rowid = nodes_node.id", f"{FTS_TABLE} MATCH %s"],
+            params=[fts_query],
+        )
+        if not ranked:
+            return queryset
+        return queryset.extra(
+            select={
+                # Title matches weigh more than content matches; bm25 is lower-is-better
+                'search_rank': f"-bm25({FTS_TABLE}, 10.0, 1.0)",
+                'search_snippet': f"snippet({FTS_TABLE}, -1, '{SNIPPET_START}', '{SNIPPET_END}', '…', 24)",
+            },
+        ).order_by('-search_rank', '-updated_at')
+
+    # No full-text index available: plain substring match
+    condition = Q()
+    for term in terms:
+        condition &= Q(title__icontains=term) | Q(content__icontains=term)
+    queryset = queryset.filter(condition)
+    if not ranked:
+        return queryset
+    return queryset.annotate(
+        search_rank=Value(0.0, output_field=FloatField()),
+        search_snippet=Value(''),
+    )
+
+
+class NodeSearchFilter(filters.SearchFilter):
+    """SearchFilter that answers ``?search=`` from the full-text index instead of icontains."""
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        if not query.strip():
+            return queryset
+        return search_nodes(queryset, query, ranked=False)
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Node
+from .search import render_snippet
 
 
 class NodeSerializer(serializers.ModelSerializer):
@@ -20,13 +21,48 @@ class NodeSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'updated_at', 'graph_ids']
 
     def get_child_count(self, obj):
+        # Annotated by Node.objects.with_list_stats() on list endpoints
+        child_count = getattr(obj, 'child_count', None)
+        if child_count is not None:
+            return child_count
         return obj.child_nodes.count()
 
     def get_depth_level(self, obj):
-        return obj.get_depth()
+        return obj.depth
+
+    def validate(self, attrs):
+        """
+        Perform model-level validation by calling the model's clean() method.
+        Parent/project consistency and cycle detection use the ancestor path index.
+        """
+        from django.core.exceptions import ValidationError as DjangoValidationError
+        from rest_framework.exceptions import ValidationError
+
+        if 'project' not in attrs and 'parent_node' not in attrs:
+            return attrs
+
+        if self.instance:
+            instance = Node(
+                pk=self.instance.pk,
+                project_id=self.instance.project_id,
+                parent_node_id=self.instance.parent_node_id,
+            )
+        else:
+            instance = Node()
+        for attr in ('project', 'parent_node'):
+            if attr in attrs:
+                setattr(instance, attr, attrs[attr])
+
+        try:
+            instance.clean()
+        except DjangoValidationError as e:
+            raise ValidationError(e.message_dict if hasattr(e, 'message_dict') else e.messages)
+
+        return attrs
 
     def get_graph_ids(self, obj):
-        return list(obj.graph_nodes.values_list('graph_id', flat=True))
+        # .all() reuses the graph_nodes prefetch when present
+        return [graph_node.graph_id for graph_node in obj.graph_nodes.all()]
 
 
 class NodeDetailSerializer(NodeSerializer):
@@ -36,4 +72,44 @@ class NodeDetailSerializer(NodeSerializer):
     child_nodes = NodeSerializer(many=True, read_only=True)
 
     class Meta(NodeSerializer.Meta):
-        fields = NodeSerializer.Meta.fields + ['child_nodes']
\ No newline at end of file
+        fields = NodeSerializer.Meta.fields + ['child_nodes']
+
+
+class NodeSearchSerializer(NodeSerializer):
+    """
+    Node search result with relevance rank and a highlighted content snippet
+    """
+    search_rank = serializers.FloatField(read_only=True)
+    search_snippet = serializers.SerializerMethodField()
+
+    class Meta(NodeSerializer.Meta):
+        fields = NodeSerializer.Meta.fields + ['search_rank', 'search_snippet']
+
+    def get_search_snippet(self, obj):
+        return render_snippet(getattr(obj, 'search_snippet', ''))
+
+
+class NodeBulkCreateSerializer(serializers.ModelSerializer):
+    """
+    Field-level validation for one item of a bulk create.
+    project/parent_node are plain ids here; they are resolved for the whole batch at once.
+    """
+    project = serializers.IntegerField()
+    parent_node = serializers.IntegerField(required=False, allow_null=True)
+
+    class Meta:
+        model = Node
+        fields = ['project', 'parent_node', 'title', 'node_type', 'content']
+
+
+class NodeBulkUpdateSerializer(serializers.ModelSerializer):
+    """
+    Field-level validation for one item of a bulk update (all fields but id optional).
+    """
+    id = serializers.IntegerField()
+    parent_node = serializers.IntegerField(required=False, allow_null=True)
+
+    class Meta:
+        model = Node
+        fields = ['id', 'parent_node', 'title', 'node_type', 'content']
+        extra_kwargs = {'title': {'required': False}}
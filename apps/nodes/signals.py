@@ -0,0 +1,25 @@
+"""Keeps Project.node_count in step with node creation, deletion and moves between projects."""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.projects.counters import deleted_with, moved_from
+from apps.projects.models import Project
+from .models import Node
+
+
+@receiver(post_save, sender=Node)
+def count_node_save(sender, instance, created, update_fields=None, **kwargs):
+    previous_project_id = moved_from(instance, 'project', update_fields)
+    if created:
+        Project.objects.filter(pk=instance.project_id).adjust_counters(node_count=1)
+    elif previous_project_id is not None:
+        Project.objects.filter(pk=previous_project_id).adjust_counters(node_count=-1)
+        Project.objects.filter(pk=instance.project_id).adjust_counters(node_count=1)
+
+
+@receiver(post_delete, sender=Node)
+def count_node_delete(sender, instance, origin=None, **kwargs):
+    # The project's counters go with the project
+    if deleted_with(origin, Project):
+        return
+    Project.objects.filter(pk=instance.project_id).adjust_counters(node_count=-1)
@@ -7,6 +7,7 @@ from django.contrib.auth import get_user_model
 
 from .models import Node
 from apps.projects.models import Project
+from apps.graphs.models import Graph, GraphNode
 
 User = get_user_model()
 
@@ -75,6 +76,47 @@ class NodeModelTest(TestCase):
         with self.assertRaises(ValidationError):
             self.node.clean()
 
+    def test_node_path_and_depth(self):
+        """Test that the ancestor path index is filled on create"""
+        child = Node.objects.create(project=self.project, title='Child', parent_node=self.node)
+        grandchild = Node.objects.create(project=self.project, title='Grandchild', parent_node=child)
+        self.assertEqual(self.node.get_depth(), 0)
+        self.assertEqual(grandchild.get_depth(), 2)
+        self.assertEqual(grandchild.get_ancestor_ids(), [self.node.id, child.id])
+        self.assertEqual(list(grandchild.get_ancestors()), [self.node, child])
+        self.assertEqual(set(self.node.get_descendants()), {child, grandchild})
+
+    def test_reparent_moves_subtree_path(self):
+        """Test that reparenting rewrites the path of the whole subtree"""
+        other_root = Node.objects.create(project=self.project, title='Other Root')
+        child = Node.objects.create(project=self.project, title='Child', parent_node=self.node)
+        grandchild = Node.objects.create(project=self.project, title='Grandchild', parent_node=child)
+
+        child = Node.objects.get(pk=child.pk)
+        child.parent_node = other_root
+        child.save()
+
+        grandchild.refresh_from_db()
+        self.assertEqual(grandchild.get_ancestor_ids(), [other_root.id, child.id])
+        self.assertEqual(grandchild.depth, 2)
+        self.assertFalse(self.node.get_descendants().exists())
+
+        child.parent_node = None
+        child.save()
+        grandchild.refresh_from_db()
+        self.assertEqual(grandchild.get_ancestor_ids(), [child.id])
+        self.assertEqual(grandchild.depth, 1)
+
+    def test_node_cannot_create_cycle(self):
+        """Test that a node cannot be moved under one of its descendants"""
+        child = Node.objects.create(project=self.project, title='Child', parent_node=self.node)
+        grandchild = Node.objects.create(project=self.project, title='Grandchild', parent_node=child)
+        self.node.parent_node = grandchild
+        with self.assertRaises(ValidationError):
+            self.node.clean()
+        with self.assertRaises(ValidationError):
+            self.node.save()
+
 
 class NodeAPITest(APITestCase):
     """Tests for the API of nodos"""
@@ -214,6 +256,44 @@ class NodeAPITest(APITestCase):
         self.assertEqual(len(data), 1)
         self.assertEqual(data[0]['title'], 'Hero Character')
 
+    def test_list_nodes_query_count_is_constant(self):
+        """Test that listing nodes does not issue per-row queries"""
+        graph = Graph.objects.create(project=self.project, name='Main')
+        for i in range(10):
+            child = Node.objects.create(project=self.project, title=f'Child {i}', parent_node=self.node)
+            GraphNode.objects.create(graph=graph, node=child)
+        GraphNode.objects.create(graph=graph, node=self.node)
+
+        self.client.force_authenticate(user=self.user)
+        url = reverse('node-list')
+        # count + page + graph_nodes prefetch
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = {item['id']: item for item in get_response_data(response)}
+        self.assertEqual(len(data), 11)
+        self.assertEqual(data[self.node.id]['child_count'], 10)
+        self.assertEqual(data[self.node.id]['graph_ids'], [graph.id])
+        self.assertEqual(data[child.id]['depth_level'], 1)
+
+        # + graph lookup for the filter
+        with self.assertNumQueries(4):
+            response = self.client.get(url, {'graph_nodes__graph': graph.id})
+        data = {item['id']: item for item in get_response_data(response)}
+        self.assertEqual(data[self.node.id]['child_count'], 10)
+
+    def test_update_node_rejects_cycle(self):
+        """Test that the API refuses to move a node under its own child"""
+        child = Node.objects.create(
+            project=self.project,
+            title='Child',
+            parent_node=self.node
+        )
+        self.client.force_authenticate(user=self.user)
+        url = reverse('node-detail', kwargs={'pk': self.node.pk})
+        response = self.client.patch(url, {'parent_node': child.id})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_get_node_children(self):
         """Test for getting hijos de un nodo"""
         Node.objects.create(
@@ -232,3 +312,134 @@ class NodeAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         data = get_response_data(response)
         self.assertEqual(len(data), 2)
+
+    def test_get_node_subtree(self):
+        """Test for getting the whole subtree of a node as a flat list"""
+        child = Node.objects.create(project=self.project, title='Child', parent_node=self.node)
+        grandchild = Node.objects.create(
+            project=self.project, title='Grandchild', parent_node=child, node_type='location'
+        )
+        Node.objects.create(project=self.project, title='Unrelated')
+        self.client.force_authenticate(user=self.user)
+        url = reverse('node-subtree', kwargs={'pk': self.node.pk})
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.data], [self.node.id, child.id, grandchild.id])
+        self.assertEqual(response.data[2]['parent_node'], child.id)
+
+        response = self.client.get(url, {'max_depth': 1})
+        self.assertEqual([item['id'] for item in response.data], [self.node.id, child.id])
+
+        response = self.client.get(url, {'node_type': 'location'})
+        self.assertEqual([item['id'] for item in response.data], [grandchild.id])
+
+        response = self.client.get(url, {'max_depth': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_node_ancestors(self):
+        """Test for getting the breadcrumbs of a node"""
+        child = Node.objects.create(project=self.project, title='Child', parent_node=self.node)
+        grandchild = Node.objects.create(project=self.project, title='Grandchild', parent_node=child)
+        self.client.force_authenticate(user=self.user)
+        url = reverse('node-ancestors', kwargs={'pk': grandchild.pk})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.data], [self.node.id, child.id])
+
+    def test_search_nodes_full_text(self):
+        """Test for ranked full-text search with snippets and project scoping"""
+        other_project = Project.objects.create(name='Other Project', owner=self.user)
+        Node.objects.create(project=self.project, title='Dragon', content='A red dragon guards the keep')
+        Node.objects.create(project=self.project, title='Keep', content='Home of the dragon')
+        Node.objects.create(project=other_project, title='Dragonfly', content='Small insect')
+        self.client.force_authenticate(user=self.user)
+        url = reverse('node-search')
+
+        response = self.client.get(url, {'q': 'drag'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = get_response_data(response)
+        self.assertEqual(len(data), 3)
+
+        response = self.client.get(url, {'q': 'dragon', 'project': self.project.id})
+        data = get_response_data(response)
+        self.assertEqual([item['title'] for item in data], ['Dragon', 'Keep'])
+        self.assertIn('<mark>', data[0]['search_snippet'])
+        self.assertGreater(data[0]['search_rank'], data[1]['search_rank'])
+
+        # Stored markup comes back escaped; only the highlighting is HTML
+        Node.objects.create(project=self.project, title='Trap', content='<img src=x onerror=alert(1)> wyvern')
+        response = self.client.get(url, {'q': 'wyvern'})
+        snippet = get_response_data(response)[0]['search_snippet']
+        self.assertNotIn('<img', snippet)
+        self.assertIn('&lt;img', snippet)
+        self.assertIn('<mark>wyvern</mark>', snippet)
+
+        response = self.client.get(url, {'q': ''})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_search_index_follows_node_writes(self):
+        """Test that updated and deleted nodes are reflected in search results"""
+        self.client.force_authenticate(user=self.user)
+        url = reverse('node-list')
+        self.node.title = 'Renamed Wizard'
+        self.node.save()
+
+        response = self.client.get(url, {'search': 'wizard'})
+        self.assertEqual(len(get_response_data(response)), 1)
+        response = self.client.get(url, {'search': 'Test Node'})
+        self.assertEqual(len(get_response_data(response)), 0)
+
+        self.node.delete()
+        response = self.client.get(url, {'search': 'wizard'})
+        self.assertEqual(len(get_response_data(response)), 0)
+
+    def test_bulk_node_operations(self):
+        """Test for creating, updating and deleting nodes in one request"""
+        child = Node.objects.create(project=self.project, title='Child', parent_node=self.node)
+        doomed = Node.objects.create(project=self.project, title='Doomed')
+        self.client.force_authenticate(user=self.user)
+        url = reverse('node-bulk')
+        data = {
+            'create': [
+                {'project': self.project.id, 'title': 'New Root'},
+                {'project': self.project.id, 'title': 'New Leaf', 'parent_node': child.id, 'node_type': 'item'},
+            ],
+            'update': [
+                {'id': self.node.id, 'title': 'Renamed'},
+                {'id': child.id, 'parent_node': None},
+            ],
+            'delete': [doomed.id],
+        }
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['status'] for item in response.data['create']], ['created', 'created'])
+
+        leaf = Node.objects.get(pk=response.data['create'][1]['id'])
+        self.assertEqual(leaf.node_type, 'item')
+        self.assertEqual(leaf.get_ancestor_ids(), [child.id])
+        self.node.refresh_from_db()
+        self.assertEqual(self.node.title, 'Renamed')
+        child.refresh_from_db()
+        self.assertIsNone(child.parent_node_id)
+        self.assertFalse(Node.objects.filter(pk=doomed.pk).exists())
+
+    def test_bulk_node_operations_are_all_or_nothing(self):
+        """Test that one invalid item rejects the whole bulk request"""
+        other_project = Project.objects.create(name='Other Project', owner=self.other_user)
+        child = Node.objects.create(project=self.project, title='Child', parent_node=self.node)
+        self.client.force_authenticate(user=self.user)
+        url = reverse('node-bulk')
+        data = {
+            'create': [
+                {'project': self.project.id, 'title': 'Fine'},
+                {'project': other_project.id, 'title': 'Not mine'},
+            ],
+            'update': [{'id': self.node.id, 'parent_node': child.id}],
+        }
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['create'][0]['status'], 'not_applied')
+        self.assertIn('project', response.data['create'][1]['errors'])
+        self.assertIn('parent_node', response.data['update'][0]['errors'])
+        self.assertEqual(Node.objects.count(), 2)
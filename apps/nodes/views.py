@@ -1,17 +1,22 @@
-from rest_framework import viewsets, filters
+from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.generics import get_object_or_404
+from rest_framework.exceptions import ValidationError
+from django.db.models import Q
 from django_filters.rest_framework import DjangoFilterBackend
 
+from .bulk import apply_bulk_operations
 from .models import Node
-from .serializers import NodeSerializer
+from .search import NodeSearchFilter, search_nodes
+from .serializers import NodeSerializer, NodeSearchSerializer
 
 
 class NodeViewSet(viewsets.ModelViewSet):
     """ViewSet for Node model."""
 
     serializer_class = NodeSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, NodeSearchFilter, filters.OrderingFilter]
 
     # Allow filtering nodes by project and also by graph membership
     filterset_fields = ['project', 'node_type', 'parent_node', 'graph_nodes__graph']
@@ -24,18 +29,98 @@ class NodeViewSet(viewsets.ModelViewSet):
         user = getattr(self.request, 'user', None)
         if not user or not user.is_authenticated:
             return Node.objects.none()
-        return Node.objects.filter(project__owner=user)
+        return Node.objects.filter(project__owner=user).with_list_stats()
 
     @action(detail=True, methods=['get'])
     def children(self, request, pk=None):
         node = self.get_object()
-        children = node.child_nodes.all()
+        children = node.child_nodes.with_list_stats()
         serializer = NodeSerializer(children, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Creates, updates and deletes many nodes in one transaction.
+
+        Body: {"create": [{project, title, ...}], "update": [{id, ...}], "delete": [id, ...]}
+        Returns one result per item, in request order. If any item is invalid
+        nothing is written and the response is 400.
+        """
+        results, applied = apply_bulk_operations(request.user, request.data)
+        return Response(results, status=status.HTTP_200_OK if applied else status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Full-text search over node title and content, best match first.
+
+        Query params:
+        - q: search text (every word must match, as a prefix)
+        - project: restrict results to one project
+        - node_type: restrict results to one node type
+        """
+        query = request.query_params.get('q', '')
+        if not query.strip():
+            raise ValidationError({'q': 'This query parameter is required.'})
+
+        nodes = self.get_queryset()
+        project = request.query_params.get('project')
+        if project:
+            if not project.isdigit():
+                raise ValidationError({'project': 'Must be a project id.'})
+            nodes = nodes.filter(project_id=project)
+        node_type = request.query_params.get('node_type')
+        if node_type:
+            nodes = nodes.filter(node_type=node_type)
+
+        page = self.paginate_queryset(search_nodes(nodes, query))
+        serializer = NodeSearchSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def subtree(self, request, pk=None):
+        """
+        Returns the node and all of its descendants as a flat list ordered by depth.
+        Clients rebuild the tree from parent_node.
+
+        Query params:
+        - max_depth: levels below this node to include (0 = only the node itself)
+        - node_type: only include nodes of this type
+        """
+        # Not self.get_object(): the list filters (node_type, ...) must not apply to the root lookup
+        node = get_object_or_404(self.get_queryset(), pk=pk)
+        self.check_object_permissions(request, node)
+
+        nodes = Node.objects.filter(Q(pk=node.pk) | Q(path__startswith=node.descendant_path))
+
+        max_depth = request.query_params.get('max_depth')
+        if max_depth is not None:
+            try:
+                max_depth = int(max_depth)
+            except ValueError:
+                max_depth = -1
+            if max_depth < 0:
+                raise ValidationError({'max_depth': 'Must be a non-negative integer.'})
+            nodes = nodes.filter(depth__lte=node.depth + max_depth)
+
+        node_type = request.query_params.get('node_type')
+        if node_type:
+            nodes = nodes.filter(node_type=node_type)
+
+        serializer = NodeSerializer(nodes.with_list_stats().order_by('depth', 'id'), many=True)
+        return Response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def ancestors(self, request, pk=None):
+        """Returns the ancestors of the node from the root down to its parent (breadcrumbs)."""
+        node = self.get_object()
+        serializer = NodeSerializer(node.get_ancestors().with_list_stats(), many=True)
+        return Response(serializer.data)
+
     @action(detail=True, methods=['get'])
     def connections(self, request, pk=None):
-        from connections.serializers import NodeConnectionSerializer
+        from apps.connections.serializers import NodeConnectionSerializer
 
         node = self.get_object()
         outgoing = node.outgoing_connections.all()
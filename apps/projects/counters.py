@@ -0,0 +1,90 @@
+"""
+Denormalized counters: ``node_count``, ``graph_count`` and ``connection_count``
+on Project, ``node_count`` (graph nodes) and ``connection_count`` on Graph.
+
+They are adjusted with single F() UPDATEs in the same transaction as the row
+being created or deleted: by the post_save/post_delete receivers in each
+app's signals.py, and explicitly by paths that bypass signals (bulk_create,
+queryset.update). ``rebuild_counters()`` recomputes them from the source
+tables; run it with ``python manage.py rebuild_counters``.
+
+A row moved to another project or graph moves its count along
+(``moved_from()``). Rows deleted together with their graph or project are not
+counted down one by one: the receivers skip them (``deleted_with()``) and the
+parent's own receivers settle the counters in one UPDATE. Decrements stop at 0.
+"""
+from django.db import transaction
+from django.db.models import Count, OuterRef, QuerySet, Subquery
+from django.db.models.functions import Coalesce
+
+
+def deleted_with(origin, *models):
+    """
+    Whether a deletion started from an instance or queryset of one of ``models``,
+    given the ``origin`` of pre_delete/post_delete.
+    """
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return issubclass(model, models)
+
+
+def moved_from(instance, field, update_fields=None):
+    """
+    The previous ``field`` id (e.g. 'project') of an instance whose save just
+    wrote a different one; None otherwise. For post_save receivers of models
+    whose from_db() remembers ``_loaded_<field>_id``.
+    """
+    if update_fields is not None and field not in update_fields:
+        return None
+    attname = f'_loaded_{field}_id'
+    loaded, current = getattr(instance, attname, None), getattr(instance, f'{field}_id')
+    setattr(instance, attname, current)
+    return loaded if loaded is not None and loaded != current else None
+
+
+def count_by(queryset, field):
+    """Correlated subquery counting the rows of ``queryset`` whose ``field`` is the outer pk."""
+    counts = (
+        queryset.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    return Coalesce(Subquery(counts), 0)
+
+
+def rebuild_counters(project_ids=None, models=None):
+    """
+    Recomputes the counters of the given projects (all if None) and their graphs.
+
+    ``models`` maps model names to model classes, so migrations can pass their
+    historical models; defaults to the current ones.
+    """
+    if models is None:
+        from apps.connections.models import NodeConnection
+        from apps.graphs.models import Graph, GraphNode
+        from apps.nodes.models import Node
+        from .models import Project
+
+        models = {
+            'Project': Project, 'Node': Node, 'Graph': Graph,
+            'GraphNode': GraphNode, 'NodeConnection': NodeConnection,
+        }
+
+    projects = models['Project'].objects.all()
+    graphs = models['Graph'].objects.all()
+    if project_ids is not None:
+        projects = projects.filter(pk__in=project_ids)
+        graphs = graphs.filter(project__in=project_ids)
+
+    connections = models['NodeConnection'].objects.all()
+    with transaction.atomic():
+        graphs.update(
+            node_count=count_by(models['GraphNode'].objects.all(), 'graph'),
+            connection_count=count_by(connections, 'graph'),
+        )
+        return projects.update(
+            node_count=count_by(models['Node'].objects.all(), 'project'),
+            graph_count=count_by(models['Graph'].objects.all(), 'project'),
+            connection_count=count_by(connections, 'graph__project'),
+        )
@@ -0,0 +1,317 @@
+"""
+Streaming export of projects and graphs.
+
+Rows are read with ``values().iterator(chunk_size=...)`` (server-side cursors on
+PostgreSQL) and encoded as they arrive, so memory stays constant whatever the
+project size. Three formats:
+
+- ``jsonl``: one JSON object per line, ``{"type": "<kind>", ...fields}``, in
+  dependency order: project, connection types, nodes (parents before
+  children), graphs, graph nodes, connections.
+- ``graphml``: GraphML, for Gephi, yEd or NetworkX.
+- ``gexf``: GEXF 1.3 for Gephi, with canvas positions and colors.
+
+A project export holds every node of the project and the connections of all
+its graphs (edges carry their graph id); a graph export holds only the nodes
+on its canvas, with their layout.
+"""
+import json
+from itertools import islice
+from xml.sax.saxutils import escape, quoteattr
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.http import StreamingHttpResponse
+from django.utils.text import slugify
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from apps.connections.models import ConnectionType, NodeConnection
+from apps.graphs.models import Graph, GraphNode
+from apps.nodes.models import Node
+
+CHUNK_SIZE = 2000
+# Encoded output is handed to the server in blocks of about this many characters
+BUFFER_SIZE = 64 * 1024
+
+PROJECT_FIELDS = ['id', 'name', 'description', 'created_at', 'updated_at']
+CONNECTION_TYPE_FIELDS = ['id', 'name', 'description', 'color', 'created_at']
+NODE_FIELDS = ['id', 'parent_node', 'title', 'node_type', 'content', 'created_at', 'updated_at']
+GRAPH_FIELDS = ['id', 'name', 'description', 'created_at', 'updated_at']
+GRAPH_NODE_FIELDS = ['id', 'graph', 'node', 'position_x', 'position_y', 'color']
+CONNECTION_FIELDS = ['id', 'graph', 'source_node', 'target_node', 'connection_type', 'label', 'created_at']
+
+
+class ExportRenderer(BaseRenderer):
+    """
+    Lets export actions pick a format through content negotiation (``Accept``
+    or ``?format=``). The actions stream their own response, so these
+    renderers only ever render error payloads, as JSON.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = 'application/json'
+        return json.dumps(data, cls=DjangoJSONEncoder).encode('utf-8')
+
+
+class JSONLinesExportRenderer(ExportRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'jsonl'
+
+
+class GraphMLExportRenderer(ExportRenderer):
+    media_type = 'application/graphml+xml'
+    format = 'graphml'
+
+
+class GEXFExportRenderer(ExportRenderer):
+    media_type = 'application/gexf+xml'
+    format = 'gexf'
+
+
+EXPORT_RENDERERS = [JSONLinesExportRenderer, GraphMLExportRenderer, GEXFExportRenderer]
+
+
+def _rows(queryset, *fields, **expressions):
+    return queryset.values(*fields, **expressions).iterator(chunk_size=CHUNK_SIZE)
+
+
+def _buffered(pieces):
+    """Joins small strings into blocks of about BUFFER_SIZE characters."""
+    buffer, size = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= BUFFER_SIZE:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def _instance_row(instance, fields):
+    return {field: getattr(instance, field) for field in fields}
+
+
+# --- What gets exported ---------------------------------------------------------
+
+class ProjectExport:
+    """The rows of a whole project."""
+
+    with_layout = False
+
+    def __init__(self, project):
+        self.project = project
+        self.name = f'project-{project.pk}-{slugify(project.name)}'
+
+    def connection_types(self):
+        return ConnectionType.objects.filter(project_id=self.project.pk).order_by('id')
+
+    def nodes(self):
+        # Parents before children, so an importer can create nodes in file order
+        return Node.objects.filter(project_id=self.project.pk).order_by('depth', 'id')
+
+    def graphs(self):
+        return Graph.objects.filter(project_id=self.project.pk).order_by('id')
+
+    def graph_nodes(self):
+        return GraphNode.objects.filter(graph__project_id=self.project.pk).order_by('id')
+
+    def connections(self):
+        return NodeConnection.objects.filter(graph__project_id=self.project.pk).order_by('id')
+
+    def graph_rows(self):
+        return _rows(self.graphs(), *GRAPH_FIELDS)
+
+    def node_rows(self):
+        """Node rows for the graph formats: id, title, node_type, parent_node (+ x, y, color with layout)."""
+        return _rows(self.nodes(), 'id', 'title', 'node_type', 'parent_node')
+
+
+class GraphExport(ProjectExport):
+    """The rows of one graph: only the nodes on its canvas, with their layout."""
+
+    with_layout = True
+
+    def __init__(self, graph):
+        super().__init__(graph.project)
+        self.graph = graph
+        self.name = f'graph-{graph.pk}-{slugify(graph.name)}'
+
+    def nodes(self):
+        return Node.objects.filter(graph_nodes__graph_id=self.graph.pk).order_by('depth', 'id')
+
+    def graph_rows(self):
+        return [_instance_row(self.graph, GRAPH_FIELDS)]
+
+    def graph_nodes(self):
+        return GraphNode.objects.filter(graph_id=self.graph.pk).order_by('id')
+
+    def connections(self):
+        return NodeConnection.objects.filter(graph_id=self.graph.pk).order_by('id')
+
+    def node_rows(self):
+        rows = _rows(
+            self.graph_nodes().order_by('node__depth', 'node_id'),
+            'node', 'position_x', 'position_y', 'color',
+            title=F('node__title'), node_type=F('node__node_type'), parent_node=F('node__parent_node_id'),
+        )
+        for row in rows:
+            row['id'] = row.pop('node')
+            yield row
+
+
+def _edge_rows(export):
+    return _rows(
+        export.connections(),
+        'id', 'label', 'graph',
+        source=F('source_node_id'), target=F('target_node_id'), connection_type_name=F('connection_type__name'),
+    )
+
+
+# --- Encoders ---------------------------------------------------------------------
+
+def _jsonl(export):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    sections = [
+        ('project', [_instance_row(export.project, PROJECT_FIELDS)]),
+        ('connection_type', _rows(export.connection_types(), *CONNECTION_TYPE_FIELDS)),
+        ('node', _rows(export.nodes(), *NODE_FIELDS)),
+        ('graph', export.graph_rows()),
+        ('graph_node', _rows(export.graph_nodes(), *GRAPH_NODE_FIELDS)),
+        ('connection', _rows(export.connections(), *CONNECTION_FIELDS)),
+    ]
+    for kind, rows in sections:
+        for row in rows:
+            yield encoder.encode({'type': kind, **row}) + '\n'
+
+
+def _graphml(export):
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+    keys = [
+        ('label', 'node', 'label', 'string'),
+        ('node_type', 'node', 'node_type', 'string'),
+        ('parent_node', 'node', 'parent_node', 'long'),
+    ]
+    if export.with_layout:
+        keys += [('x', 'node', 'x', 'double'), ('y', 'node', 'y', 'double'), ('color', 'node', 'color', 'string')]
+    keys += [
+        ('edge_label', 'edge', 'label', 'string'),
+        ('connection_type', 'edge', 'connection_type', 'string'),
+        ('graph', 'edge', 'graph', 'long'),
+    ]
+    for key_id, domain, name, attr_type in keys:
+        yield f'  <key id="{key_id}" for="{domain}" attr.name="{name}" attr.type="{attr_type}"/>\n'
+    yield f'  <graph id={quoteattr(export.name)} edgedefault="directed">\n'
+
+    for row in export.node_rows():
+        data = [('label', row['title']), ('node_type', row['node_type']), ('parent_node', row['parent_node'])]
+        if export.with_layout:
+            data += [('x', row['position_x']), ('y', row['position_y']), ('color', row['color'])]
+        values = ''.join(
+            f'<data key="{key}">{escape(str(value))}</data>' for key, value in data if value is not None
+        )
+        yield f'    <node id="n{row["id"]}">{values}</node>\n'
+
+    for row in _edge_rows(export):
+        data = [('edge_label', row['label']), ('connection_type', row['connection_type_name']), ('graph', row['graph'])]
+        values = ''.join(f'<data key="{key}">{escape(str(value))}</data>' for key, value in data if value != '')
+        yield f'    <edge id="e{row["id"]}" source="n{row["source"]}" target="n{row["target"]}">{values}</edge>\n'
+
+    yield '  </graph>\n</graphml>\n'
+
+
+def _hex_to_rgb(color):
+    try:
+        return int(color[1:3], 16), int(color[3:5], 16), int(color[5:7], 16)
+    except (TypeError, ValueError):
+        return None
+
+
+def _gexf(export):
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<gexf xmlns="http://gexf.net/1.3" xmlns:viz="http://gexf.net/1.3/viz" version="1.3">\n'
+    yield f'  <meta><description>{escape(export.name)}</description></meta>\n'
+    yield '  <graph defaultedgetype="directed" mode="static">\n'
+    yield (
+        '    <attributes class="node">'
+        '<attribute id="node_type" title="node_type" type="string"/>'
+        '<attribute id="parent_node" title="parent_node" type="long"/>'
+        '</attributes>\n'
+        '    <attributes class="edge">'
+        '<attribute id="connection_type" title="connection_type" type="string"/>'
+        '<attribute id="graph" title="graph" type="long"/>'
+        '</attributes>\n'
+    )
+
+    yield '    <nodes>\n'
+    for row in export.node_rows():
+        values = f'<attvalue for="node_type" value={quoteattr(row["node_type"])}/>'
+        if row['parent_node'] is not None:
+            values += f'<attvalue for="parent_node" value="{row["parent_node"]}"/>'
+        viz = ''
+        if export.with_layout:
+            viz = f'<viz:position x="{row["position_x"]}" y="{row["position_y"]}" z="0.0"/>'
+            rgb = _hex_to_rgb(row['color'])
+            if rgb:
+                viz += '<viz:color r="{}" g="{}" b="{}"/>'.format(*rgb)
+        yield (
+            f'      <node id="{row["id"]}" label={quoteattr(row["title"])}>'
+            f'<attvalues>{values}</attvalues>{viz}</node>\n'
+        )
+    yield '    </nodes>\n'
+
+    yield '    <edges>\n'
+    for row in _edge_rows(export):
+        yield (
+            f'      <edge id="{row["id"]}" source="{row["source"]}" target="{row["target"]}" '
+            f'label={quoteattr(row["label"])}><attvalues>'
+            f'<attvalue for="connection_type" value={quoteattr(row["connection_type_name"])}/>'
+            f'<attvalue for="graph" value="{row["graph"]}"/>'
+            '</attvalues></edge>\n'
+        )
+    yield '    </edges>\n  </graph>\n</gexf>\n'
+
+
+ENCODERS = {
+    JSONLinesExportRenderer.format: (_jsonl, 'jsonl'),
+    GraphMLExportRenderer.format: (_graphml, 'graphml'),
+    GEXFExportRenderer.format: (_gexf, 'gexf'),
+}
+
+
+def _serialized_array(queryset, serializer_class):
+    renderer = JSONRenderer()
+    rows = queryset.iterator(chunk_size=CHUNK_SIZE)
+    yield b'['
+    separator = b''
+    while chunk := list(islice(rows, CHUNK_SIZE)):
+        # Rendered as an array, then unwrapped to join the chunks into one
+        yield separator + renderer.render(serializer_class(chunk, many=True).data)[1:-1]
+        separator = b','
+    yield b']'
+
+
+def stream_serialized(queryset, serializer_class):
+    """
+    Streams ``queryset`` as one JSON array of ``serializer_class`` representations,
+    the body ``Response(serializer_class(queryset, many=True).data)`` would have,
+    serializing ``CHUNK_SIZE`` rows at a time from ``.iterator()``. Prefetches
+    on the queryset are done per chunk.
+    """
+    return StreamingHttpResponse(_serialized_array(queryset, serializer_class), content_type='application/json')
+
+
+def export_response(export, renderer):
+    """Streams ``export`` in the format of the negotiated export renderer."""
+    encode, extension = ENCODERS[renderer.format]
+    response = StreamingHttpResponse(
+        _buffered(encode(export)), content_type=f'{renderer.media_type}; charset=utf-8'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{export.name}.{extension}"'
+    return response
@@ -0,0 +1,347 @@
+"""
+Streaming import of a project from JSON Lines, the format written by export.py.
+
+Lines are parsed one at a time and their rows are inserted with raw batched
+INSERTs of ``BATCH_SIZE`` rows; ids from the file are remapped to the new ids as
+rows are created, so a row may only reference rows on earlier lines (the
+export's order). A node whose parent is still queued in the same batch is
+inserted without it, and linked with one batched UPDATE right after the
+batch, so tree-ordered dumps keep full batches. Per line only field values are checked; the cross-row
+invariants of ``GraphNode.clean()`` and ``NodeConnection.clean()`` are checked
+with a few set-based queries once everything is loaded. The whole import runs
+in one transaction: any error leaves nothing behind.
+"""
+import json
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from apps.connections.models import ConnectionType, NodeConnection
+from apps.graphs.models import Graph, GraphNode
+from apps.nodes.models import Node
+from .counters import rebuild_counters
+from .models import Project
+
+BATCH_SIZE = 5000
+
+# Fields read from each kind of line; references are remapped separately
+IMPORT_FIELDS = {
+    'project': (Project, ['name', 'description']),
+    'connection_type': (ConnectionType, ['name', 'description', 'color']),
+    'node': (Node, ['title', 'node_type', 'content']),
+    'graph': (Graph, ['name', 'description']),
+    'graph_node': (GraphNode, ['position_x', 'position_y', 'color']),
+    'connection': (NodeConnection, ['label']),
+}
+# Kinds that later lines refer to by their file id
+REFERENCED_KINDS = ('connection_type', 'node', 'graph')
+
+
+def _line_error(line_number, message):
+    return ValidationError({'detail': f'Line {line_number}: {message}'})
+
+
+class _TableWriter:
+    """
+    Buffers rows for one table and inserts them with raw SQL built from the
+    model's _meta, like apps.graphs.duplication. Building model instances and
+    compiling bulk_create() statements costs far more than the inserts
+    themselves at import sizes.
+    """
+
+    def __init__(self, model, connection, now, returning):
+        self.model = model
+        self.connection = connection
+        self.returning = returning
+        self.fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+        # Values used when a row does not set a column: timestamps, then model defaults
+        self.defaults = {}
+        for field in self.fields:
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+                self.defaults[field.attname] = field.get_db_prep_save(now, connection)
+            elif field.has_default():
+                self.defaults[field.attname] = field.get_db_prep_save(field.get_default(), connection)
+        self.rows = []
+
+    def add(self, values):
+        """Queues a row; ``values`` maps attnames to values that are already database-ready."""
+        self.rows.append(tuple(
+            values[field.attname] if field.attname in values else self.defaults.get(field.attname)
+            for field in self.fields
+        ))
+
+    def flush(self):
+        """Inserts the queued rows; returns their new ids in order if ``returning``, else their count."""
+        rows, self.rows = self.rows, []
+        if not rows:
+            return [] if self.returning else 0
+        quote = self.connection.ops.quote_name
+        table = quote(self.model._meta.db_table)
+        columns = ', '.join(quote(field.column) for field in self.fields)
+        placeholder = f"({', '.join(['%s'] * len(self.fields))})"
+
+        with self.connection.cursor() as cursor:
+            if not self.returning:
+                cursor.executemany(f'INSERT INTO {table} ({columns}) VALUES {placeholder}', rows)
+                return len(rows)
+            pk = quote(self.model._meta.pk.column)
+            if not self.connection.features.can_return_rows_from_bulk_insert:
+                ids = []
+                for row in rows:
+                    cursor.execute(f'INSERT INTO {table} ({columns}) VALUES {placeholder}', row)
+                    ids.append(cursor.lastrowid)
+                return ids
+            ids = []
+            batch_size = max(self.connection.ops.bulk_batch_size(self.fields, rows), 1)
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                cursor.execute(
+                    f"INSERT INTO {table} ({columns}) VALUES {', '.join([placeholder] * len(batch))} RETURNING {pk}",
+                    [value for row in batch for value in row],
+                )
+                ids.extend(row[0] for row in cursor.fetchall())
+            return ids
+
+
+class ProjectImporter:
+    """Loads one JSON Lines project dump; see import_project()."""
+
+    def __init__(self, owner, name=None):
+        self.owner = owner
+        self.name = name
+        self.project = None
+        self.counts = {kind: 0 for kind in IMPORT_FIELDS}
+        self.connection = connections[Project.objects.db]
+        self.cleaners = {
+            kind: [(name, model._meta.get_field(name)) for name in names]
+            for kind, (model, names) in IMPORT_FIELDS.items()
+        }
+        now = timezone.now()
+        self.writers = {
+            kind: _TableWriter(model, self.connection, now, returning=kind in REFERENCED_KINDS)
+            for kind, (model, names) in IMPORT_FIELDS.items()
+            if kind != 'project'
+        }
+        # File id -> new id (nodes: -> (new id, path, depth) for the ancestor index)
+        self.ids = {kind: {} for kind in REFERENCED_KINDS}
+        # File id -> queue index of the queued rows of the referenced kinds
+        self.pending_ids = {kind: {} for kind in REFERENCED_KINDS}
+        # Per queued node row: its (path, depth), or None if its parent is queued too;
+        # queue index of such a row -> queue index of its parent
+        self.pending_paths = []
+        self.pending_parents = {}
+
+    def _values(self, kind, row, line_number):
+        """Cleans the plain fields of a line into database-ready values; missing fields use the model default."""
+        values = {}
+        for name, field in self.cleaners[kind]:
+            if name in row:
+                value = row[name]
+            elif field.has_default():
+                continue
+            elif field.blank:
+                value = None if field.null else ''
+            else:
+                raise _line_error(line_number, f'"{name}" is required.')
+            try:
+                values[field.attname] = field.get_db_prep_save(field.clean(value, None), self.connection)
+            except Exception as e:
+                messages = getattr(e, 'messages', [str(e)])
+                raise _line_error(line_number, f'"{name}": {" ".join(messages)}')
+        return values
+
+    def _pending_index(self, kind, value):
+        """Queue index of the queued row with file id ``value``, or None."""
+        try:
+            return self.pending_ids[kind].get(value)
+        except TypeError:
+            return None
+
+    def _ref(self, kind, row, key, line_number, required=True):
+        """New id (nodes: (new id, path, depth)) of the earlier row a line refers to."""
+        mapping = self.ids[kind]
+        value = row.get(key)
+        if value is None:
+            if required:
+                raise _line_error(line_number, f'"{key}" is required.')
+            return None
+        try:
+            return mapping[value]
+        except KeyError:
+            pass
+        except TypeError:
+            raise _line_error(line_number, f'"{key}" {value!r} does not refer to an earlier line.')
+        if self._pending_index(kind, value) is not None:
+            # Still waiting in the current batch: insert the batch first
+            self.flush(kind)
+            return mapping[value]
+        raise _line_error(line_number, f'"{key}" {value!r} does not refer to an earlier line.')
+
+    def add(self, row, line_number):
+        if not isinstance(row, dict) or row.get('type') not in IMPORT_FIELDS:
+            raise _line_error(line_number, f'Expected an object with "type" in {sorted(IMPORT_FIELDS)}.')
+        kind = row['type']
+
+        if kind == 'project':
+            if self.project is not None:
+                raise _line_error(line_number, 'Only one project line is allowed.')
+            values = {name: row[name] for name, field in self.cleaners[kind] if name in row}
+            if self.name:
+                values['name'] = self.name
+            project = Project(owner=self.owner, **values)
+            try:
+                project.full_clean(exclude=['owner'])
+            except DjangoValidationError as e:
+                raise _line_error(line_number, ' '.join(e.messages))
+            project.save()
+            self.project = project
+            return
+        if self.project is None:
+            raise _line_error(line_number, 'The first line must be the project.')
+
+        values = self._values(kind, row, line_number)
+        writer = self.writers[kind]
+        if kind == 'node':
+            values['project_id'] = self.project.pk
+            parent_index = self._pending_index('node', row.get('parent_node'))
+            if parent_index is not None:
+                # Linked once both rows are inserted (see _link_parents)
+                self.pending_parents[len(writer.rows)] = parent_index
+                self.pending_paths.append(None)
+            else:
+                parent = self._ref('node', row, 'parent_node', line_number, required=False)
+                if parent is not None:
+                    values['parent_node_id'] = parent[0]
+                    # Raw inserts bypass save(), so fill the ancestor index here
+                    values['path'], values['depth'] = Node.child_path(*parent)
+                self.pending_paths.append((values.get('path', ''), values.get('depth', 0)))
+        elif kind in ('connection_type', 'graph'):
+            values['project_id'] = self.project.pk
+        elif kind == 'graph_node':
+            values['graph_id'] = self._ref('graph', row, 'graph', line_number)
+            values['node_id'] = self._ref('node', row, 'node', line_number)[0]
+        else:
+            values['graph_id'] = self._ref('graph', row, 'graph', line_number)
+            values['source_node_id'] = self._ref('node', row, 'source_node', line_number)[0]
+            values['target_node_id'] = self._ref('node', row, 'target_node', line_number)[0]
+            values['connection_type_id'] = self._ref('connection_type', row, 'connection_type', line_number)
+
+        if kind in REFERENCED_KINDS:
+            if 'id' not in row:
+                raise _line_error(line_number, '"id" is required.')
+            if isinstance(row['id'], bool) or not isinstance(row['id'], (int, float, str)):
+                raise _line_error(line_number, '"id" must be a number or a string.')
+            self.pending_ids[kind][row['id']] = len(writer.rows)
+        writer.add(values)
+        if len(writer.rows) >= BATCH_SIZE:
+            self.flush(kind)
+
+    def flush(self, kind):
+        result = self.writers[kind].flush()
+        if kind not in REFERENCED_KINDS:
+            self.counts[kind] += result
+            return
+        file_ids, self.pending_ids[kind] = self.pending_ids[kind], {}
+        if kind == 'node':
+            result = self._link_parents(result)
+        self.ids[kind].update((file_id, result[index]) for file_id, index in file_ids.items())
+        self.counts[kind] += len(result)
+
+    def _link_parents(self, new_ids):
+        """
+        Sets parent, path and depth of the node rows just inserted without them,
+        with one batched UPDATE. Returns (new id, path, depth) per inserted row.
+        """
+        paths, self.pending_paths = self.pending_paths, []
+        parents, self.pending_parents = self.pending_parents, {}
+        nodes = []
+        links = []
+        # A parent is queued before its children, so it is resolved first
+        for index, (new_id, path_depth) in enumerate(zip(new_ids, paths)):
+            if path_depth is None:
+                parent = nodes[parents[index]]
+                path_depth = Node.child_path(*parent)
+                links.append((parent[0], *path_depth, new_id))
+            nodes.append((new_id, *path_depth))
+        if links:
+            quote = self.connection.ops.quote_name
+            column = {name: quote(Node._meta.get_field(name).column) for name in ('parent_node', 'path', 'depth', 'id')}
+            with self.connection.cursor() as cursor:
+                cursor.executemany(
+                    f"UPDATE {quote(Node._meta.db_table)} SET {column['parent_node']} = %s, {column['path']} = %s, "
+                    f"{column['depth']} = %s WHERE {column['id']} = %s",
+                    links,
+                )
+        return nodes
+
+    def finish(self):
+        if self.project is None:
+            raise ValidationError({'detail': 'The import is empty.'})
+        # References point backwards, so flushing in dependency order satisfies them
+        for kind in ('connection_type', 'node', 'graph', 'graph_node', 'connection'):
+            self.flush(kind)
+        self.counts['project'] = 1
+        self.validate()
+        # Raw inserts send no signals
+        rebuild_counters(project_ids=[self.project.pk])
+        self.project.refresh_from_db()
+
+    def validate(self):
+        """The invariants of GraphNode.clean() and NodeConnection.clean(), checked for all rows at once."""
+        graph_nodes = GraphNode.objects.filter(graph__project=self.project)
+        connections = NodeConnection.objects.filter(graph__project=self.project)
+        in_graph = GraphNode.objects.filter(graph=OuterRef('graph'))
+
+        checks = [
+            (graph_nodes.exclude(node__project=F('graph__project')),
+             'graph nodes reference a node from another project'),
+            (connections.filter(source_node=F('target_node')),
+             'connections connect a node to itself'),
+            (connections.exclude(source_node__project=F('graph__project'), target_node__project=F('graph__project')),
+             'connections reference a node from another project'),
+            (connections.exclude(connection_type__project=F('graph__project')),
+             'connections use a connection type from another project'),
+            (connections.filter(~Exists(in_graph.filter(node=OuterRef('source_node')))
+                                | ~Exists(in_graph.filter(node=OuterRef('target_node')))),
+             'connections reference a node that is not in their graph'),
+        ]
+        errors = []
+        for queryset, message in checks:
+            count = queryset.count()
+            if count:
+                errors.append(f'{count} {message}.')
+        if errors:
+            raise ValidationError({'detail': errors})
+
+
+def iter_lines(lines):
+    """Yields (line number, parsed object) for every non-blank line of a bytes/str line iterable."""
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            raise _line_error(line_number, f'Invalid JSON ({e}).')
+
+
+def import_project(owner, lines, name=None):
+    """
+    Imports a JSON Lines project dump as a new project of ``owner``.
+
+    ``lines`` is any iterable of lines (an open file, an upload, a request
+    stream). Returns ``(project, counts)``; raises ValidationError (and
+    writes nothing) if the dump is invalid.
+    """
+    importer = ProjectImporter(owner, name=name)
+    try:
+        with transaction.atomic():
+            for line_number, row in iter_lines(lines):
+                importer.add(row, line_number)
+            importer.finish()
+    except IntegrityError as e:
+        raise ValidationError({'detail': [f'Duplicate or inconsistent rows: {e}']})
+    return importer.project, importer.counts
@@ -0,0 +1,35 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from apps.projects.importer import import_project
+
+
+class Command(BaseCommand):
+    help = 'Imports a JSON Lines project dump (as written by the export endpoints) as a new project.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to the .jsonl file')
+        parser.add_argument('--owner', required=True, help='Username of the new project owner')
+        parser.add_argument('--name', help='Name for the new project (defaults to the one in the dump)')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            owner = User.objects.get(username=options['owner'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['owner']!r} does not exist.")
+
+        start = time.perf_counter()
+        try:
+            with open(options['path'], 'rb') as lines:
+                project, counts = import_project(owner, lines, name=options['name'])
+        except ValidationError as e:
+            raise CommandError(e.detail)
+
+        summary = ', '.join(f'{count} {kind}' for kind, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported project {project.pk} ({summary}) in {time.perf_counter() - start:.1f}s.'
+        ))
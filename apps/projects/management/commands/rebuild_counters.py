@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from apps.projects.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the denormalized node/graph/connection counters of projects and their graphs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', type=int, nargs='+', help='Only these project ids')
+
+    def handle(self, *args, **options):
+        updated = rebuild_counters(project_ids=options['project'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt counters of {updated} project(s).'))
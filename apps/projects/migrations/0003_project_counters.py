@@ -0,0 +1,44 @@
+# Generated by Django 4.2.30 on 2026-10-17 17:39
+
+from django.db import migrations, models
+
+
+def populate_counters(apps, schema_editor):
+    from apps.projects.counters import rebuild_counters
+
+    rebuild_counters(models={
+        name: apps.get_model(app_label, name)
+        for app_label, name in [
+            ('projects', 'Project'), ('nodes', 'Node'), ('graphs', 'Graph'),
+            ('graphs', 'GraphNode'), ('connections', 'NodeConnection'),
+        ]
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0002_initial'),
+        ('nodes', '0004_node_search_index'),
+        ('graphs', '0008_graph_counters'),
+        ('connections', '0004_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='connection_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='graph_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='node_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -1,18 +1,54 @@
 from django.db import models
+from django.db.models.functions import Greatest
 from django.conf import settings
 
+
+def counter_update(field, delta):
+    """The expression adding ``delta`` to a counter column; decrements stop at 0."""
+    if delta < 0:
+        return Greatest(models.F(field) + delta, 0)
+    return models.F(field) + delta
+
+
+class ProjectQuerySet(models.QuerySet):
+    """QuerySet helpers for Project."""
+
+    def adjust_counters(self, **deltas):
+        """Adds deltas to counter columns in one UPDATE, e.g. adjust_counters(node_count=-1)."""
+        return self.update(**{field: counter_update(field, delta) for field, delta in deltas.items()})
+
+
 class Project(models.Model):
     """
     Represents a project/worldbuilding workspace that contains nodes
+
+    The ``*_count`` columns are denormalized counters, only ever written with
+    ``ProjectQuerySet.adjust_counters()`` or rebuilt by ``counters.rebuild_counters()``.
     """
+    COUNTER_FIELDS = ('node_count', 'graph_count', 'connection_count')
+
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True)
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='projects')
+    node_count = models.PositiveIntegerField(default=0, editable=False)
+    graph_count = models.PositiveIntegerField(default=0, editable=False)
+    connection_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProjectQuerySet.as_manager()
+
     class Meta:
         ordering = ['-updated_at']
 
     def __str__(self):
         return self.name
+
+    def save(self, *args, **kwargs):
+        # Never write back possibly stale in-memory counters over concurrent updates
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
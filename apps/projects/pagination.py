@@ -0,0 +1,16 @@
+from rest_framework.pagination import CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    Cursor pagination in id order, for lists that can be very long: each page
+    is an indexed range read (no OFFSET, no COUNT), and rows inserted or
+    deleted meanwhile do not shift the following pages.
+    """
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def get_ordering(self, request, queryset, view):
+        # Used by actions of views whose OrderingFilter orders something else
+        return (self.ordering,)
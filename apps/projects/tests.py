@@ -1,3 +1,6 @@
+import json
+import os
+
 from django.test import TestCase
 from django.urls import reverse
 from rest_framework.test import APITestCase, APIClient
@@ -174,3 +177,314 @@ class ProjectAPITest(APITestCase):
         data = get_response_data(response)
         self.assertEqual(len(data), 1)
         self.assertEqual(data[0]['name'], 'Django Project')
+
+    def test_counters_follow_creates_and_deletes(self):
+        """Test that project and graph counters track nodes, graphs and connections"""
+        from apps.connections.models import ConnectionType, NodeConnection
+        from apps.graphs.models import Graph, GraphNode
+        from apps.nodes.models import Node
+
+        graph = Graph.objects.create(project=self.project, name='Graph')
+        first = Node.objects.create(project=self.project, title='First')
+        second = Node.objects.create(project=self.project, title='Second')
+        for node in (first, second):
+            GraphNode.objects.create(graph=graph, node=node)
+        connection_type = ConnectionType.objects.create(project=self.project, name='Link')
+        NodeConnection.objects.create(
+            graph=graph, source_node=first, target_node=second, connection_type=connection_type
+        )
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(
+            reverse('node-bulk'), {'create': [{'project': self.project.id, 'title': 'Bulk'}]}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.project.refresh_from_db()
+        graph.refresh_from_db()
+        self.assertEqual(
+            (self.project.node_count, self.project.graph_count, self.project.connection_count), (3, 1, 1)
+        )
+        self.assertEqual((graph.node_count, graph.connection_count), (2, 1))
+
+        # Deleting a node cascades to its graph membership and connection
+        first.delete()
+        self.project.refresh_from_db()
+        graph.refresh_from_db()
+        self.assertEqual(
+            (self.project.node_count, self.project.graph_count, self.project.connection_count), (2, 1, 0)
+        )
+        self.assertEqual((graph.node_count, graph.connection_count), (1, 0))
+
+        # Saving a stale instance does not write its counters back
+        stale = Project.objects.get(pk=self.project.pk)
+        Node.objects.create(project=self.project, title='Third')
+        stale.name = 'Renamed'
+        stale.save()
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.node_count, 3)
+
+    def test_counters_follow_moves_and_cascades(self):
+        """Test that counters follow rows moved to another parent, and cascades settle them in bulk"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from apps.connections.models import ConnectionType, NodeConnection
+        from apps.graphs.models import Graph, GraphNode
+        from apps.nodes.models import Node
+
+        other = Project.objects.create(name='Other', owner=self.user)
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(reverse('node-list'), {'project': self.project.id, 'title': 'Mover'}, format='json')
+        response = self.client.patch(
+            reverse('node-detail', kwargs={'pk': response.data['id']}), {'project': other.id}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.project.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.project.node_count, other.node_count), (0, 1))
+
+        response = self.client.delete(reverse('project-detail', kwargs={'pk': other.pk}))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        first, second = (Graph.objects.create(project=self.project, name=name) for name in ('First', 'Second'))
+        nodes = [Node.objects.create(project=self.project, title=f'Node {i}') for i in range(50)]
+        graph_nodes = [GraphNode.objects.create(graph=first, node=node) for node in nodes]
+        connection_type = ConnectionType.objects.create(project=self.project, name='Link')
+        connections = [
+            NodeConnection.objects.create(
+                graph=first, source_node=source, target_node=target, connection_type=connection_type
+            )
+            for source, target in zip(nodes, nodes[1:])
+        ]
+        moved = GraphNode.objects.get(pk=graph_nodes[0].pk)
+        moved.graph = second
+        moved.save()
+        moved = NodeConnection.objects.get(pk=connections[0].pk)
+        moved.graph = second
+        moved.save()
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.node_count, first.connection_count), (49, 48))
+        self.assertEqual((second.node_count, second.connection_count), (1, 1))
+
+        # Deleting a graph does not count its rows down one by one
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(reverse('graph-detail', kwargs={'pk': first.pk}))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertLess(len(queries), 20)
+        self.project.refresh_from_db()
+        self.assertEqual(
+            (self.project.node_count, self.project.graph_count, self.project.connection_count), (50, 1, 1)
+        )
+        self.assertFalse(first.canvas_changes.exists())
+
+        # Connection types are protected: their connections go first
+        moved.delete()
+        response = self.client.delete(reverse('project-detail', kwargs={'pk': self.project.pk}))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(second.canvas_changes.exists())
+
+    def test_rebuild_counters_command(self):
+        """Test that rebuild_counters repairs drifted counters"""
+        from django.core.management import call_command
+        from apps.nodes.models import Node
+
+        Node.objects.create(project=self.project, title='Node')
+        Project.objects.filter(pk=self.project.pk).update(node_count=42, graph_count=7)
+        call_command('rebuild_counters', stdout=open(os.devnull, 'w'))
+        self.project.refresh_from_db()
+        self.assertEqual((self.project.node_count, self.project.graph_count), (1, 0))
+
+    def test_list_projects_constant_queries(self):
+        """Test that listing projects does not run a query per project"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from apps.nodes.models import Node
+
+        Node.objects.create(project=self.project, title='Node')
+        self.client.force_authenticate(user=self.user)
+        url = reverse('project-list')
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+
+        for i in range(10):
+            project = Project.objects.create(name=f'Project {i}', owner=self.user)
+            Node.objects.create(project=project, title='Node')
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url)
+        self.assertEqual(len(many), len(few))
+        self.assertTrue(all(item['node_count'] == 1 for item in get_response_data(response)))
+
+    def test_project_nodes_and_connections_paginated_and_streamed(self):
+        """Test for the cursor-paginated and streamed project nodes and connections"""
+        from apps.connections.models import ConnectionType, NodeConnection
+        from apps.connections.serializers import NodeConnectionSerializer
+        from apps.graphs.models import Graph, GraphNode
+        from apps.nodes.models import Node
+        from apps.nodes.serializers import NodeSerializer
+
+        nodes = [Node.objects.create(project=self.project, title=f'Node {i}') for i in range(5)]
+        Node.objects.create(project=self.project, title='Child', parent_node=nodes[0])
+        graph = Graph.objects.create(project=self.project, name='Graph')
+        for node in nodes:
+            GraphNode.objects.create(graph=graph, node=node)
+        connection_type = ConnectionType.objects.create(project=self.project, name='Link')
+        for source, target in zip(nodes, nodes[1:]):
+            NodeConnection.objects.create(
+                graph=graph, source_node=source, target_node=target, connection_type=connection_type
+            )
+
+        self.client.force_authenticate(user=self.user)
+        for action, model, serializer_class in [
+            ('nodes', Node.objects.with_list_stats(), NodeSerializer),
+            ('connections', NodeConnection.objects.all(), NodeConnectionSerializer),
+        ]:
+            expected = json.loads(json.dumps(serializer_class(model.order_by('id'), many=True).data))
+            url = reverse(f'project-{action}', kwargs={'pk': self.project.pk})
+
+            pages, params = [], {'page_size': 2}
+            while True:
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                pages.extend(json.loads(json.dumps(response.data['results'])))
+                if not response.data['next']:
+                    break
+                params = {'page_size': 2, 'cursor': response.data['next'].split('cursor=')[1].split('&')[0]}
+            self.assertEqual(pages, expected)
+
+            response = self.client.get(url, {'stream': 'true'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(response.streaming)
+            self.assertEqual(json.loads(b''.join(response.streaming_content)), expected)
+
+        self.assertEqual(expected[0]['source_node_title'], 'Node 0')
+        other = Project.objects.create(name='Empty', owner=self.user)
+        response = self.client.get(reverse('project-connections', kwargs={'pk': other.pk}), {'stream': '1'})
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), [])
+
+    def test_export_project(self):
+        """Test for streaming a project export as JSON Lines, GraphML and GEXF"""
+        import json
+        from xml.etree import ElementTree
+        from apps.connections.models import ConnectionType, NodeConnection
+        from apps.graphs.models import Graph, GraphNode
+        from apps.nodes.models import Node
+
+        parent = Node.objects.create(project=self.project, title='Parent & <child>')
+        child = Node.objects.create(project=self.project, title='Child', parent_node=parent)
+        graph = Graph.objects.create(project=self.project, name='Graph')
+        for node in (parent, child):
+            GraphNode.objects.create(graph=graph, node=node, position_x=1.5, position_y=-2)
+        connection_type = ConnectionType.objects.create(project=self.project, name='Link')
+        NodeConnection.objects.create(
+            graph=graph, source_node=parent, target_node=child, connection_type=connection_type
+        )
+
+        self.client.force_authenticate(user=self.user)
+        url = reverse('project-export', kwargs={'pk': self.project.pk})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment', response['Content-Disposition'])
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(
+            [line['type'] for line in lines],
+            ['project', 'connection_type', 'node', 'node', 'graph', 'graph_node', 'graph_node', 'connection'],
+        )
+        self.assertEqual(lines[2]['id'], parent.id)
+        self.assertEqual(lines[3]['parent_node'], parent.id)
+
+        for export_format, tag in [('graphml', 'node'), ('gexf', 'node')]:
+            response = self.client.get(url, {'format': export_format})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            root = ElementTree.fromstring(b''.join(response.streaming_content))
+            self.assertEqual(len([el for el in root.iter() if el.tag.endswith('}' + tag)]), 2)
+            self.assertEqual(len([el for el in root.iter() if el.tag.endswith('}edge')]), 1)
+
+        # Graph export: only its canvas, with layout
+        url = reverse('graph-export', kwargs={'pk': graph.pk})
+        response = self.client.get(url, HTTP_ACCEPT='application/gexf+xml')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(b'viz:position x="1.5"', b''.join(response.streaming_content))
+
+        self.client.force_authenticate(user=self.other_user)
+        response = self.client.get(reverse('project-export', kwargs={'pk': self.project.pk}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_import_project_round_trip(self):
+        """Test that an exported project imports back as a new project"""
+        from apps.connections.models import ConnectionType, NodeConnection
+        from apps.graphs.models import Graph, GraphNode
+        from apps.nodes.models import Node
+
+        parent = Node.objects.create(project=self.project, title='Parent')
+        child = Node.objects.create(project=self.project, title='Child', parent_node=parent, node_type='event')
+        Node.objects.create(project=self.project, title='Grandchild', parent_node=child)
+        graph = Graph.objects.create(project=self.project, name='Graph')
+        for node in (parent, child):
+            GraphNode.objects.create(graph=graph, node=node, position_x=5)
+        connection_type = ConnectionType.objects.create(project=self.project, name='Link')
+        NodeConnection.objects.create(
+            graph=graph, source_node=parent, target_node=child, connection_type=connection_type
+        )
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('project-export', kwargs={'pk': self.project.pk}))
+        dump = b''.join(response.streaming_content)
+
+        url = reverse('project-import')
+        response = self.client.post(
+            f'{url}?name=Imported', data=dump, content_type='application/x-ndjson'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['imported']['node'], 3)
+        self.assertEqual(response.data['imported']['connection'], 1)
+
+        imported = Project.objects.get(pk=response.data['project']['id'])
+        self.assertEqual((imported.name, imported.owner), ('Imported', self.user))
+        self.assertEqual((imported.node_count, imported.graph_count, imported.connection_count), (3, 1, 1))
+        new_child = imported.nodes.get(title='Child')
+        self.assertEqual(new_child.node_type, 'event')
+        self.assertEqual(new_child.get_ancestors()[0].title, 'Parent')
+        # Parents queued in the same batch as their children are linked after it
+        new_grandchild = imported.nodes.get(title='Grandchild')
+        self.assertEqual(new_grandchild.parent_node, new_child)
+        self.assertEqual(new_grandchild.depth, 2)
+        self.assertEqual([node.title for node in new_grandchild.get_ancestors()], ['Parent', 'Child'])
+        new_graph = imported.graphs.get()
+        self.assertEqual(new_graph.graph_nodes.filter(position_x=5).count(), 2)
+        connection = new_graph.connections.get()
+        self.assertEqual(connection.connection_type.project, imported)
+        self.assertEqual((connection.source_node.title, connection.target_node.title), ('Parent', 'Child'))
+
+    def test_import_project_rejects_invalid_dump(self):
+        """Test that an invalid dump is rejected as a whole"""
+        lines = [
+            {'type': 'project', 'name': 'Broken'},
+            {'type': 'connection_type', 'id': 1, 'name': 'Link'},
+            {'type': 'node', 'id': 1, 'title': 'A'},
+            {'type': 'node', 'id': 2, 'title': 'B'},
+            {'type': 'graph', 'id': 1, 'name': 'Graph'},
+            {'type': 'graph_node', 'graph': 1, 'node': 1},
+            # Node 2 is not on the graph
+            {'type': 'connection', 'graph': 1, 'source_node': 1, 'target_node': 2, 'connection_type': 1},
+        ]
+        body = '\n'.join(json.dumps(line) for line in lines)
+        self.client.force_authenticate(user=self.user)
+        url = reverse('project-import')
+        response = self.client.post(url, data=body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('not in their graph', str(response.data))
+        self.assertFalse(Project.objects.filter(name='Broken').exists())
+
+        lines[-1] = {'type': 'connection', 'graph': 1, 'source_node': 1, 'target_node': 9, 'connection_type': 1}
+        body = '\n'.join(json.dumps(line) for line in lines)
+        response = self.client.post(url, data=body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Line 7', str(response.data))
+
+        lines[3] = {'type': 'node', 'id': [2], 'title': 'B'}
+        body = '\n'.join(json.dumps(line) for line in lines)
+        response = self.client.post(url, data=body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Line 4', str(response.data))
@@ -1,9 +1,12 @@
-from rest_framework import viewsets, filters
+from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.exceptions import NotAuthenticated
+from rest_framework.exceptions import NotAuthenticated, ValidationError
 
+from .export import EXPORT_RENDERERS, ProjectExport, export_response, stream_serialized
+from .importer import import_project
 from .models import Project
+from .pagination import IdCursorPagination
 from .serializers import ProjectSerializer, ProjectListSerializer
 
 
@@ -16,7 +19,7 @@ class ProjectViewSet(viewsets.ModelViewSet):
     serializer_class = ProjectSerializer
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['name', 'description']
-    ordering_fields = ['created_at', 'updated_at', 'name']
+    ordering_fields = ['created_at', 'updated_at', 'name', 'node_count', 'graph_count', 'connection_count']
     ordering = ['-updated_at']
 
     def get_queryset(self):
@@ -37,35 +40,78 @@ class ProjectViewSet(viewsets.ModelViewSet):
             raise NotAuthenticated('You must be logged in to create a project.')
         serializer.save(owner=self.request.user)
 
+    @action(detail=False, methods=['post'], url_path='import', url_name='import')
+    def import_project(self, request):
+        """
+        Imports a JSON Lines project dump (as written by the export action) as a new project.
+
+        Send the dump as the request body (Content-Type: application/x-ndjson) or as
+        a multipart upload in the "file" field. ?name= overrides the project name.
+        The body is read line by line and inserted in batches; see importer.py.
+        """
+        if request.content_type.startswith('multipart/form-data'):
+            upload = request.FILES.get('file')
+            if upload is None:
+                raise ValidationError({'file': ['No file was submitted.']})
+            lines = upload
+        else:
+            lines = request.stream or []
+
+        project, counts = import_project(request.user, lines, name=request.query_params.get('name'))
+        return Response(
+            {'project': ProjectSerializer(project).data, 'imported': counts},
+            status=status.HTTP_201_CREATED,
+        )
+
+    @action(detail=True, methods=['get'], renderer_classes=EXPORT_RENDERERS)
+    def export(self, request, pk=None):
+        """
+        Streams the whole project: nodes, connection types, graphs, layouts and connections.
+
+        Format via ?format= or Accept: jsonl (default), graphml or gexf. See export.py.
+        """
+        project = self.get_object()
+        return export_response(ProjectExport(project), request.accepted_renderer)
+
+    def _item_list_response(self, request, queryset, serializer_class):
+        """
+        Cursor-paginated in id order (``?cursor=``, ``?page_size=``), or with
+        ``?stream=true`` the whole list as one JSON array, streamed in constant memory.
+        """
+        if request.query_params.get('stream', '').lower() in ('1', 'true'):
+            return stream_serialized(queryset.order_by('id'), serializer_class)
+        paginator = IdCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        return paginator.get_paginated_response(serializer_class(page, many=True).data)
+
     @action(detail=True, methods=['get'])
     def nodes(self, request, pk=None):
         """
-        Get all nodes for a specific project
+        Get all nodes for a specific project (paginated or streamed, see _item_list_response)
         """
-        from nodes.serializers import NodeSerializer
+        from apps.nodes.serializers import NodeSerializer
 
         project = self.get_object()
-        nodes = project.nodes.all()
-        serializer = NodeSerializer(nodes, many=True)
-        return Response(serializer.data)
+        return self._item_list_response(request, project.nodes.with_list_stats(), NodeSerializer)
 
     @action(detail=True, methods=['get'])
     def connections(self, request, pk=None):
         """
-        Get all connections for a specific project
+        Get all connections for a specific project (paginated or streamed, see _item_list_response)
         """
-        from connections.serializers import NodeConnectionSerializer
         from apps.connections.models import NodeConnection
+        from apps.connections.serializers import READ_FIELDS, NodeConnectionSerializer
 
         project = self.get_object()
 
-        # Legacy endpoint: returns connections from all project graphs
-        # Avoid N+1: single query filtering by project via graph.
+        # Connections from all project graphs, with only the columns the serializer renders.
+        # The graph ids are passed as a list: joined to graphs_graph, SQLite sorts every
+        # connection of the project for each page instead of walking them in id order.
+        graph_ids = list(project.graphs.values_list('id', flat=True))
         connections_qs = (
             NodeConnection.objects
-            .filter(graph__project=project)
-            .select_related('graph', 'source_node', 'target_node', 'connection_type')
+            .filter(graph_id__in=graph_ids)
+            .select_related('source_node', 'target_node')
+            .only(*READ_FIELDS)
         )
-
-        serializer = NodeConnectionSerializer(connections_qs, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+        return self._item_list_response(request, connections_qs, NodeConnectionSerializer)
@@ -185,6 +185,16 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+# Real-time canvas (apps/graphs/realtime.py). The in-memory channel layer only
+# reaches clients of the same process; use a shared layer with several workers.
+CANVAS_CHANNEL_LAYER = config('CANVAS_CHANNEL_LAYER', default='apps.graphs.realtime.InMemoryChannelLayer')
+CANVAS_TICK_SECONDS = config('CANVAS_TICK_SECONDS', default=0.05, cast=float)
+
+# Write-behind buffer for deferred position updates (apps/graphs/write_behind.py):
+# flush delay and the number of pending graph nodes that forces an early flush
+LAYOUT_WRITE_BEHIND_MS = config('LAYOUT_WRITE_BEHIND_MS', default=200, cast=int)
+LAYOUT_WRITE_BEHIND_MAX = config('LAYOUT_WRITE_BEHIND_MAX', default=10000, cast=int)
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = config('CORS_ALLOW_ALL_ORIGINS', default=True, cast=bool)
 CORS_ALLOWED_ORIGINS = config(